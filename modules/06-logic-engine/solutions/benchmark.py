@@ -0,0 +1,1026 @@
+"""
+Module 06 - Logic Engine Benchmarks
+===================================
+
+Measures LogicEngine performance on synthetic rule sets that look like
+the ones generate_rule_from_description produces (ctx.get('field') conditions
+over the fields listed in its prompt).
+
+Usage:
+    python benchmark.py                       # all benchmarks, printed
+
+    # Regression suite: latency percentiles, throughput per context
+    # distribution, scaling and memory per rule, as JSON
+    python benchmark.py --suite --output baseline.json
+    python benchmark.py --suite --compare baseline.json   # exit 1 on regressions
+
+Requirements:
+    pip install requests
+"""
+
+import gc
+import os
+import sys
+import json
+import argparse
+import platform
+import tempfile
+import random
+import threading
+import time
+import tracemalloc
+from typing import List, Dict, Any, Optional, Tuple
+
+from logic_engine_ai import (
+    FIRE_ALL, FIRE_FIRST, FIRE_BEST_PER_GROUP, LogicEngine, Rule, RuleMetrics, KeyScheduler, QuotaAwareGemini,
+    MIN_LATENCY_SAMPLES, RULES_SCHEMA, build_rules_prompt, compile_condition, compile_template,
+    generate_rules_batched, generate_rules_from_descriptions, make_action, rule_from_definition, stream_rules
+)
+from gemini_stub_server import start_stub_server
+from rete_matcher import ReteLogicEngine
+from compact_rules import CompactLogicEngine
+from engine_snapshot import save_snapshot, load_snapshot
+from rule_analysis import prune_definitions
+from codegen_engine import GeneratedLogicEngine
+from typed_facts import RULE_CONTEXT_SCHEMA, TypedLogicEngine
+
+MONTHS = [
+    "January", "February", "March", "April", "May", "June", "July",
+    "August", "September", "October", "November", "December"
+]
+TIERS = ["basic", "premium", "vip"]
+CATEGORIES = ["electronics", "books", "clothing", "grocery", "toys"]
+
+
+# ============================================
+# SYNTHETIC WORKLOADS
+# ============================================
+
+def generate_rule_definitions(count: int, seed: int = 42) -> List[Dict[str, str]]:
+    """Generate RULE_SCHEMA-shaped rule definitions."""
+    rng = random.Random(seed)
+    templates = [
+        lambda: f"ctx.get('quantity', 0) >= {rng.randint(2, 50)}",
+        lambda: f"ctx.get('order_total', 0) > {rng.choice([50, 100, 250, 500, 1000])}",
+        lambda: f"ctx.get('membership_tier') == '{rng.choice(TIERS)}'",
+        lambda: f"ctx.get('month') in {rng.sample(MONTHS, 3)}",
+        lambda: f"ctx.get('is_new_customer', False)",
+        lambda: (
+            f"ctx.get('loyalty_points', 0) > {rng.randint(1, 20) * 100} and "
+            f"ctx.get('membership_tier') in ['premium', 'vip']"
+        ),
+        lambda: f"ctx.get('category') == '{rng.choice(CATEGORIES)}'",
+    ]
+
+    return [
+        {
+            "name": f"Rule {i}",
+            "condition_code": rng.choice(templates)(),
+            "action_message": "Applied discount (order total: {order_total})",
+        }
+        for i in range(count)
+    ]
+
+
+def generate_selective_rule_definitions(count: int, categories: int = 500, seed: int = 42) -> List[Dict[str, str]]:
+    """Generate per-category rules where only a few rules apply to any order."""
+    rng = random.Random(seed)
+    return [
+        {
+            "name": f"Rule {i}",
+            "condition_code": (
+                f"ctx.get('category') == 'category-{rng.randrange(categories)}' and "
+                f"ctx.get('quantity', 0) >= {rng.randint(2, 20)}"
+            ),
+            "action_message": "Applied category discount",
+        }
+        for i in range(count)
+    ]
+
+
+def generate_merchant_rule_definitions(merchants: int, rules_per_merchant: int = 20, seed: int = 42) -> List[Dict[str, str]]:
+    """Generate per-merchant rule sets drawn from a shared catalog of rule names and conditions."""
+    rng = random.Random(seed)
+    catalog = generate_rule_definitions(rules_per_merchant * 10, seed)
+    definitions = []
+    for _ in range(merchants):
+        for i, definition in enumerate(rng.sample(catalog, rules_per_merchant)):
+            definitions.append(dict(definition, name=f"Discount {i}"))
+    return definitions
+
+
+# Context distributions for generate_contexts
+UNIFORM, SKEWED, SPARSE = "uniform", "skewed", "sparse"
+DISTRIBUTIONS = (UNIFORM, SKEWED, SPARSE)
+
+
+def generate_contexts(
+    count: int,
+    seed: int = 7,
+    categories: Optional[int] = None,
+    distribution: str = UNIFORM
+) -> List[Dict[str, Any]]:
+    """
+    Generate order contexts with the fields used by the rule generator.
+
+    Args:
+        count: Number of contexts
+        seed: Random seed
+        categories: Use "category-N" values out of this many instead of CATEGORIES
+        distribution: UNIFORM values; SKEWED (a few popular tiers, categories
+            and months, mostly small orders with a long tail); or SPARSE
+            (uniform, but each field is missing with probability 0.3)
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution '{distribution}', expected one of {DISTRIBUTIONS}")
+    rng = random.Random(seed)
+    category_values = CATEGORIES if categories is None else [f"category-{i}" for i in range(categories)]
+
+    def pick(values: List[Any]) -> Any:
+        if distribution != SKEWED:
+            return rng.choice(values)
+        # Zipf-like: the i-th value is 1/(i+1) as likely as the first
+        return rng.choices(values, weights=[1 / (i + 1) for i in range(len(values))])[0]
+
+    contexts = []
+    for _ in range(count):
+        if distribution == SKEWED:
+            quantity = min(40, 1 + int(rng.paretovariate(1.5)))
+            order_total = round(min(1500.0, 5 + rng.paretovariate(1.2) * 20), 2)
+            loyalty_points = min(2500, int(rng.expovariate(1 / 300)))
+        else:
+            quantity = rng.randint(1, 40)
+            order_total = round(rng.uniform(5, 1500), 2)
+            loyalty_points = rng.randint(0, 2500)
+        ctx = {
+            "quantity": quantity,
+            "order_total": order_total,
+            "is_new_customer": rng.random() < 0.2,
+            "membership_tier": pick(TIERS),
+            "month": pick(MONTHS),
+            "loyalty_points": loyalty_points,
+            "category": pick(category_values),
+        }
+        if distribution == SPARSE:
+            ctx = {field: value for field, value in ctx.items() if rng.random() >= 0.3}
+        contexts.append(ctx)
+    return contexts
+
+
+def legacy_condition(code: str):
+    """The original per-call eval() closure, kept as a baseline."""
+    def condition(ctx: Dict[str, Any]) -> bool:
+        return eval(code, {"__builtins__": {}}, {"ctx": ctx})
+    return condition
+
+
+def linear_evaluate(engine: LogicEngine, context: Dict[str, Any]) -> List[str]:
+    """The original loop over every rule, kept as a baseline."""
+    actions_taken = []
+    for rule in engine.rules:
+        try:
+            if rule.condition(context):
+                actions_taken.append(f"{rule.name}: {rule.action(context)}")
+        except Exception as e:
+            actions_taken.append(f"{rule.name}: ERROR - {str(e)}")
+    return actions_taken
+
+
+def build_engine(
+    definitions: List[Dict[str, str]],
+    compiled: bool = True,
+    engine_class: type = LogicEngine
+) -> LogicEngine:
+    """Build an engine from rule definitions."""
+    engine = engine_class()
+    # One snapshot publish for the whole rule set
+    with engine.update():
+        for d in definitions:
+            if compiled:
+                engine.add_rule(rule_from_definition(d))
+            else:
+                engine.add_rule(Rule(
+                    name=d["name"],
+                    condition=legacy_condition(d["condition_code"]),
+                    action=make_action(d["action_message"])
+                ))
+    return engine
+
+
+def rule_evaluations_per_second(engine: LogicEngine, contexts: List[Dict[str, Any]]) -> float:
+    """Run every context through every rule, return rule evaluations/sec."""
+    start = time.perf_counter()
+    for ctx in contexts:
+        linear_evaluate(engine, ctx)
+    elapsed = time.perf_counter() - start
+    return len(engine.rules) * len(contexts) / elapsed
+
+
+# ============================================
+# BENCHMARKS
+# ============================================
+
+def bench_compiled_conditions(rule_count: int = 1000, context_count: int = 200):
+    """Compare eval()-per-call conditions with compiled conditions."""
+    definitions = generate_rule_definitions(rule_count)
+    contexts = generate_contexts(context_count)
+
+    legacy = build_engine(definitions, compiled=False)
+    compiled = build_engine(definitions, compiled=True)
+
+    assert [linear_evaluate(legacy, c) for c in contexts] == [linear_evaluate(compiled, c) for c in contexts]
+
+    before = rule_evaluations_per_second(legacy, contexts)
+    after = rule_evaluations_per_second(compiled, contexts)
+
+    print(f"Compiled conditions ({rule_count} rules x {context_count} contexts)")
+    print(f"   eval() per call: {before:>12,.0f} evals/sec")
+    print(f"   compiled:        {after:>12,.0f} evals/sec ({after / before:.1f}x)")
+
+
+def bench_scaling(sizes: List[int] = (10, 100, 1_000, 10_000, 100_000)):
+    """Compare the linear loop, the field index and the discrimination network as rule count grows."""
+    print("Contexts/sec by rule count")
+    print(f"   {'rules':>8} {'linear':>10} {'indexed':>10} {'rete':>10}")
+
+    for size in sizes:
+        definitions = generate_rule_definitions(size)
+        # Keep total work roughly constant across sizes
+        contexts = generate_contexts(max(20, min(2_000, 2_000_000 // size)))
+
+        indexed = build_engine(definitions)
+        rete = build_engine(definitions, engine_class=ReteLogicEngine)
+        expected = [linear_evaluate(indexed, c) for c in contexts[:20]]
+        assert expected == [indexed.evaluate(c) for c in contexts[:20]]
+        assert expected == [rete.evaluate(c) for c in contexts[:20]]
+
+        timings = []
+        for evaluate in (lambda c: linear_evaluate(indexed, c), indexed.evaluate, rete.evaluate):
+            start = time.perf_counter()
+            for ctx in contexts:
+                evaluate(ctx)
+            timings.append(len(contexts) / (time.perf_counter() - start))
+
+        print(f"   {size:>8,} {timings[0]:>10,.0f} {timings[1]:>10,.0f} {timings[2]:>10,.0f}")
+
+
+def bench_rule_index(sizes: List[int] = (100, 1_000, 10_000, 100_000)):
+    """Field index on selective per-category rules, where few rules apply to each order."""
+    print("Field index on selective rules (contexts/sec)")
+    print(f"   {'rules':>8} {'linear':>10} {'indexed':>10} {'speedup':>8}")
+
+    for size in sizes:
+        engine = build_engine(generate_selective_rule_definitions(size))
+        contexts = generate_contexts(max(20, min(2_000, 2_000_000 // size)), categories=500)
+        assert [linear_evaluate(engine, c) for c in contexts[:20]] == [engine.evaluate(c) for c in contexts[:20]]
+
+        timings = []
+        for evaluate in (lambda c: linear_evaluate(engine, c), engine.evaluate):
+            start = time.perf_counter()
+            for ctx in contexts:
+                evaluate(ctx)
+            timings.append(len(contexts) / (time.perf_counter() - start))
+
+        print(f"   {size:>8,} {timings[0]:>10,.0f} {timings[1]:>10,.0f} {timings[1] / timings[0]:>7.1f}x")
+
+
+def bench_batch(rule_count: int = 1_000, row_count: int = 20_000):
+    """Per-dict evaluate() loop vs vectorized evaluate_batch() over columns."""
+    import numpy as np
+
+    engine = build_engine(generate_rule_definitions(rule_count))
+    contexts = generate_contexts(row_count)
+    columns = {field: np.array([ctx[field] for ctx in contexts]) for field in contexts[0]}
+
+    start = time.perf_counter()
+    expected = [engine.evaluate(ctx) for ctx in contexts]
+    per_row = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = engine.evaluate_batch(columns)
+    batched = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matches_only = engine.evaluate_batch(columns, with_actions=False).matches
+    matrix = time.perf_counter() - start
+    assert result.actions == expected
+
+    print(f"Batch evaluation ({rule_count} rules x {row_count:,} rows)")
+    print(f"   evaluate() per row:   {row_count / per_row:>10,.0f} rows/sec")
+    print(f"   evaluate_batch():     {row_count / batched:>10,.0f} rows/sec ({per_row / batched:.1f}x)")
+    print(f"   match matrix only:    {row_count / matrix:>10,.0f} rows/sec ({per_row / matrix:.1f}x)")
+    print(f"   match matrix density: {matches_only.mean():.1%}")
+
+
+def bench_parallel(rule_count: int = 1_000, context_count: int = 20_000, chunksize: int = 256):
+    """Single process vs evaluate_many() across all cores."""
+    engine = build_engine(generate_rule_definitions(rule_count))
+    contexts = generate_contexts(context_count)
+    workers = os.cpu_count() or 1
+
+    start = time.perf_counter()
+    expected = [engine.evaluate(ctx) for ctx in contexts]
+    serial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = list(engine.evaluate_many(contexts, workers=workers, chunksize=chunksize))
+    parallel = time.perf_counter() - start
+    assert results == expected
+
+    print(f"Sharded evaluation ({rule_count} rules x {context_count:,} contexts, {workers} workers)")
+    print(f"   single process:  {context_count / serial:>10,.0f} contexts/sec")
+    print(f"   evaluate_many(): {context_count / parallel:>10,.0f} contexts/sec ({serial / parallel:.1f}x)")
+
+
+def bench_lazy_actions(rule_count: int = 1_000, context_count: int = 2_000):
+    """evaluate() action strings vs match() records that render on demand."""
+    engine = build_engine(generate_rule_definitions(rule_count))
+    contexts = generate_contexts(context_count)
+    assert [engine.match(c).actions for c in contexts[:20]] == [engine.evaluate(c) for c in contexts[:20]]
+
+    timings = []
+    for evaluate in (engine.evaluate, engine.match, lambda c: engine.match(c).actions):
+        start = time.perf_counter()
+        for ctx in contexts:
+            evaluate(ctx)
+        timings.append(context_count / (time.perf_counter() - start))
+
+    print(f"Lazy action rendering ({rule_count} rules x {context_count:,} contexts)")
+    print(f"   evaluate():          {timings[0]:>10,.0f} contexts/sec")
+    print(f"   match():             {timings[1]:>10,.0f} contexts/sec ({timings[1] / timings[0]:.1f}x)")
+    print(f"   match().actions:     {timings[2]:>10,.0f} contexts/sec ({timings[2] / timings[0]:.1f}x)")
+
+
+def bench_incremental(rule_count: int = 2_000, updates: int = 2_000, seed: int = 11):
+    """Full evaluate() after each field change vs EvaluationSession.update()."""
+    rng = random.Random(seed)
+    engine = build_engine(generate_rule_definitions(rule_count))
+    context = generate_contexts(1)[0]
+    changes = [
+        rng.choice([
+            ("quantity", rng.randint(1, 40)),
+            ("order_total", round(rng.uniform(5, 1500), 2)),
+            ("month", rng.choice(MONTHS)),
+        ])
+        for _ in range(updates)
+    ]
+
+    full_context = dict(context)
+    start = time.perf_counter()
+    for field, value in changes:
+        full_context[field] = value
+        engine.evaluate(full_context)
+    full = time.perf_counter() - start
+
+    session = engine.session(context)
+    evaluated = 0
+    start = time.perf_counter()
+    for field, value in changes:
+        evaluated += session.update({field: value}).evaluated
+    incremental = time.perf_counter() - start
+    assert session.actions == engine.evaluate(session.context)
+
+    print(f"Incremental re-evaluation ({rule_count} rules, {updates:,} single-field updates)")
+    print(f"   full evaluate():  {updates / full:>10,.0f} updates/sec")
+    print(f"   session.update(): {updates / incremental:>10,.0f} updates/sec ({full / incremental:.1f}x)")
+    print(f"   conditions re-run per update: {evaluated / updates:,.0f} of {rule_count:,}")
+
+
+def bench_strategies(rule_count: int = 1_000, context_count: int = 2_000, seed: int = 3):
+    """Condition evaluations and throughput for each firing strategy."""
+    rng = random.Random(seed)
+    definitions = generate_rule_definitions(rule_count)
+    for d in definitions:
+        d["priority"] = rng.randint(0, 10)
+        d["group"] = rng.choice(["discount", "shipping", "loyalty"])
+    contexts = generate_contexts(context_count)
+
+    # Count condition calls without changing what the index sees
+    calls = [0]
+    engine = LogicEngine()
+    with engine.update():
+        for d in definitions:
+            rule = rule_from_definition(d)
+
+            def counted(ctx, condition=rule.condition):
+                calls[0] += 1
+                return condition(ctx)
+            rule.condition = counted
+            engine.add_rule(rule)
+
+    print(f"Firing strategies ({rule_count} prioritized rules in 3 groups x {context_count:,} contexts)")
+    baseline = None
+    for strategy in (FIRE_ALL, FIRE_BEST_PER_GROUP, FIRE_FIRST):
+        calls[0] = 0
+        start = time.perf_counter()
+        for ctx in contexts:
+            engine.match(ctx, strategy)
+        rate = context_count / (time.perf_counter() - start)
+        per_context = calls[0] / context_count
+        baseline = baseline or per_context
+        print(
+            f"   {strategy:<15} {rate:>8,.0f} contexts/sec, "
+            f"{per_context:>6,.0f} conditions/context ({1 - per_context / baseline:.0%} saved)"
+        )
+
+
+def bench_instrumentation(rule_count: int = 1_000, context_count: int = 2_000):
+    """evaluate() throughput with per-rule metrics off and on."""
+    definitions = generate_rule_definitions(rule_count)
+    contexts = generate_contexts(context_count)
+    plain = build_engine(definitions)
+    instrumented = build_engine(definitions)
+    instrumented.metrics = RuleMetrics()
+
+    timings = []
+    for engine in (plain, instrumented):
+        start = time.perf_counter()
+        for ctx in contexts:
+            engine.evaluate(ctx)
+        timings.append(context_count / (time.perf_counter() - start))
+
+    print(f"Per-rule instrumentation ({rule_count} rules x {context_count:,} contexts)")
+    print(f"   metrics off: {timings[0]:>10,.0f} contexts/sec")
+    print(f"   metrics on:  {timings[1]:>10,.0f} contexts/sec ({timings[1] / timings[0]:.0%} of off)")
+    for name, seconds in instrumented.metrics.slowest(3):
+        print(f"   slowest: {name:<10} {seconds * 1000:>8.2f} ms total")
+
+
+def traced_bytes(build) -> int:
+    """Bytes still allocated after build() runs (the result is kept alive while measuring)."""
+    tracemalloc.start()
+    try:
+        result = build()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return current
+
+
+def bench_memory(merchants: int = 5_000, rules_per_merchant: int = 20):
+    """Memory per rule: List[Rule], LogicEngine and CompactLogicEngine (tracemalloc)."""
+    definitions = generate_merchant_rule_definitions(merchants, rules_per_merchant)
+    # Parse inside the traced region so each store pays for its own strings
+    payload = json.dumps(definitions)
+    count = len(definitions)
+
+    engine = CompactLogicEngine.from_definitions(definitions[:1_000])
+    reference = build_engine(definitions[:1_000])
+    for ctx in generate_contexts(20):
+        assert engine.evaluate(ctx) == reference.evaluate(ctx)
+
+    results = [
+        ("List[Rule]", traced_bytes(lambda: [rule_from_definition(d) for d in json.loads(payload)])),
+        ("LogicEngine", traced_bytes(lambda: LogicEngine.from_definitions(json.loads(payload)))),
+        ("CompactLogicEngine", traced_bytes(lambda: CompactLogicEngine.from_definitions(json.loads(payload)))),
+    ]
+
+    print(f"Memory per rule ({count:,} rules: {merchants:,} merchants x {rules_per_merchant})")
+    baseline = results[0][1]
+    for label, size in results:
+        print(f"   {label:<20} {size / count:>8,.0f} bytes/rule ({size / baseline:.0%} of List[Rule])")
+
+
+def bench_codegen(rule_count: int = 1_000, context_count: int = 500):
+    """LogicEngine vs GeneratedLogicEngine (one generated function per rule set)."""
+    definitions = generate_rule_definitions(rule_count)
+    contexts = generate_contexts(context_count)
+    print(f"Whole-ruleset code generation ({rule_count:,} rules, {context_count} contexts)")
+
+    engines = []
+    for engine_class in (LogicEngine, GeneratedLogicEngine):
+        # The generated engine builds its function on the first evaluate()
+        start = time.perf_counter()
+        engine = engine_class.from_definitions(definitions)
+        engine.evaluate(contexts[0])
+        build = time.perf_counter() - start
+        engines.append(engine)
+
+        start = time.perf_counter()
+        for ctx in contexts:
+            engine.evaluate(ctx)
+        rate = len(contexts) / (time.perf_counter() - start)
+        print(f"   {engine_class.__name__:<22} {rate:>8,.0f} evals/sec (built in {build * 1000:.0f}ms)")
+
+    for ctx in contexts[:50]:
+        assert engines[0].evaluate(ctx) == engines[1].evaluate(ctx)
+
+    start = time.perf_counter()
+    engines[1].add_rule(rule_from_definition(definitions[0]))
+    engines[1].evaluate(contexts[0])
+    print(f"   regenerating after one add_rule: {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    start = time.perf_counter()
+    for definition in definitions[:100]:
+        engines[1].add_rule(rule_from_definition(definition))
+    engines[1].evaluate(contexts[0])
+    print(f"   100 single add_rule calls, then evaluate: {(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+def bench_typed_facts(rule_count: int = 1_000, context_count: int = 500):
+    """Dict contexts vs slot-indexed fact tuples checked against a FactSchema."""
+    definitions = generate_rule_definitions(rule_count)
+    print(f"Typed fact schemas ({rule_count:,} rules, {context_count} contexts)")
+
+    for distribution in (UNIFORM, SPARSE):
+        contexts = generate_contexts(context_count, distribution=distribution)
+        start = time.perf_counter()
+        facts = [RULE_CONTEXT_SCHEMA.record(ctx) for ctx in contexts]
+        convert = time.perf_counter() - start
+
+        # CompactLogicEngine shares condition outcomes like TypedLogicEngine, but reads dicts
+        rates = []
+        for engine, inputs in (
+            (LogicEngine.from_definitions(definitions), contexts),
+            (CompactLogicEngine.from_definitions(definitions), contexts),
+            (TypedLogicEngine.from_definitions(RULE_CONTEXT_SCHEMA, definitions), facts),
+        ):
+            start = time.perf_counter()
+            results = [engine.evaluate(value) for value in inputs]
+            rates.append(len(inputs) / (time.perf_counter() - start))
+            if len(rates) == 1:
+                expected = results
+            assert results == expected
+
+        print(
+            f"   {distribution:<8} LogicEngine {rates[0]:>7,.0f}  Compact {rates[1]:>7,.0f}  "
+            f"Typed {rates[2]:>7,.0f} evals/sec  (record() {convert / context_count * 1e6:.1f}us per context)"
+        )
+
+
+def bench_analysis(rule_count: int = 2_000, context_count: int = 200):
+    """Evaluation time before and after pruning with rule_analysis."""
+    rng = random.Random(3)
+    definitions = generate_rule_definitions(rule_count)
+    # Regenerated copies of existing rules, and contradictory conditions
+    definitions += rng.sample(definitions, rule_count // 10)
+    definitions += [
+        {
+            "name": f"Contradiction {i}",
+            "condition_code": f"ctx.get('quantity', 0) > {50 + i} and ctx.get('quantity', 0) < {i}",
+            "action_message": "Never applied",
+        }
+        for i in range(rule_count // 20)
+    ]
+    contexts = generate_contexts(context_count)
+
+    start = time.perf_counter()
+    pruned, report = prune_definitions(definitions)
+    analysis = time.perf_counter() - start
+    # Also prunes conditions that only raise for unexpected value types
+    typed_pruned, typed_report = prune_definitions(definitions, assume_types=True)
+    print(f"Static analysis ({len(definitions):,} rules, analyzed in {analysis * 1000:.0f}ms)")
+    print(f"   default:      {report.summary()}")
+    print(f"   assume_types: {typed_report.summary()}")
+
+    for engine_class in (LogicEngine, CompactLogicEngine):
+        timings = []
+        for rules in (definitions, pruned, typed_pruned):
+            engine = engine_class.from_definitions(rules)
+            start = time.perf_counter()
+            for ctx in contexts:
+                engine.evaluate(ctx)
+            timings.append(len(contexts) / (time.perf_counter() - start))
+        print(
+            f"   {engine_class.__name__:<20} {timings[0]:>8,.0f} -> {timings[1]:>8,.0f} evals/sec "
+            f"({timings[1] / timings[0]:.2f}x), assume_types {timings[2]:>8,.0f} ({timings[2] / timings[0]:.2f}x)"
+        )
+
+
+def bench_snapshot(rule_count: int = 100_000, context_count: int = 100):
+    """Cold start: rebuilding from definitions vs loading a binary snapshot."""
+    definitions = generate_rule_definitions(rule_count)
+    contexts = generate_contexts(context_count)
+    engine = LogicEngine.from_definitions(definitions)
+    compile_condition.cache_clear()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "rules.lges")
+        save_snapshot(engine, path)
+        compile_condition.cache_clear()
+
+        start = time.perf_counter()
+        LogicEngine.from_definitions(definitions)
+        rebuild = time.perf_counter() - start
+
+        print(f"Engine snapshot ({rule_count:,} rules, {os.path.getsize(path) / 1e6:.1f} MB file)")
+        print(f"   rebuild from definitions: {rebuild * 1000:>10,.1f} ms")
+        for trusted in (False, True):
+            compile_condition.cache_clear()
+            start = time.perf_counter()
+            snapshot = load_snapshot(path, trusted=trusted)
+            load = time.perf_counter() - start
+            start = time.perf_counter()
+            first = snapshot.evaluate(contexts[0])
+            first_evaluate = time.perf_counter() - start
+            assert first == engine.evaluate(contexts[0])
+            assert [snapshot.evaluate(c) for c in contexts] == [engine.evaluate(c) for c in contexts]
+            snapshot.close()
+
+            label = "trusted" if trusted else "validated"
+            print(
+                f"   {label:<9} load {load * 1000:>6,.1f} ms, first evaluate() {first_evaluate * 1000:>8,.1f} ms"
+                + (" (stored code)" if trusted else " (recompiles conditions on demand)")
+            )
+
+
+def bench_single_updates(rule_counts: Tuple[int, ...] = (2_000, 8_000, 16_000), removals: int = 200):
+    """add_rule()/remove_rule() one at a time, each publishing its own snapshot (no update() block)."""
+    print("Single-rule publishes (add_rule / remove_rule outside update())")
+    for count in rule_counts:
+        rules = [rule_from_definition(d) for d in generate_rule_definitions(count)]
+        engine = LogicEngine()
+        start = time.perf_counter()
+        for rule in rules:
+            engine.add_rule(rule)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(removals):
+            engine.remove_rule(f"Rule {i}")
+        remove = (time.perf_counter() - start) / removals
+        print(f"   {count:>6,} rules: built in {build:>6.3f}s ({build / count * 1e6:.1f}us per add_rule), "
+              f"remove_rule {remove * 1e6:.1f}us")
+
+
+def bench_hot_updates(rule_count: int = 2_000, seconds: float = 2.0):
+    """Reader throughput with and without a writer publishing rule updates."""
+    engine = build_engine(generate_rule_definitions(rule_count))
+    contexts = generate_contexts(50)
+    counts = {"evaluations": 0, "torn": 0, "updates": 0}
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            for ctx in contexts:
+                actions = engine.evaluate(ctx)
+                # Each update adds a Pair A / Pair B rule together: both or neither must fire
+                if sum(a.startswith("Pair A") for a in actions) != sum(a.startswith("Pair B") for a in actions):
+                    counts["torn"] += 1
+            counts["evaluations"] += len(contexts)
+
+    def writer():
+        while not stop.is_set():
+            i = counts["updates"]
+            with engine.update():
+                if i >= 10:
+                    engine.remove_rule(f"Pair A {i - 10}")
+                    engine.remove_rule(f"Pair B {i - 10}")
+                for half in "AB":
+                    engine.add_rule(rule_from_definition({
+                        "name": f"Pair {half} {i}",
+                        "condition_code": "ctx.get('quantity', 0) >= 1",
+                        "action_message": "Hot-added rule",
+                    }))
+            counts["updates"] += 1
+            time.sleep(0.005)
+
+    def measure(with_writer: bool) -> float:
+        stop.clear()
+        counts["evaluations"] = 0
+        threads = [threading.Thread(target=reader)]
+        if with_writer:
+            threads.append(threading.Thread(target=writer))
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return counts["evaluations"] / seconds
+
+    idle = measure(False)
+    busy = measure(True)
+    print(f"Hot rule updates ({rule_count} rules)")
+    print(f"   no writer:   {idle:>10,.0f} contexts/sec")
+    print(f"   with writer: {busy:>10,.0f} contexts/sec ({counts['updates']} updates published, {counts['torn']} torn reads)")
+
+
+def bench_key_scheduler(key_count: int = 3, requests: int = 60, quota: int = 5, window: float = 2.0):
+    """Reactive round-robin vs KeyScheduler against the local stub's per-key quotas."""
+    keys = [f"stub-key-{i}" for i in range(key_count)]
+    print(f"Key scheduling ({requests} calls, {key_count} keys, stub quota {quota}/{window:g}s per key)")
+
+    for label in ("round-robin", "scheduler"):
+        server = start_stub_server(quota=quota, window=window)
+        scheduler = None
+        if label == "scheduler":
+            scheduler = KeyScheduler(key_count, requests_per_minute=quota * 60 / window, burst=quota)
+        api = QuotaAwareGemini(keys, base_url=server.base_url, scheduler=scheduler)
+
+        failed = 0
+        start = time.perf_counter()
+        for i in range(requests):
+            try:
+                api.call(f"Request {i}")
+            except Exception:
+                failed += 1
+        elapsed = time.perf_counter() - start
+        api.close()
+        server.shutdown()
+
+        print(
+            f"   {label:<12} {(requests - failed) / elapsed:>6.1f} calls/sec, "
+            f"{server.stats['throttled']:>3} 429s, {failed} failed calls"
+        )
+
+
+
+def bench_hedging(
+    key_count: int = 3,
+    requests: int = 200,
+    latency: float = 0.01,
+    slow_fraction: float = 0.02,
+    slow_latency: float = 0.5
+):
+    """Tail latency with and without hedged requests against a stub with occasional slow responses."""
+    keys = [f"stub-key-{i}" for i in range(key_count)]
+    print(
+        f"Hedged requests ({requests} calls, {latency * 1000:g}ms typical, "
+        f"{slow_fraction:.0%} at {slow_latency * 1000:g}ms)"
+    )
+
+    for label in ("plain", "hedged"):
+        server = start_stub_server(latency=latency, slow_fraction=slow_fraction, slow_latency=slow_latency, seed=0)
+        api = QuotaAwareGemini(keys, base_url=server.base_url, hedge=label == "hedged")
+        # Hedge delays come from observed latencies, so collect some first
+        for i in range(MIN_LATENCY_SAMPLES):
+            api.call(f"Warm-up {i}")
+
+        latencies = []
+        for i in range(requests):
+            start = time.perf_counter()
+            api.call(f"Request {i}")
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        api.close()
+        server.shutdown()
+
+        p50, p95, p99 = (latencies[min(len(latencies) - 1, len(latencies) * p // 100)] * 1000 for p in (50, 95, 99))
+        print(
+            f"   {label:<7} p50 {p50:>6.1f}ms  p95 {p95:>6.1f}ms  p99 {p99:>6.1f}ms  "
+            f"max {latencies[-1] * 1000:>6.1f}ms  "
+            f"({api.hedged_requests} hedged, {server.stats['requests']} server requests)"
+        )
+
+
+
+def bench_streaming(chunk_delay: float = 0.02):
+    """Time to the first usable rule: buffered call_structured vs stream_rules."""
+    server = start_stub_server(chunk_delay=chunk_delay)
+    api = QuotaAwareGemini(["stub-key"], base_url=server.base_url)
+    print(f"Streamed rule generation (stub sends a chunk every {chunk_delay * 1000:g}ms)")
+
+    start = time.perf_counter()
+    definitions = api.call_structured(build_rules_prompt("policy"), RULES_SCHEMA)
+    buffered = time.perf_counter() - start
+    print(f"   buffered   {len(definitions)} rules, first usable after {buffered * 1000:>6.1f}ms")
+
+    engine = LogicEngine()
+    start = time.perf_counter()
+    first = None
+    for _ in stream_rules(api, "policy", engine):
+        if first is None:
+            first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    print(f"   streamed   {len(engine.rules)} rules, first usable after {first * 1000:>6.1f}ms "
+          f"(all after {total * 1000:.1f}ms)")
+
+    api.close()
+    server.shutdown()
+
+
+def bench_batching(descriptions: int = 100, key_count: int = 3, latency: float = 0.05):
+    """Requests, prompt tokens and time: one call per description vs batched calls."""
+    texts = [f"Give a {i % 30}% discount for order {i}" for i in range(descriptions)]
+    keys = [f"stub-key-{i}" for i in range(key_count)]
+    print(f"Batched rule generation ({descriptions} descriptions, {key_count} keys, {latency * 1000:g}ms latency)")
+
+    for label, generate in (("per rule", generate_rules_from_descriptions), ("batched", generate_rules_batched)):
+        server = start_stub_server(latency=latency)
+        api = QuotaAwareGemini(keys, base_url=server.base_url, pool_size=4 * key_count, max_concurrency_per_key=4)
+        start = time.perf_counter()
+        results = generate(api, texts)
+        elapsed = time.perf_counter() - start
+        api.close()
+        server.shutdown()
+
+        print(
+            f"   {label:<9} {server.stats['requests']:>4} requests  ~{server.stats['prompt_tokens']:>6} prompt tokens  "
+            f"{elapsed * 1000:>7.1f}ms  ({sum(r.rule is not None for r in results)} rules)"
+        )
+
+
+# ============================================
+# REGRESSION SUITE
+# Machine-readable results for comparing versions
+# ============================================
+
+def latency_profile(evaluate, contexts: List[Dict[str, Any]], repeat: int = 3) -> Dict[str, float]:
+    """
+    Per-context evaluate() latency percentiles (microseconds) and throughput.
+
+    The contexts are run repeat times with the garbage collector paused and
+    the fastest run is reported, which keeps noise out of regression
+    comparisons.
+    """
+    clock = time.perf_counter_ns
+    best = None
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            samples = []
+            start = clock()
+            for ctx in contexts:
+                started = clock()
+                evaluate(ctx)
+                samples.append(clock() - started)
+            elapsed = clock() - start
+            if best is None or elapsed < best[0]:
+                best = (elapsed, samples)
+    finally:
+        gc.enable()
+
+    elapsed, samples = best
+    samples.sort()
+
+    def percentile(p: int) -> float:
+        return samples[min(len(samples) - 1, len(samples) * p // 100)] / 1000
+
+    return {
+        "p50_us": percentile(50),
+        "p95_us": percentile(95),
+        "p99_us": percentile(99),
+        "contexts_per_sec": len(contexts) / (elapsed / 1e9),
+    }
+
+
+def run_suite(quick: bool = False) -> Dict[str, Any]:
+    """
+    Run the regression suite.
+
+    Returns:
+        {"meta": {...}, "metrics": {name: {"value", "unit", "better"}}} where
+        better is "higher" or "lower"; see compare_results()
+    """
+    metrics: Dict[str, Dict[str, Any]] = {}
+
+    def record(name: str, value: float, unit: str, better: str):
+        metrics[name] = {"value": round(value, 3), "unit": unit, "better": better}
+
+    rule_count = 300 if quick else 1_000
+    context_count = 300 if quick else 2_000
+    definitions = generate_rule_definitions(rule_count)
+    engine_classes = (LogicEngine, ReteLogicEngine, GeneratedLogicEngine, CompactLogicEngine)
+
+    # Latency and throughput per engine and context distribution
+    for engine_class in engine_classes:
+        # Every engine pays for compiling its own conditions and templates
+        compile_condition.cache_clear()
+        compile_template.cache_clear()
+        # The build includes one evaluate(), which builds lazily built state
+        start = time.perf_counter()
+        engine = engine_class.from_definitions(definitions)
+        engine.evaluate({})
+        record(f"build.{engine_class.__name__}.us_per_rule",
+               (time.perf_counter() - start) / rule_count * 1e6, "us", "lower")
+        for distribution in DISTRIBUTIONS:
+            contexts = generate_contexts(context_count, distribution=distribution)
+            engine.evaluate(contexts[0])  # warm up caches for this distribution
+            profile = latency_profile(engine.evaluate, contexts)
+            prefix = f"evaluate.{engine_class.__name__}.{distribution}"
+            record(f"{prefix}.contexts_per_sec", profile["contexts_per_sec"], "1/s", "higher")
+            for key in ("p50_us", "p95_us", "p99_us"):
+                record(f"{prefix}.{key}", profile[key], "us", "lower")
+
+    # Scaling curve: throughput as the rule count grows
+    for size in ((100, 1_000) if quick else (100, 1_000, 10_000)):
+        engine = LogicEngine.from_definitions(generate_rule_definitions(size))
+        contexts = generate_contexts(max(20, min(1_000, 200_000 // size)))
+        record(f"scaling.LogicEngine.{size}.contexts_per_sec",
+               latency_profile(engine.evaluate, contexts)["contexts_per_sec"], "1/s", "higher")
+
+    # Memory per rule
+    payload = json.dumps(generate_merchant_rule_definitions(100 if quick else 1_000))
+    count = len(json.loads(payload))
+    for engine_class in (LogicEngine, CompactLogicEngine):
+        size = traced_bytes(lambda: engine_class.from_definitions(json.loads(payload)))
+        record(f"memory.{engine_class.__name__}.bytes_per_rule", size / count, "bytes", "lower")
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "quick": quick,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "metrics": metrics,
+    }
+
+
+def compare_results(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    tolerance: float = 0.15
+) -> List[str]:
+    """
+    Metrics that got worse than baseline by more than tolerance (a fraction).
+
+    Metrics present in only one of the two runs are ignored.
+    """
+    regressions = []
+    for name, metric in current["metrics"].items():
+        before = baseline["metrics"].get(name)
+        if before is None or not before["value"]:
+            continue
+        change = metric["value"] / before["value"] - 1
+        worse = -change if metric["better"] == "higher" else change
+        if worse > tolerance:
+            regressions.append(
+                f"{name}: {before['value']:,} -> {metric['value']:,} {metric['unit']} ({worse:.0%} worse)"
+            )
+    return regressions
+
+
+def main_suite(args: argparse.Namespace) -> int:
+    """Run the suite, write/compare JSON results; return the exit status."""
+    results = run_suite(quick=args.quick)
+    for name, metric in results["metrics"].items():
+        print(f"   {name:<55} {metric['value']:>14,.3f} {metric['unit']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions against {args.compare}:")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+def main_benchmarks():
+    """Run every human-readable benchmark."""
+    bench_compiled_conditions()
+    print()
+    bench_scaling()
+    print()
+    bench_rule_index()
+    print()
+    bench_batch()
+    print()
+    bench_parallel()
+    print()
+    bench_lazy_actions()
+    print()
+    bench_incremental()
+    print()
+    bench_strategies()
+    print()
+    bench_instrumentation()
+    print()
+    bench_hot_updates()
+    print()
+    bench_single_updates()
+    print()
+    bench_memory()
+    print()
+    bench_codegen()
+    print()
+    bench_typed_facts()
+    print()
+    bench_analysis()
+    print()
+    bench_snapshot()
+    print()
+    bench_key_scheduler()
+    print()
+    bench_hedging()
+    print()
+    bench_streaming()
+    print()
+    bench_batching()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Logic engine benchmarks")
+    parser.add_argument("--suite", action="store_true", help="Run the regression suite instead")
+    parser.add_argument("--quick", action="store_true", help="Smaller suite workloads")
+    parser.add_argument("--output", help="Write suite results to this JSON file")
+    parser.add_argument("--compare", help="Baseline suite JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown fraction")
+    args = parser.parse_args()
+
+    if args.suite:
+        sys.exit(main_suite(args))
+    main_benchmarks()
@@ -0,0 +1,197 @@
+"""
+Module 06 - Whole-Ruleset Code Generation
+=========================================
+
+LogicEngine.evaluate() pays, for every rule, a Python call into the
+compiled condition, a try/except frame, and its own ctx.get() lookups -
+even when a hundred rules read the same three fields.
+
+GeneratedLogicEngine compiles the whole rule set into one function:
+
+- Every distinct ctx.get('field', default) is loaded once, at the top
+  (common-subexpression elimination across rules)
+- Conditions are inlined as straight-line code over those locals
+- A condition shared by several rules is evaluated once; its outcome
+  (True, False or the exception) is reused by the others
+- An action_message template shared by several rules is rendered once
+- Results are appended directly to the output list
+
+The function is generated lazily: adding or removing rules only publishes
+the new snapshot, and the first evaluate() after a change regenerates for
+the rule set it reads. Adding n rules one at a time and then evaluating
+therefore generates once, not n times. The output is identical to
+LogicEngine.evaluate(), including each rule's "ERROR - ..." entry.
+Contexts that are not plain dicts, salience strategies and instrumented
+runs use the regular LogicEngine path.
+
+A rule's condition is inlined when its function is the one compiled from
+its condition_code, judged by comparing code objects rather than by
+identity with compile_condition's cache, so inlining keeps working after
+that cache evicts a source. Generating is linear in the number of rules,
+and unlike LogicEngine every rule is evaluated on every context (no field
+index). The generated code is available as engine.generated_source.
+
+Usage:
+    from codegen_engine import GeneratedLogicEngine
+    engine = GeneratedLogicEngine.from_definitions(definitions)
+    engine.evaluate({"quantity": 12})
+"""
+
+import ast
+import copy
+import threading
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+from logic_engine_ai import FIRE_ALL, LogicEngine, Rule, RuleSet, compile_condition, context_lookup, template_source
+
+
+class _LookupHoister(ast.NodeTransformer):
+    """Replace ctx.get(<constants>) calls with shared local variables."""
+
+    def __init__(self):
+        self.names: Dict[str, str] = {}     # ast.dump(call) -> local name
+        self.sources: Dict[str, str] = {}   # local name -> call source
+
+    def visit_Call(self, node: ast.Call) -> ast.expr:
+        self.generic_visit(node)
+        lookup = context_lookup(node)
+        if lookup is not None and lookup.constant_default:
+            key = ast.dump(node)
+            name = self.names.get(key)
+            if name is None:
+                name = self.names[key] = f"_v{len(self.names)}"
+                self.sources[name] = ast.unparse(node)
+            return ast.copy_location(ast.Name(id=name, ctx=ast.Load()), node)
+        return node
+
+
+def _inlinable(rule: Rule) -> bool:
+    """Whether the rule's condition runs exactly the code compiled from its condition_code."""
+    if rule.condition_code is None:
+        return False
+    code = getattr(rule.condition, "__code__", None)
+    # Equal code objects have the same bytecode, constants, names and free variables
+    return code is not None and code == compile_condition(rule.condition_code).func.__code__
+
+
+def _pure_template(rule: Rule) -> bool:
+    """Whether the rule's action is a compiled render of its action_message template."""
+    return rule.action_message is not None and template_source(rule.action) == rule.action_message
+
+
+def generate_evaluator(rules: Tuple[Rule, ...]) -> Tuple[Callable[[Dict[str, Any]], List[str]], str]:
+    """
+    Generate one evaluate function for rules.
+
+    Returns:
+        (function taking a dict context and returning the actions, its source)
+    """
+    # Conditions may only name ctx, so these cannot clash with condition code
+    namespace: Dict[str, Any] = {"__builtins__": {}, "Exception": Exception, "str": str}
+    hoister = _LookupHoister()
+
+    # Inlined source per distinct condition, and how many rules use it
+    expressions: Dict[str, str] = {}
+    uses: Dict[str, int] = {}
+    template_uses: Dict[str, int] = {}
+    for rule in rules:
+        if _inlinable(rule):
+            code = rule.condition_code
+            if code not in expressions:
+                tree = hoister.visit(copy.deepcopy(compile_condition(code).tree))
+                expressions[code] = ast.unparse(tree.body)
+            uses[code] = uses.get(code, 0) + 1
+        if _pure_template(rule):
+            template_uses[rule.action_message] = template_uses.get(rule.action_message, 0) + 1
+
+    shared: Dict[str, str] = {}      # condition_code -> local holding its outcome
+    rendered: Dict[str, str] = {}    # action_message -> local holding its rendering
+    body: List[str] = []
+    for i, rule in enumerate(rules):
+        namespace[f"_n{i}"] = f"{rule.name}: "
+        namespace[f"_e{i}"] = f"{rule.name}: ERROR - "
+        namespace[f"_a{i}"] = rule.action
+        if _pure_template(rule) and template_uses[rule.action_message] > 1:
+            # Templates are pure: render once per context, on first use
+            text = rendered.get(rule.action_message)
+            if text is None:
+                text = rendered[rule.action_message] = f"_t{len(rendered)}"
+            fire = f"append(_n{i} + ({text} if {text} is not None else ({text} := _a{i}(ctx))))"
+        else:
+            fire = f"append(f'{{_n{i}}}{{_a{i}(ctx)}}')"
+
+        if not _inlinable(rule):
+            namespace[f"_c{i}"] = rule.condition
+            test = f"_c{i}(ctx)"
+        elif uses[rule.condition_code] == 1:
+            test = expressions[rule.condition_code]
+        else:
+            outcome = shared.get(rule.condition_code)
+            if outcome is None:
+                # First rule with this condition computes it for the others
+                outcome = shared[rule.condition_code] = f"_k{len(shared)}"
+                body += [
+                    "    try:",
+                    f"        {outcome} = True if ({expressions[rule.condition_code]}) else False",
+                    "    except Exception as e:",
+                    f"        {outcome} = e",
+                ]
+            body += [
+                f"    if {outcome} is True:",
+                "        try:",
+                f"            {fire}",
+                "        except Exception as e:",
+                f"            append(_e{i} + str(e))",
+                f"    elif {outcome} is not False:",
+                f"        append(_e{i} + str({outcome}))",
+            ]
+            continue
+
+        body += [
+            "    try:",
+            f"        if {test}:",
+            f"            {fire}",
+            "    except Exception as e:",
+            f"        append(_e{i} + str(e))",
+        ]
+
+    header = ["def evaluate(ctx):", "    actions = []", "    append = actions.append"]
+    header += [f"    {name} = {source}" for name, source in hoister.sources.items()]
+    header += [f"    {text} = None" for text in rendered.values()]
+    source = "\n".join(header + body + ["    return actions", ""])
+
+    exec(compile(source, "<generated rules>", "exec"), namespace)
+    return namespace["evaluate"], source
+
+
+class GeneratedLogicEngine(LogicEngine):
+    """LogicEngine that evaluates through one generated function per rule set"""
+
+    def __init__(self, instrument: bool = False):
+        super().__init__(instrument)
+        # (snapshot, evaluator, source), replaced as one reference
+        self._generated: Optional[Tuple[RuleSet, Callable[[Dict[str, Any]], List[str]], str]] = None
+        self._generate_lock = threading.Lock()
+
+    @property
+    def generated_source(self) -> str:
+        """Source of the evaluator for the current rules (generated if needed)."""
+        return self._generated_for(self._snapshot)[2]
+
+    def _generated_for(self, snapshot: RuleSet) -> Tuple[RuleSet, Callable[[Dict[str, Any]], List[str]], str]:
+        """The evaluator for snapshot, generating it on first use."""
+        generated = self._generated
+        if generated is None or generated[0] is not snapshot:
+            # One thread generates; the others wait for its result
+            with self._generate_lock:
+                generated = self._generated
+                if generated is None or generated[0] is not snapshot:
+                    evaluator, source = generate_evaluator(snapshot.rules)
+                    generated = self._generated = (snapshot, evaluator, source)
+        return generated
+
+    def evaluate(self, context: Dict[str, Any], strategy: str = FIRE_ALL) -> List[str]:
+        """Evaluate all rules against the context, return actions taken"""
+        if strategy != FIRE_ALL or self.metrics is not None or context.__class__ is not dict:
+            return super().evaluate(context, strategy)
+        return self._generated_for(self._snapshot)[1](context)
@@ -0,0 +1,330 @@
+"""
+Module 06 - Compact Rule Store
+==============================
+
+Memory-lean storage for engines holding hundreds of thousands of generated
+rules (e.g. one rule set per merchant).
+
+A LogicEngine keeps one Rule dataclass per rule, each with its own
+__dict__, name and source strings. CompactRuleStore keeps rule data in
+parallel arrays instead:
+
+- names: one list entry per rule, deduplicated through a per-store table
+- conditions / templates: array("I") ids into shared tables, so identical
+  condition_code and action_message strings (and their compiled functions)
+  are stored once
+- priorities / groups / fields: array("i") columns; groups and declared
+  field sets are ids into per-store tables
+
+CompactLogicEngine walks those arrays. Each distinct condition is evaluated
+at most once per context, and each distinct template is rendered at most
+once, so duplicated rules are cheap to evaluate as well as to store.
+evaluate() returns exactly what LogicEngine.evaluate() returns under every
+firing strategy, including "ERROR - ..." entries. FIRE_FIRST and
+FIRE_BEST_PER_GROUP walk the rules in salience order (priority, then
+insertion order), which is sorted once after each change.
+
+Only rules with source form (condition_code/action_message) can be stored.
+The store is not thread-safe: build it, then evaluate.
+
+Usage:
+    from compact_rules import CompactLogicEngine
+    engine = CompactLogicEngine.from_definitions(definitions)
+    engine.evaluate({"quantity": 12})
+"""
+
+from array import array
+from typing import List, Dict, Any, Callable, Optional, Iterable, Iterator, FrozenSet, Set
+
+from logic_engine_ai import (
+    FIRE_ALL, FIRE_FIRST, PENDING, STRATEGIES, MemoizedFailure, Rule,
+    compile_condition, compile_template, evaluate_memoized
+)
+
+
+def _condition_func(code: str) -> Callable[[Dict[str, Any]], Any]:
+    return compile_condition(code).func
+
+
+class _SharedTable:
+    """Distinct source strings with their compiled functions, addressed by id"""
+    __slots__ = ("ids", "sources", "funcs")
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.sources: List[str] = []
+        self.funcs: List[Callable[[Dict[str, Any]], Any]] = []
+
+    def add(self, source: str, compile: Callable[[str], Callable[[Dict[str, Any]], Any]]) -> int:
+        """Return the id for source, compiling it the first time it is seen."""
+        table_id = self.ids.get(source)
+        if table_id is None:
+            func = compile(source)
+            table_id = self.ids[source] = len(self.sources)
+            self.sources.append(source)
+            self.funcs.append(func)
+        return table_id
+
+
+class CompactRuleStore:
+    """Rules as parallel arrays over shared condition and template tables"""
+    __slots__ = (
+        "names", "conditions", "templates", "priorities", "groups", "fields", "alive",
+        "condition_table", "template_table", "group_names", "field_sets", "removed",
+        "_name_table", "_group_ids", "_field_set_ids", "_by_name"
+    )
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.conditions = array("I")
+        self.templates = array("I")
+        self.priorities = array("i")
+        self.groups = array("i")      # index into group_names, -1 for no group
+        self.fields = array("i")      # index into field_sets, -1 when derived from the condition
+        self.alive = bytearray()      # 0 = removed, kept until compact()
+        self.condition_table = _SharedTable()
+        self.template_table = _SharedTable()
+        self.group_names: List[str] = []
+        self.field_sets: List[FrozenSet[str]] = []
+        self.removed = 0
+        self._name_table: Dict[str, str] = {}
+        self._group_ids: Dict[str, int] = {}
+        self._field_set_ids: Dict[FrozenSet[str], int] = {}
+        # name -> positions, built on the first removal
+        self._by_name: Optional[Dict[str, List[int]]] = None
+
+    def __len__(self) -> int:
+        return len(self.names) - self.removed
+
+    def add(
+        self,
+        name: str,
+        condition_code: str,
+        action_message: str,
+        priority: int = 0,
+        group: Optional[str] = None,
+        fields: Optional[Iterable[str]] = None
+    ):
+        """
+        Append a rule.
+
+        Raises:
+            RuleCompileError: If condition_code is not an allowed expression
+        """
+        condition_id = self.condition_table.add(condition_code, _condition_func)
+        template_id = self.template_table.add(action_message, compile_template)
+        name = self._name_table.setdefault(name, name)
+
+        if group is None:
+            group_id = -1
+        else:
+            group_id = self._group_ids.get(group)
+            if group_id is None:
+                group_id = self._group_ids[group] = len(self.group_names)
+                self.group_names.append(group)
+
+        if fields is None:
+            fields_id = -1
+        else:
+            fields = frozenset(fields)
+            fields_id = self._field_set_ids.get(fields)
+            if fields_id is None:
+                fields_id = self._field_set_ids[fields] = len(self.field_sets)
+                self.field_sets.append(fields)
+
+        position = len(self.names)
+        self.names.append(name)
+        self.conditions.append(condition_id)
+        self.templates.append(template_id)
+        self.priorities.append(priority)
+        self.groups.append(group_id)
+        self.fields.append(fields_id)
+        self.alive.append(1)
+        if self._by_name is not None:
+            self._by_name.setdefault(name, []).append(position)
+
+    def remove(self, name: str):
+        """Mark every rule with this name as removed."""
+        if self._by_name is None:
+            self._by_name = {}
+            for position, rule_name in enumerate(self.names):
+                if self.alive[position]:
+                    self._by_name.setdefault(rule_name, []).append(position)
+
+        for position in self._by_name.pop(name, ()):
+            self.alive[position] = 0
+            self.removed += 1
+
+        # Reclaim space once most of the arrays are tombstones
+        if self.removed > len(self.names) // 2:
+            self.compact()
+
+    def compact(self):
+        """Drop removed rules from the arrays (shared tables are kept)."""
+        keep = [position for position in range(len(self.names)) if self.alive[position]]
+        self.names = [self.names[p] for p in keep]
+        self.conditions = array("I", (self.conditions[p] for p in keep))
+        self.templates = array("I", (self.templates[p] for p in keep))
+        self.priorities = array("i", (self.priorities[p] for p in keep))
+        self.groups = array("i", (self.groups[p] for p in keep))
+        self.fields = array("i", (self.fields[p] for p in keep))
+        self.alive = bytearray(b"\x01" * len(keep))
+        self.removed = 0
+        self._by_name = None
+
+    def positions(self) -> Iterator[int]:
+        """Positions of live rules, in insertion order."""
+        alive = self.alive
+        return (position for position in range(len(alive)) if alive[position])
+
+    def definition(self, position: int) -> Dict[str, Any]:
+        """RULE_SCHEMA form of the rule at position."""
+        definition = {
+            "name": self.names[position],
+            "condition_code": self.condition_table.sources[self.conditions[position]],
+            "action_message": self.template_table.sources[self.templates[position]],
+        }
+        if self.priorities[position]:
+            definition["priority"] = self.priorities[position]
+        if self.groups[position] >= 0:
+            definition["group"] = self.group_names[self.groups[position]]
+        if self.fields[position] >= 0:
+            definition["fields"] = sorted(self.field_sets[self.fields[position]])
+        return definition
+
+    def rule(self, position: int) -> Rule:
+        """Materialize the rule at position as a Rule (sharing the compiled functions)."""
+        condition_id = self.conditions[position]
+        template_id = self.templates[position]
+        group_id = self.groups[position]
+        fields_id = self.fields[position]
+        return Rule(
+            name=self.names[position],
+            condition=self.condition_table.funcs[condition_id],
+            action=self.template_table.funcs[template_id],
+            condition_code=self.condition_table.sources[condition_id],
+            action_message=self.template_table.sources[template_id],
+            fields=self.field_sets[fields_id] if fields_id >= 0 else None,
+            priority=self.priorities[position],
+            group=self.group_names[group_id] if group_id >= 0 else None
+        )
+
+
+class CompactLogicEngine:
+    """LogicEngine-compatible evaluation over a CompactRuleStore"""
+
+    def __init__(self):
+        self.store = CompactRuleStore()
+        # Live positions by priority, then insertion order; None = stale
+        self._salience: Optional[List[int]] = None
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    @property
+    def rules(self) -> List[Rule]:
+        """Live rules materialized as Rule objects (allocates; avoid on hot paths)."""
+        return [self.store.rule(position) for position in self.store.positions()]
+
+    def add_rule(self, rule: Rule):
+        """Add a rule; it must have condition_code and action_message."""
+        self.add_definition(rule.to_definition())
+
+    def add_definition(self, definition: Dict[str, Any]):
+        """Add a rule from its RULE_SCHEMA form without building a Rule."""
+        self.store.add(
+            definition["name"], definition["condition_code"], definition["action_message"],
+            definition.get("priority", 0), definition.get("group"), definition.get("fields")
+        )
+        self._salience = None
+
+    def remove_rule(self, name: str):
+        """Remove a rule by name"""
+        self.store.remove(name)
+        self._salience = None
+
+    def to_definitions(self) -> List[Dict[str, Any]]:
+        """Return all rules in RULE_SCHEMA form."""
+        return [self.store.definition(position) for position in self.store.positions()]
+
+    @classmethod
+    def from_definitions(cls, definitions: Iterable[Dict[str, Any]]) -> "CompactLogicEngine":
+        """Build an engine from RULE_SCHEMA rule definitions."""
+        engine = cls()
+        for definition in definitions:
+            engine.add_definition(definition)
+        return engine
+
+    def __reduce__(self):
+        return (self.__class__.from_definitions, (self.to_definitions(),))
+
+    def evaluate(self, context: Dict[str, Any], strategy: str = FIRE_ALL) -> List[str]:
+        """
+        Evaluate all rules against the context, return actions taken
+
+        Strategies are those of LogicEngine.match().
+
+        Raises:
+            ValueError: If strategy is not one of STRATEGIES
+        """
+        store = self.store
+        if strategy == FIRE_ALL:
+            return evaluate_memoized(
+                context, store.conditions, store.templates, store.names.__getitem__,
+                store.condition_table.funcs, store.template_table.funcs, alive=store.alive
+            )
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy '{strategy}', expected one of {STRATEGIES}")
+        return self._evaluate_by_salience(context, strategy == FIRE_FIRST)
+
+    def _evaluate_by_salience(self, context: Dict[str, Any], first_only: bool) -> List[str]:
+        """Try rules highest priority first, stopping once the outcome is decided."""
+        store = self.store
+        if self._salience is None:
+            priorities = store.priorities
+            self._salience = sorted(store.positions(), key=lambda position: -priorities[position])
+
+        conditions, groups, condition_funcs = store.conditions, store.groups, store.condition_table.funcs
+        outcomes = [PENDING] * len(condition_funcs)
+        fired: List[int] = []
+        decided: Set[int] = set()
+        for position in self._salience:
+            group_id = groups[position]
+            if group_id in decided:
+                continue
+            condition_id = conditions[position]
+            outcome = outcomes[condition_id]
+            if outcome is PENDING:
+                try:
+                    outcome = bool(condition_funcs[condition_id](context))
+                except Exception as e:
+                    outcome = MemoizedFailure(e)
+                outcomes[condition_id] = outcome
+            if outcome is False:
+                continue
+            fired.append(position)
+            # A raising condition is reported but never wins its group
+            if outcome is True:
+                if first_only:
+                    break
+                if group_id >= 0:
+                    decided.add(group_id)
+
+        rendered: Dict[int, Any] = {}
+        actions_taken = []
+        for position in fired:
+            outcome = outcomes[conditions[position]]
+            if outcome is True:
+                template_id = store.templates[position]
+                outcome = rendered.get(template_id, PENDING)
+                if outcome is PENDING:
+                    try:
+                        outcome = store.template_table.funcs[template_id](context)
+                    except Exception as e:
+                        outcome = MemoizedFailure(e)
+                    rendered[template_id] = outcome
+                if outcome.__class__ is not MemoizedFailure:
+                    actions_taken.append(f"{store.names[position]}: {outcome}")
+                    continue
+            actions_taken.append(f"{store.names[position]}: ERROR - {str(outcome.error)}")
+        return actions_taken
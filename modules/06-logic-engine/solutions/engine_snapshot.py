@@ -0,0 +1,398 @@
+"""
+Module 06 - Binary Engine Snapshots
+===================================
+
+Save a built rule set once, start every process from it in milliseconds.
+
+Rebuilding an engine means parsing, validating and compiling every
+condition_code again (or even regenerating the rules with Gemini). A
+snapshot file stores the finished product instead:
+
+- Rule columns (name, condition, template, priority, group and declared
+  fields ids) as raw arrays, readable in place through memoryview.cast()
+- One shared table of distinct conditions with their validated, marshalled
+  code objects, and one of distinct action templates
+- A string table holding every name and source string once
+
+load_snapshot() memory-maps the file and decodes nothing up front. Strings
+are decoded when first read, and a condition's code object is unmarshalled
+the first time it is evaluated. Processes that load the same file share its
+pages through the OS page cache.
+
+File layout (little or big endian as written, all sections 8-byte aligned):
+
+    header     "LGES", format version, flags, Python magic and version,
+               section count
+    directory  (tag, offset, length) per section
+    sections   SOFF/SBLB strings, CSRC/COFF/CBLB conditions, TSRC templates,
+               NAME/COND/TMPL/PRIO/GRUP/FLDS rule columns
+
+By default each condition is recompiled - and so re-validated against the
+AST whitelist - from its stored condition_code on first use. Running the
+stored code objects instead is opt-in: load_snapshot(path, trusted=True)
+skips validation and compilation, so only use it for files you wrote
+yourself. Marshalled code is only used when the header's Python magic
+number and version match the running interpreter; on any other version
+conditions are recompiled from source even when trusted.
+
+No field index is stored. to_engine() hands the decoded condition functions
+to the new engine, but its RuleIndex still parses every distinct
+condition_code once to find the indexable test.
+
+Usage:
+    from engine_snapshot import save_snapshot, load_snapshot
+    save_snapshot(engine, "rules.lges")
+    snapshot = load_snapshot("rules.lges")                # validates every condition
+    snapshot = load_snapshot("rules.lges", trusted=True)  # runs the stored code
+    snapshot.evaluate({"quantity": 12})
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import marshal
+import importlib.util
+from array import array
+from types import CodeType
+from typing import List, Dict, Any, Callable, Optional
+
+from logic_engine_ai import LogicEngine, Rule, compile_condition, compile_template, evaluate_memoized
+
+MAGIC = b"LGES"
+FORMAT_VERSION = 3
+FLAG_BIG_ENDIAN = 1
+
+# magic, version, flags, Python magic, Python major/minor, reserved, section count
+_HEADER = struct.Struct("<4sHH4sBBHI")
+_DIRECTORY_ENTRY = struct.Struct("<4sQQ")  # tag, offset, length
+
+_SECTIONS = (
+    b"SOFF", b"SBLB", b"CSRC", b"COFF", b"CBLB", b"TSRC",
+    b"NAME", b"COND", b"TMPL", b"PRIO", b"GRUP", b"FLDS"
+)
+
+
+class SnapshotError(ValueError):
+    """Raised when a file is not a readable engine snapshot"""
+
+
+# ============================================
+# WRITING
+# ============================================
+
+def save_snapshot(engine: Any, path: str):
+    """
+    Write an engine's rules to a snapshot file.
+
+    Args:
+        engine: LogicEngine (or any engine with to_definitions()); every rule
+            needs condition_code and action_message
+        path: Destination file (written to a temp file, then renamed)
+
+    Raises:
+        RuleCompileError: If a condition_code is not an allowed expression
+    """
+    strings: Dict[str, int] = {}
+    conditions: Dict[str, int] = {}
+    templates: Dict[str, int] = {}
+    condition_sources, condition_code = array("I"), []
+    template_sources = array("I")
+    names, rule_conditions, rule_templates = array("I"), array("I"), array("I")
+    priorities, groups, fields = array("i"), array("i"), array("i")
+
+    def string_id(text: str) -> int:
+        return strings.setdefault(text, len(strings))
+
+    for definition in engine.to_definitions():
+        source = definition["condition_code"]
+        if source not in conditions:
+            conditions[source] = len(conditions)
+            condition_sources.append(string_id(source))
+            condition_code.append(marshal.dumps(compile_condition(source).code))
+        template = definition["action_message"]
+        if template not in templates:
+            templates[template] = len(templates)
+            template_sources.append(string_id(template))
+
+        names.append(string_id(definition["name"]))
+        rule_conditions.append(conditions[source])
+        rule_templates.append(templates[template])
+        priorities.append(definition.get("priority", 0))
+        group = definition.get("group")
+        groups.append(-1 if group is None else string_id(group))
+        # Declared fields as a JSON list, so equal sets share one string
+        declared = definition.get("fields")
+        fields.append(-1 if declared is None else string_id(json.dumps(sorted(declared))))
+
+    encoded = [text.encode("utf-8") for text in strings]
+    sections = [
+        (b"SOFF", _offsets(encoded).tobytes()),
+        (b"SBLB", b"".join(encoded)),
+        (b"CSRC", condition_sources.tobytes()),
+        (b"COFF", _offsets(condition_code).tobytes()),
+        (b"CBLB", b"".join(condition_code)),
+        (b"TSRC", template_sources.tobytes()),
+        (b"NAME", names.tobytes()),
+        (b"COND", rule_conditions.tobytes()),
+        (b"TMPL", rule_templates.tobytes()),
+        (b"PRIO", priorities.tobytes()),
+        (b"GRUP", groups.tobytes()),
+        (b"FLDS", fields.tobytes()),
+    ]
+
+    flags = FLAG_BIG_ENDIAN if sys.byteorder == "big" else 0
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, flags, importlib.util.MAGIC_NUMBER,
+        sys.version_info.major, sys.version_info.minor, 0, len(sections)
+    )
+    offset = _align(len(header) + _DIRECTORY_ENTRY.size * len(sections))
+    directory, layout = [], []
+    for tag, data in sections:
+        directory.append(_DIRECTORY_ENTRY.pack(tag, offset, len(data)))
+        layout.append((offset, data))
+        offset = _align(offset + len(data))
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(header)
+        f.write(b"".join(directory))
+        for offset, data in layout:
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(data)
+    os.replace(temporary, path)
+
+
+def _offsets(blobs: List[bytes]) -> array:
+    """Start offset of each blob plus the total length."""
+    offsets = array("Q", [0])
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    return offsets
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+# ============================================
+# LOADING
+# ============================================
+
+def load_snapshot(path: str, trusted: bool = False) -> "SnapshotEngine":
+    """
+    Memory-map a snapshot file.
+
+    Args:
+        path: File written by save_snapshot()
+        trusted: Run the stored code objects without validating them (only
+            for files you wrote yourself); by default each condition is
+            recompiled, and so re-validated, from source on first use
+
+    Returns:
+        SnapshotEngine evaluating straight from the mapped file
+
+    Raises:
+        SnapshotError: If the file is not a snapshot this version can read
+    """
+    return SnapshotEngine(path, trusted)
+
+
+class SnapshotEngine:
+    """Read-only engine over a memory-mapped snapshot file"""
+
+    def __init__(self, path: str, trusted: bool = False):
+        self.path = path
+        self.trusted = trusted
+        with open(path, "rb") as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise SnapshotError(f"{self.path} is not an engine snapshot: {e}") from e
+        try:
+            self._open_sections()
+        except Exception:
+            self._mmap.close()
+            raise
+
+        self._strings: Dict[int, str] = {}
+        # Compiled on first use
+        self._condition_funcs: List[Optional[Callable]] = [None] * len(self._condition_sources)
+        self._template_funcs: List[Optional[Callable]] = [None] * len(self._template_sources)
+
+    def _open_sections(self):
+        data = self._mmap
+        # Header and directory are checked before any memoryview exists, so
+        # the map can still be closed on error
+        if len(data) < _HEADER.size:
+            raise SnapshotError(f"{self.path} is too short to be an engine snapshot")
+        magic, version, flags, python_magic, major, minor, _, count = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise SnapshotError(f"{self.path} is not an engine snapshot")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"{self.path} has snapshot format {version}, expected {FORMAT_VERSION}")
+        if bool(flags & FLAG_BIG_ENDIAN) != (sys.byteorder == "big"):
+            raise SnapshotError(f"{self.path} was written on a machine with a different byte order")
+        # Marshalled code is only usable by the Python version that wrote it
+        self._code_usable = (
+            python_magic == importlib.util.MAGIC_NUMBER and (major, minor) == sys.version_info[:2]
+        )
+
+        if len(data) < _HEADER.size + count * _DIRECTORY_ENTRY.size:
+            raise SnapshotError(f"{self.path} is truncated (directory)")
+        directory = {}
+        for i in range(count):
+            tag, offset, length = _DIRECTORY_ENTRY.unpack_from(data, _HEADER.size + i * _DIRECTORY_ENTRY.size)
+            if offset + length > len(data):
+                raise SnapshotError(f"{self.path} is truncated (section {tag!r})")
+            directory[tag] = (offset, length)
+        missing = [tag for tag in _SECTIONS if tag not in directory]
+        if missing:
+            raise SnapshotError(f"{self.path} is missing sections {missing}")
+
+        view = memoryview(data)
+        sections = {tag: view[offset:offset + length] for tag, (offset, length) in directory.items()}
+
+        def column(tag: bytes, typecode: str) -> memoryview:
+            return sections[tag].cast(typecode)
+
+        self._string_offsets = column(b"SOFF", "Q")
+        self._string_blob = sections[b"SBLB"]
+        self._condition_sources = column(b"CSRC", "I")
+        self._code_offsets = column(b"COFF", "Q")
+        self._code_blob = sections[b"CBLB"]
+        self._template_sources = column(b"TSRC", "I")
+        self._names = column(b"NAME", "I")
+        self._conditions = column(b"COND", "I")
+        self._templates = column(b"TMPL", "I")
+        self._priorities = column(b"PRIO", "i")
+        self._groups = column(b"GRUP", "i")
+        self._fields = column(b"FLDS", "i")
+        self._views = [view] + list(sections.values()) + [
+            self._string_offsets, self._condition_sources, self._code_offsets, self._template_sources,
+            self._names, self._conditions, self._templates, self._priorities, self._groups, self._fields
+        ]
+
+    def close(self):
+        """Unmap the file."""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def __enter__(self) -> "SnapshotEngine":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __reduce__(self):
+        # Worker processes map the same file instead of receiving the rules
+        return (load_snapshot, (self.path, self.trusted))
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    # ----------------------------------------
+    # Lazy decoding
+    # ----------------------------------------
+
+    def _string(self, string_id: int) -> str:
+        text = self._strings.get(string_id)
+        if text is None:
+            start, end = self._string_offsets[string_id], self._string_offsets[string_id + 1]
+            text = self._strings[string_id] = str(self._string_blob[start:end], "utf-8")
+        return text
+
+    def _condition(self, condition_id: int) -> Callable[[Dict[str, Any]], Any]:
+        func = self._condition_funcs[condition_id]
+        if func is None:
+            if self.trusted and self._code_usable:
+                start, end = self._code_offsets[condition_id], self._code_offsets[condition_id + 1]
+                code = marshal.loads(self._code_blob[start:end])
+                if code.__class__ is not CodeType:
+                    # eval() would run a string as source, unvalidated
+                    raise SnapshotError(f"{self.path} holds a {type(code).__name__} where condition code belongs")
+                func = eval(code, {"__builtins__": {}})
+            else:
+                func = compile_condition(self._string(self._condition_sources[condition_id])).func
+            self._condition_funcs[condition_id] = func
+        return func
+
+    def _template(self, template_id: int) -> Callable[[Dict[str, Any]], str]:
+        func = self._template_funcs[template_id]
+        if func is None:
+            func = self._template_funcs[template_id] = compile_template(
+                self._string(self._template_sources[template_id])
+            )
+        return func
+
+    # ----------------------------------------
+    # Engine API
+    # ----------------------------------------
+
+    def definition(self, position: int) -> Dict[str, Any]:
+        """RULE_SCHEMA form of the rule at position."""
+        definition = {
+            "name": self._string(self._names[position]),
+            "condition_code": self._string(self._condition_sources[self._conditions[position]]),
+            "action_message": self._string(self._template_sources[self._templates[position]]),
+        }
+        if self._priorities[position]:
+            definition["priority"] = self._priorities[position]
+        if self._groups[position] >= 0:
+            definition["group"] = self._string(self._groups[position])
+        if self._fields[position] >= 0:
+            definition["fields"] = json.loads(self._string(self._fields[position]))
+        return definition
+
+    def to_definitions(self) -> List[Dict[str, Any]]:
+        """Return all rules in RULE_SCHEMA form."""
+        return [self.definition(position) for position in range(len(self))]
+
+    def to_engine(self, engine_class: type = LogicEngine) -> LogicEngine:
+        """
+        Build a mutable engine whose rules run this snapshot's condition functions.
+
+        Conditions are not recompiled for evaluation, but the engine's
+        RuleIndex parses each distinct condition_code (cached by source) to
+        index it, since the snapshot stores no index.
+        """
+        engine = engine_class()
+        with engine.update():
+            for position in range(len(self)):
+                definition = self.definition(position)
+                fields = definition.get("fields")
+                engine.add_rule(Rule(
+                    name=definition["name"],
+                    condition=self._condition(self._conditions[position]),
+                    action=self._template(self._templates[position]),
+                    condition_code=definition["condition_code"],
+                    action_message=definition["action_message"],
+                    fields=None if fields is None else frozenset(fields),
+                    priority=definition.get("priority", 0),
+                    group=definition.get("group")
+                ))
+        return engine
+
+    def evaluate(self, context: Dict[str, Any]) -> List[str]:
+        """Evaluate all rules against the context, return actions taken (as LogicEngine.evaluate)"""
+        # Conditions and templates are decoded on first use; names only for fired rules
+        names = self._names
+        return evaluate_memoized(
+            context, self._conditions, self._templates, lambda position: self._string(names[position]),
+            self._condition_funcs, self._template_funcs,
+            load_condition=self._condition, load_template=self._template
+        )
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get snapshot size and decoding statistics."""
+        return {
+            "rules": len(self),
+            "conditions": len(self._condition_funcs),
+            "templates": len(self._template_funcs),
+            "bytes": len(self._mmap),
+            "decoded_conditions": sum(func is not None for func in self._condition_funcs),
+            "decoded_strings": len(self._strings),
+        }
@@ -0,0 +1,159 @@
+"""
+Module 06 - Streaming JSONL Evaluation
+======================================
+
+Evaluate a JSON-lines file of contexts against a rule set with bounded
+memory. Each stage is a generator, so only one line (or, with workers, a
+few chunks) is in memory at a time no matter how large the input is:
+
+    read lines -> parse JSON -> evaluate -> serialize -> write
+
+Rules are read from a JSON file holding a list of RULE_SCHEMA definitions
+(name, condition_code, action_message).
+
+Usage:
+    python evaluate_stream.py rules.json contexts.jsonl -o actions.jsonl
+    cat contexts.jsonl | python evaluate_stream.py rules.json --workers 4
+
+Output (one line per input line):
+    {"line": 1, "actions": ["Bulk Discount: Applied 20% bulk discount"]}
+    {"line": 2, "error": "Expecting value: line 1 column 1 (char 0)"}
+"""
+
+import sys
+import json
+import argparse
+import itertools
+from typing import List, Dict, Any, Iterable, Iterator, Optional, TextIO, NamedTuple
+
+from logic_engine_ai import LogicEngine
+
+
+class Record(NamedTuple):
+    """One input line on its way through the pipeline"""
+    line: int
+    context: Optional[Dict[str, Any]]
+    error: Optional[str] = None
+    actions: Optional[List[str]] = None
+
+
+# ============================================
+# PIPELINE STAGES
+# ============================================
+
+def parse_records(lines: Iterable[str]) -> Iterator[Record]:
+    """Parse JSON lines into records, skipping blank lines."""
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            context = json.loads(line)
+        except ValueError as e:
+            yield Record(number, None, error=str(e))
+            continue
+        if not isinstance(context, dict):
+            yield Record(number, None, error=f"Expected a JSON object, got {type(context).__name__}")
+            continue
+        yield Record(number, context)
+
+
+def evaluate_records(
+    engine: LogicEngine,
+    records: Iterable[Record],
+    workers: int = 1,
+    chunksize: int = 256
+) -> Iterator[Record]:
+    """Attach evaluate() results to each parsed record."""
+    if workers == 1:
+        for record in records:
+            if record.error is None:
+                record = record._replace(actions=engine.evaluate(record.context))
+            yield record
+        return
+
+    # evaluate_many keeps only a few chunks in flight, so the tee buffer stays bounded
+    passthrough, to_evaluate = itertools.tee(records)
+    contexts = (record.context if record.error is None else {} for record in to_evaluate)
+    for record, actions in zip(passthrough, engine.evaluate_many(contexts, workers, chunksize)):
+        if record.error is None:
+            record = record._replace(actions=actions)
+        yield record
+
+
+def serialize_records(records: Iterable[Record], skip_empty: bool = False) -> Iterator[str]:
+    """Render records as JSON lines."""
+    for record in records:
+        if record.error is not None:
+            yield json.dumps({"line": record.line, "error": record.error}) + "\n"
+        elif record.actions or not skip_empty:
+            yield json.dumps({"line": record.line, "actions": record.actions}) + "\n"
+
+
+def evaluate_jsonl(
+    engine: LogicEngine,
+    source: TextIO,
+    sink: TextIO,
+    workers: int = 1,
+    chunksize: int = 256,
+    skip_empty: bool = False
+) -> Dict[str, int]:
+    """
+    Stream contexts from source through the engine into sink.
+
+    Args:
+        engine: LogicEngine with the rules to apply
+        source: Text stream of JSON lines (file or sys.stdin)
+        sink: Text stream for the JSON-lines output
+        workers: Worker processes (see LogicEngine.evaluate_many); 1 = in-process
+        chunksize: Contexts per worker task
+        skip_empty: Don't write lines for contexts where no rule fired
+
+    Returns:
+        Counts of lines written and parse errors
+    """
+    stats = {"lines": 0, "errors": 0}
+
+    def count(records: Iterable[Record]) -> Iterator[Record]:
+        for record in records:
+            stats["lines"] += 1
+            if record.error is not None:
+                stats["errors"] += 1
+            yield record
+
+    records = evaluate_records(engine, count(parse_records(source)), workers, chunksize)
+    for text in serialize_records(records, skip_empty):
+        sink.write(text)
+    sink.flush()
+    return stats
+
+
+def load_engine(path: str) -> LogicEngine:
+    """Build an engine from a JSON file containing a list of rule definitions."""
+    with open(path) as f:
+        definitions = json.load(f)
+    return LogicEngine.from_definitions(definitions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate JSON-lines contexts against a rule set")
+    parser.add_argument("rules", help="JSON file with a list of RULE_SCHEMA definitions")
+    parser.add_argument("contexts", nargs="?", default="-", help="JSON-lines contexts file (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="Output file (default: stdout)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (default: 1)")
+    parser.add_argument("--chunksize", type=int, default=256, help="Contexts per worker task")
+    parser.add_argument("--skip-empty", action="store_true", help="Omit contexts where no rule fired")
+    args = parser.parse_args()
+
+    engine = load_engine(args.rules)
+    source = sys.stdin if args.contexts == "-" else open(args.contexts)
+    sink = sys.stdout if args.output == "-" else open(args.output, "w")
+
+    try:
+        stats = evaluate_jsonl(engine, source, sink, args.workers, args.chunksize, args.skip_empty)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+    print(f"Evaluated {stats['lines']} lines ({stats['errors']} parse errors)", file=sys.stderr)
@@ -0,0 +1,326 @@
+"""
+Module 06 - Local Gemini Stub Server
+====================================
+
+A stand-in for the generateContent endpoint, so quota handling can be
+exercised without spending real quota:
+
+- Per-key quotas: each API key gets `quota` requests per `window` seconds;
+  beyond that the server answers 429 with a Retry-After header
+- Configurable response latency: fixed, or drawn from an exponential or
+  lognormal distribution with that mean, plus a fraction of slow
+  responses (slow_fraction / slow_latency) to exercise hedging and timeouts
+- Injected server errors: error_rate of the requests get error_status
+  (default 503) without using the key's quota
+- Structured calls (with generationConfig) get a RULE_SCHEMA-shaped rule,
+  or a list of rules when the response schema is an array (one per
+  numbered description for BATCH_RULES_SCHEMA)
+- streamGenerateContent?alt=sse streams the response text in small chunks
+  (chunk_delay seconds apart) as server-sent events; buffered responses
+  wait for the same total generation time
+
+Usage:
+    python gemini_stub_server.py --port 8765 --quota 5 --window 10
+    python gemini_stub_server.py --latency 0.05 --latency-distribution lognormal --error-rate 0.02
+
+    api = QuotaAwareGemini(["key-a", "key-b"], base_url="http://127.0.0.1:8765/v1beta")
+"""
+
+import re
+import json
+import math
+import random
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, Optional, Tuple
+
+
+# Characters of response text per streamed chunk
+STREAM_CHUNK_SIZE = 32
+
+# Response latency distributions; `latency` is the mean
+FIXED = "fixed"
+EXPONENTIAL = "exponential"
+LOGNORMAL = "lognormal"
+LATENCY_DISTRIBUTIONS = (FIXED, EXPONENTIAL, LOGNORMAL)
+
+# Spread (sigma of the underlying normal) of lognormal latencies
+LOGNORMAL_SIGMA = 0.5
+
+
+def stub_rule(number: int) -> Dict[str, Any]:
+    """A RULE_SCHEMA rule; rules with different numbers use different thresholds."""
+    return {
+        "name": f"Stub Rule {number + 1}" if number else "Stub Rule",
+        "condition_code": f"ctx.get('quantity', 0) >= {10 + 5 * number}",
+        "action_message": "Applied stub discount",
+    }
+
+
+class StubGeminiServer(ThreadingHTTPServer):
+    """HTTP server holding the stub's quota state and counters"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        quota: Optional[int] = None,
+        window: float = 60.0,
+        latency: float = 0.0,
+        slow_fraction: float = 0.0,
+        slow_latency: float = 0.0,
+        seed: Optional[int] = None,
+        chunk_delay: float = 0.0,
+        latency_distribution: str = FIXED,
+        error_rate: float = 0.0,
+        error_status: int = 503
+    ):
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(
+                f"Unknown latency distribution {latency_distribution!r}; "
+                f"expected one of {', '.join(LATENCY_DISTRIBUTIONS)}"
+            )
+        super().__init__(address, StubGeminiHandler)
+        self.quota = quota
+        self.window = window
+        self.latency = latency
+        self.slow_fraction = slow_fraction
+        self.slow_latency = slow_latency
+        self.random = random.Random(seed)
+        self.chunk_delay = chunk_delay
+        self.latency_distribution = latency_distribution
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, list] = {}  # key -> [tokens, last refill]
+        self.stats = {"requests": 0, "ok": 0, "throttled": 0, "errors": 0, "prompt_tokens": 0}
+        self.key_stats: Dict[str, Dict[str, int]] = {}  # key -> outcome counts
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1beta"
+
+    def response_delay(self) -> float:
+        """Seconds to sleep before answering the next request."""
+        with self.lock:
+            if self.slow_fraction and self.random.random() < self.slow_fraction:
+                return self.slow_latency
+            if not self.latency or self.latency_distribution == FIXED:
+                return self.latency
+            if self.latency_distribution == EXPONENTIAL:
+                return self.random.expovariate(1 / self.latency)
+            # Lognormal with mean `latency`: mu = ln(mean) - sigma^2 / 2
+            mu = math.log(self.latency) - LOGNORMAL_SIGMA ** 2 / 2
+            return self.random.lognormvariate(mu, LOGNORMAL_SIGMA)
+
+    def inject_error(self, key: str) -> bool:
+        """Whether to fail this request with error_status (counted, no quota used)."""
+        with self.lock:
+            if not self.error_rate or self.random.random() >= self.error_rate:
+                return False
+            self.stats["requests"] += 1
+            self._count(key, "errors")
+            return True
+
+    def count_prompt(self, prompt: str):
+        """Add an answered prompt's size (~4 characters per token) to the stats."""
+        with self.lock:
+            self.stats["prompt_tokens"] += max(1, len(prompt) // 4)
+
+    def _count(self, key: str, outcome: str):
+        """Count a request outcome overall and for the key (lock held)."""
+        self.stats[outcome] += 1
+        counts = self.key_stats.setdefault(key, {"ok": 0, "throttled": 0, "errors": 0})
+        counts[outcome] += 1
+
+    def admit(self, key: str) -> Optional[float]:
+        """Take one request from the key's quota; return Retry-After seconds if none is left."""
+        with self.lock:
+            self.stats["requests"] += 1
+            if self.quota is None:
+                self._count(key, "ok")
+                return None
+
+            now = time.monotonic()
+            rate = self.quota / self.window
+            tokens, updated = self.buckets.get(key, (self.quota, now))
+            tokens = min(self.quota, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self.buckets[key] = [tokens, now]
+                self._count(key, "throttled")
+                return (1 - tokens) / rate
+            self.buckets[key] = [tokens - 1, now]
+            self._count(key, "ok")
+            return None
+
+
+class StubGeminiHandler(BaseHTTPRequestHandler):
+    """Answers POST /v1beta/models/<model>:generateContent (and :streamGenerateContent)"""
+
+    protocol_version = "HTTP/1.1"
+    # Buffer writes so headers and body leave in one segment (avoids delayed-ACK stalls)
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send(400, {"error": {"code": 400, "message": "Invalid JSON payload"}})
+            return
+
+        delay = self.server.response_delay()
+        if delay:
+            time.sleep(delay)
+
+        key = self.headers.get("x-goog-api-key", "")
+        if self.server.inject_error(key):
+            status = self.server.error_status
+            self._send(status, {
+                "error": {"code": status, "message": "Injected stub error", "status": "UNAVAILABLE"}
+            })
+            return
+
+        retry_after = self.server.admit(key)
+        if retry_after is not None:
+            self._send(429, {
+                "error": {"code": 429, "message": "Resource has been exhausted", "status": "RESOURCE_EXHAUSTED"}
+            }, {"Retry-After": str(math.ceil(retry_after))})
+            return
+
+        prompt, text = self._generate(body)
+        self.server.count_prompt(prompt)
+        if ":streamGenerateContent" in self.path:
+            self._stream(prompt, text)
+        else:
+            # A buffered response arrives once the whole text has been "generated"
+            if self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay * ((len(text) - 1) // STREAM_CHUNK_SIZE))
+            self._send(200, self._response(prompt, text))
+
+    def _generate(self, body: Dict[str, Any]) -> Tuple[str, str]:
+        """(prompt, response text) for the request body."""
+        prompt = body.get("contents", [{}])[0].get("parts", [{}])[0].get("text", "")
+        config = body.get("generationConfig")
+        if config is None:
+            return prompt, f"Stub response to: {prompt[:40]}"
+        schema = config.get("responseSchema", {})
+        if schema.get("type") == "array":
+            if "index" in schema.get("items", {}).get("properties", {}):
+                # Batched generation: one rule per "[n] description" line
+                numbers = [int(n) for n in re.findall(r"^\[(\d+)\] ", prompt, re.MULTILINE)]
+                return prompt, json.dumps([{"index": n, **stub_rule(n)} for n in numbers])
+            return prompt, json.dumps([stub_rule(i) for i in range(3)])
+        return prompt, json.dumps(stub_rule(0))
+
+    @staticmethod
+    def _response(prompt: str, text: str) -> Dict[str, Any]:
+        """generateContent response carrying text."""
+        tokens = max(1, len(prompt) // 4)
+        return {
+            "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}],
+            "usageMetadata": {"promptTokenCount": tokens, "totalTokenCount": tokens + len(text) // 4},
+        }
+
+    def _stream(self, prompt: str, text: str, chunk_size: int = STREAM_CHUNK_SIZE):
+        """Send text as server-sent events, one generateContent chunk per event."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for start in range(0, len(text), chunk_size):
+            if start and self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+            event = self._response(prompt, text[start:start + chunk_size])
+            self.wfile.write(f"data: {json.dumps(event)}\r\n\r\n".encode())
+            self.wfile.flush()
+
+    def _send(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_stub_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    quota: Optional[int] = None,
+    window: float = 60.0,
+    latency: float = 0.0,
+    slow_fraction: float = 0.0,
+    slow_latency: float = 0.0,
+    seed: Optional[int] = None,
+    chunk_delay: float = 0.0,
+    latency_distribution: str = FIXED,
+    error_rate: float = 0.0,
+    error_status: int = 503
+) -> StubGeminiServer:
+    """
+    Start the stub server on a background thread.
+
+    Args:
+        host: Interface to bind
+        port: Port to bind (0 = any free port)
+        quota: Requests per key per window (None = unlimited)
+        window: Quota window in seconds
+        latency: Seconds to sleep before answering each request (the mean,
+            for exponential and lognormal latency_distribution)
+        slow_fraction: Fraction of requests answered after slow_latency instead
+        slow_latency: Seconds to sleep for the slow requests
+        seed: Seed for latencies, slow requests and errors (None = random)
+        chunk_delay: Seconds between streamed response chunks
+        latency_distribution: "fixed", "exponential" or "lognormal"
+        error_rate: Fraction of requests failed with error_status
+        error_status: HTTP status of injected errors
+
+    Returns:
+        The running server; use server.base_url and server.shutdown()
+    """
+    server = StubGeminiServer(
+        (host, port), quota, window, latency, slow_fraction, slow_latency, seed, chunk_delay,
+        latency_distribution, error_rate, error_status
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Gemini generateContent stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--quota", type=int, default=None, help="Requests per key per window")
+    parser.add_argument("--window", type=float, default=60.0, help="Quota window in seconds")
+    parser.add_argument("--latency", type=float, default=0.0, help="Response latency in seconds")
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="Fraction of slow responses")
+    parser.add_argument("--slow-latency", type=float, default=0.0, help="Latency of slow responses in seconds")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latencies, slow responses and errors")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument("--latency-distribution", choices=LATENCY_DISTRIBUTIONS, default=FIXED,
+                        help="Distribution of response latencies (--latency is the mean)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of injected server errors")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected errors")
+    args = parser.parse_args()
+
+    server = StubGeminiServer(
+        (args.host, args.port), args.quota, args.window, args.latency,
+        args.slow_fraction, args.slow_latency, args.seed, args.chunk_delay,
+        args.latency_distribution, args.error_rate, args.error_status
+    )
+    print(f"Stub Gemini API on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,260 @@
+"""
+Module 06 - QuotaAwareGemini Load Test
+======================================
+
+Drive many concurrent callers through QuotaAwareGemini.call() and
+call_structured() and report what the client achieved:
+
+- Achieved calls per second and call latency percentiles (p50/p95/p99/max),
+  including retries, backoff and hedging as the caller sees them
+- Failed calls by exception type (exhausted keys, DeadlineExceeded)
+- Wasted attempts: HTTP requests that did not become a caller's answer
+  (429s, server errors, timeouts and losing hedges), from get_stats()
+- Per-key balance: each key's share of successful requests and the
+  busiest key relative to the mean
+
+By default the command line starts a local stub (gemini_stub_server.py)
+with the given latency distribution, per-key quota and error rate, so
+throughput settings can be tuned without spending real quota. Every
+call uses a distinct prompt, so a response cache never answers for the
+backend.
+
+Usage:
+    python load_test.py --keys 3 --callers 16 --duration 10 --quota 60 --window 10
+    python load_test.py --latency 0.05 --latency-distribution lognormal --error-rate 0.05 --hedge
+    python load_test.py --rpm 300 --calls 20 --json
+
+    from load_test import run_load
+    report = run_load(api, callers=16, duration=10.0, server=server)
+    print(report.summary())
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Any, Optional
+
+from logic_engine_ai import QuotaAwareGemini, KeyScheduler, RULE_SCHEMA
+from gemini_stub_server import StubGeminiServer, start_stub_server, LATENCY_DISTRIBUTIONS, FIXED
+
+
+@dataclass
+class LoadReport:
+    """Outcome of one load test run"""
+    callers: int
+    elapsed: float                  # wall-clock seconds
+    calls: int                      # calls started
+    succeeded: int
+    failures: Dict[str, int]        # exception type -> failed calls
+    latency_ms: Dict[str, float]    # p50/p95/p99/max over successful calls
+    attempts: int                   # HTTP requests the client recorded
+    wasted_attempts: int            # attempts that did not answer a call
+    key_requests: List[int]         # successful requests per key
+    key_errors: List[int]           # failed requests per key
+    hedged: int = 0
+    server: Optional[Dict[str, Any]] = None  # stub server counters, if known
+    client_stats: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def rps(self) -> float:
+        """Successful calls per second."""
+        return self.succeeded / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def key_balance(self) -> float:
+        """Busiest key's successful requests over the mean (1.0 = even)."""
+        total = sum(self.key_requests)
+        if not total:
+            return 0.0
+        return max(self.key_requests) / (total / len(self.key_requests))
+
+    def as_dict(self) -> Dict[str, Any]:
+        """JSON-friendly form, including the derived rates."""
+        result = asdict(self)
+        result["rps"] = round(self.rps, 2)
+        result["key_balance"] = round(self.key_balance, 2)
+        return result
+
+    def summary(self) -> str:
+        """Human-readable report."""
+        lines = [
+            f"{self.calls} calls from {self.callers} callers in {self.elapsed:.2f}s: "
+            f"{self.succeeded} succeeded ({self.rps:.1f} calls/s)",
+        ]
+        if self.latency_ms:
+            lines.append("   latency " + "  ".join(f"{name} {value:.1f}ms" for name, value in self.latency_ms.items()))
+        if self.failures:
+            lines.append("   failed  " + ", ".join(f"{count} {name}" for name, count in self.failures.items()))
+        waste = self.wasted_attempts / self.attempts if self.attempts else 0.0
+        lines.append(
+            f"   attempts {self.attempts} ({self.wasted_attempts} wasted, {waste:.1%})"
+            + (f", {self.hedged} hedged" if self.hedged else "")
+        )
+        total = sum(self.key_requests) or 1
+        shares = ", ".join(
+            f"key {i + 1} {ok} ok/{err} err ({ok / total:.0%})"
+            for i, (ok, err) in enumerate(zip(self.key_requests, self.key_errors))
+        )
+        lines.append(f"   balance {self.key_balance:.2f}x mean: {shares}")
+        if self.server is not None:
+            lines.append(
+                f"   server  {self.server['requests']} requests, {self.server['throttled']} throttled (429), "
+                f"{self.server['errors']} injected errors"
+            )
+        return "\n".join(lines)
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max (ms) of latencies in seconds."""
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    result = {
+        f"p{p}": round(samples[min(len(samples) - 1, len(samples) * p // 100)] * 1000, 1)
+        for p in (50, 95, 99)
+    }
+    result["max"] = round(samples[-1] * 1000, 1)
+    return result
+
+
+def run_load(
+    api: QuotaAwareGemini,
+    callers: int = 8,
+    duration: Optional[float] = None,
+    calls_per_caller: int = 10,
+    structured_fraction: float = 0.5,
+    server: Optional[StubGeminiServer] = None,
+    seed: int = 0
+) -> LoadReport:
+    """
+    Run concurrent callers against api and report throughput and waste.
+
+    Args:
+        api: Client under test (fresh, so get_stats() covers only this run)
+        callers: Concurrent caller threads
+        duration: Seconds to keep calling (None = calls_per_caller calls each)
+        calls_per_caller: Calls per caller when no duration is given
+        structured_fraction: Share of calls made with call_structured(RULE_SCHEMA)
+        server: Stub server behind api, to include its counters
+        seed: Seed for choosing plain vs structured calls
+
+    Returns:
+        LoadReport for the run
+    """
+    lock = threading.Lock()
+    latencies: List[float] = []
+    failures: Dict[str, int] = {}
+    started = [0]
+    barrier = threading.Barrier(callers + 1)
+
+    def caller(number: int):
+        choose = random.Random(seed * 1000 + number)
+        barrier.wait()
+        stop_at = None if duration is None else time.monotonic() + duration
+        n = 0
+        while (n < calls_per_caller) if stop_at is None else (time.monotonic() < stop_at):
+            prompt = f"Load test caller {number} call {n}"
+            start = time.perf_counter()
+            try:
+                if choose.random() < structured_fraction:
+                    api.call_structured(prompt, RULE_SCHEMA)
+                else:
+                    api.call(prompt)
+                outcome = None
+            except Exception as e:
+                outcome = type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                started[0] += 1
+                if outcome is None:
+                    latencies.append(elapsed)
+                else:
+                    failures[outcome] = failures.get(outcome, 0) + 1
+            n += 1
+
+    threads = [threading.Thread(target=caller, args=(i,), daemon=True) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # Losing hedges are recorded when they land; a run can end before that
+    stats = api.get_stats()
+    attempts = stats["total_requests"] + stats["total_errors"]
+    return LoadReport(
+        callers=callers,
+        elapsed=elapsed,
+        calls=started[0],
+        succeeded=len(latencies),
+        failures=failures,
+        latency_ms=_percentiles(latencies),
+        attempts=attempts,
+        wasted_attempts=attempts - len(latencies),
+        key_requests=stats["request_counts"],
+        key_errors=stats["error_counts"],
+        hedged=stats.get("hedging", {}).get("hedged", 0),
+        server=dict(server.stats) if server is not None else None,
+        client_stats=stats,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test QuotaAwareGemini against a local stub")
+    parser.add_argument("--keys", type=int, default=3, help="Number of API keys")
+    parser.add_argument("--callers", type=int, default=8, help="Concurrent callers")
+    parser.add_argument("--duration", type=float, default=None, help="Seconds to run (default: --calls each)")
+    parser.add_argument("--calls", type=int, default=10, help="Calls per caller without --duration")
+    parser.add_argument("--structured", type=float, default=0.5, help="Fraction of call_structured calls")
+    parser.add_argument("--base-url", help="Use a running server (e.g. gemini_stub_server.py) instead")
+    # Stub server behaviour
+    parser.add_argument("--quota", type=int, default=None, help="Stub requests per key per window")
+    parser.add_argument("--window", type=float, default=60.0, help="Stub quota window in seconds")
+    parser.add_argument("--latency", type=float, default=0.02, help="Stub mean latency in seconds")
+    parser.add_argument("--latency-distribution", choices=LATENCY_DISTRIBUTIONS, default=FIXED)
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="Fraction of slow stub responses")
+    parser.add_argument("--slow-latency", type=float, default=0.0, help="Latency of slow responses in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of injected server errors")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the stub and the call mix")
+    # Client settings under test
+    parser.add_argument("--rpm", type=float, default=None, help="Use a KeyScheduler with this requests/minute per key")
+    parser.add_argument("--hedge", action="store_true", help="Enable hedged requests")
+    parser.add_argument("--adaptive-timeout", action="store_true", help="Enable adaptive per-attempt timeouts")
+    parser.add_argument("--deadline", type=float, default=None, help="Per-call deadline in seconds")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = start_stub_server(
+            quota=args.quota, window=args.window, latency=args.latency,
+            slow_fraction=args.slow_fraction, slow_latency=args.slow_latency, seed=args.seed,
+            latency_distribution=args.latency_distribution, error_rate=args.error_rate
+        )
+        base_url = server.base_url
+
+    keys = [f"load-key-{i}" for i in range(args.keys)]
+    scheduler = KeyScheduler(len(keys), requests_per_minute=args.rpm) if args.rpm else None
+    api = QuotaAwareGemini(
+        keys, base_url=base_url, pool_size=max(10, args.callers), scheduler=scheduler,
+        hedge=args.hedge, adaptive_timeout=args.adaptive_timeout, deadline=args.deadline
+    )
+    try:
+        report = run_load(
+            api, args.callers, args.duration, args.calls, args.structured, server=server, seed=args.seed
+        )
+    finally:
+        api.close()
+        if server is not None:
+            server.shutdown()
+
+    if args.json:
+        print(json.dumps(report.as_dict(), indent=2, default=str))
+    else:
+        print(report.summary())
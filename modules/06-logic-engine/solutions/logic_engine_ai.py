@@ -16,27 +16,584 @@ Usage:
 
 Requirements:
     pip install requests python-dotenv
+    pip install numpy  # optional, for LogicEngine.evaluate_batch
 """
 
 import os
+import ast
+import string
 import json
+import math
 import time
+import bisect
+import asyncio
+import hashlib
+import sqlite3
+import itertools
+import threading
+import weakref
 import requests
-from typing import List, Dict, Any, Callable, Optional
+from requests.adapters import HTTPAdapter
+from array import array
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from functools import cached_property, lru_cache, partial
+from types import CodeType
+from typing import List, Dict, Any, Callable, NamedTuple, Optional, Set, FrozenSet, Tuple, Union, Sequence, Iterable, Iterator
 from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+
+# Optional: only needed for LogicEngine.evaluate_batch
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# ============================================
+# RESPONSE CACHE
+# Persistent cache for repeated prompts
+# ============================================
+
+class ResponseCache:
+    """
+    On-disk (SQLite) cache of Gemini responses with LRU and TTL eviction.
+
+    Entries are keyed by a hash of (model, prompt, schema). Use ":memory:"
+    as the path for a per-process cache. Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        path: str = "gemini-cache.sqlite3",
+        max_entries: int = 10_000,
+        ttl: Optional[float] = 7 * 24 * 3600
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @staticmethod
+    def make_key(model: str, prompt: str, schema: Optional[Dict[str, Any]] = None) -> str:
+        """Stable hash of a request."""
+        payload = json.dumps([model, prompt, schema], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any):
+        """Store a value, evicting least recently used entries over max_entries."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._db.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache hit/miss statistics."""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "hit_rate": f"{self.hits / lookups * 100:.1f}%" if lookups else "N/A"
+        }
+
+
+# ============================================
+# RATE LIMITING
+# Token buckets and key health for proactive scheduling
+# ============================================
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt size in tokens (~4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def _retry_after(response: Optional[requests.Response]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header or a Gemini RetryInfo detail."""
+    if response is None:
+        return None
+
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(header).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    # {"error": {"details": [{"@type": ".../google.rpc.RetryInfo", "retryDelay": "12s"}]}}
+    try:
+        for detail in response.json()["error"]["details"]:
+            delay = detail.get("retryDelay")
+            if isinstance(delay, str) and delay.endswith("s"):
+                return max(0.0, float(delay[:-1]))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        pass
+    return None
+
+
+def _used_tokens(response: requests.Response) -> Optional[int]:
+    """totalTokenCount from a generateContent response, if present."""
+    try:
+        return int(response.json()["usageMetadata"]["totalTokenCount"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _usable_response(future: Future) -> bool:
+    """Whether a finished request future holds a response worth returning (not 429/5xx)."""
+    if future.exception() is not None:
+        return False
+    status = future.result().status_code
+    return status != 429 and status < 500
+
+
+class TokenBucket:
+    """Refills at rate per second up to capacity; may go negative to queue reservations."""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = now
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (after refill)."""
+        missing = amount - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+
+class KeyScheduler:
+    """
+    Proactive key selection for QuotaAwareGemini.
+
+    Each key gets a request bucket (requests_per_minute) and optionally a
+    token bucket (tokens_per_minute). reserve() picks the key that can send
+    soonest, preferring the most headroom, and books the request so
+    concurrent callers queue up instead of tripping 429s.
+
+    Keys that fail failure_threshold times in a row open a circuit breaker
+    and are skipped for cooldown seconds, then get one trial request
+    (half-open). A 429 with Retry-After (or RetryInfo) blocks the key for
+    that long.
+    """
+
+    def __init__(
+        self,
+        key_count: int,
+        requests_per_minute: float = 15,
+        tokens_per_minute: Optional[float] = None,
+        burst: float = 1,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.key_count = key_count
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        now = clock()
+        self._requests = [TokenBucket(requests_per_minute / 60, burst, now) for _ in range(key_count)]
+        self._tokens = [
+            TokenBucket(tokens_per_minute / 60, tokens_per_minute, now) for _ in range(key_count)
+        ] if tokens_per_minute else None
+        self._blocked_until = [0.0] * key_count
+        self._failures = [0] * key_count
+        self._circuit = ["closed"] * key_count
+        self._reserved_tokens: Dict[int, deque] = {i: deque() for i in range(key_count)}
+        self.throttled = [0] * key_count
+
+    def reserve(self, tokens: int = 1) -> Tuple[int, float]:
+        """
+        Book the next request.
+
+        Returns:
+            (key index, seconds the caller must wait before sending)
+        """
+        with self._lock:
+            now = self._clock()
+            ready, index = self._best_key(now, tokens, exclude=None)
+            self._book(index, ready, tokens)
+            return index, max(0.0, ready - now)
+
+    def try_reserve(self, tokens: int = 1, exclude: Optional[int] = None) -> Optional[int]:
+        """
+        Book a request only if some key (other than exclude) can send right now.
+
+        Returns:
+            The key index, or None if every candidate would have to wait
+        """
+        with self._lock:
+            now = self._clock()
+            if self.key_count == 1 and exclude is not None:
+                return None
+            ready, index = self._best_key(now, tokens, exclude)
+            if ready > now:
+                return None
+            self._book(index, ready, tokens)
+            return index
+
+    def release(self, index: int):
+        """Give back a reservation that will not be sent."""
+        with self._lock:
+            self._requests[index].level += 1
+            if self._tokens is not None and self._reserved_tokens[index]:
+                self._tokens[index].level += self._reserved_tokens[index].pop()
+
+    def _best_key(self, now: float, tokens: int, exclude: Optional[int]) -> Tuple[float, int]:
+        """(time it can send, index) of the soonest key, preferring the most headroom."""
+        best = None
+        for i in range(self.key_count):
+            if i == exclude:
+                continue
+            bucket = self._requests[i]
+            bucket.refill(now)
+            ready = max(now, self._blocked_until[i]) + bucket.wait_time(1)
+            if self._tokens is not None:
+                self._tokens[i].refill(now)
+                ready = max(ready, now + self._tokens[i].wait_time(tokens))
+            headroom = bucket.level / bucket.capacity
+            rank = (ready, -headroom)
+            if best is None or rank < best[0]:
+                best = (rank, i)
+
+        (ready, _), index = best
+        return ready, index
+
+    def _book(self, index: int, ready: float, tokens: int):
+        """Take one request (and the estimated tokens) from a key's buckets."""
+        self._requests[index].level -= 1
+        if self._tokens is not None:
+            self._tokens[index].level -= tokens
+            self._reserved_tokens[index].append(tokens)
+        if self._circuit[index] == "open":
+            # One trial request; the key stays blocked until it reports back
+            self._circuit[index] = "half-open"
+            self._blocked_until[index] = ready + self.cooldown
+
+    def record_success(self, index: int, used_tokens: Optional[int] = None):
+        """Close the key's circuit and settle its token estimate."""
+        with self._lock:
+            self._failures[index] = 0
+            if self._circuit[index] != "closed":
+                self._circuit[index] = "closed"
+                self._blocked_until[index] = 0.0
+            self._settle_tokens(index, used_tokens)
+
+    def record_failure(self, index: int, retry_after: Optional[float] = None, throttled: bool = False):
+        """Count a failure; honor Retry-After and trip the breaker on repeated failures."""
+        with self._lock:
+            now = self._clock()
+            self._settle_tokens(index, None)
+            self._failures[index] += 1
+            if throttled:
+                self.throttled[index] += 1
+                # The server disagrees with our bucket: start refilling from empty
+                self._requests[index].refill(now)
+                self._requests[index].level = min(self._requests[index].level, 0)
+            if retry_after is not None:
+                self._blocked_until[index] = max(self._blocked_until[index], now + retry_after)
+            if self._failures[index] >= self.failure_threshold or self._circuit[index] == "half-open":
+                self._circuit[index] = "open"
+                self._blocked_until[index] = max(self._blocked_until[index], now + self.cooldown)
+
+    def _settle_tokens(self, index: int, used_tokens: Optional[int]):
+        """Replace the oldest token estimate for a key with the real count."""
+        if self._tokens is None or not self._reserved_tokens[index]:
+            return
+        estimate = self._reserved_tokens[index].popleft()
+        if used_tokens is not None:
+            self._tokens[index].level -= used_tokens - estimate
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """Per-key scheduler state."""
+        with self._lock:
+            now = self._clock()
+            stats = []
+            for i in range(self.key_count):
+                self._requests[i].refill(now)
+                stats.append({
+                    "circuit": self._circuit[i],
+                    "consecutive_failures": self._failures[i],
+                    "throttled": self.throttled[i],
+                    "blocked_for": round(max(0.0, self._blocked_until[i] - now), 2),
+                    "request_headroom": round(self._requests[i].level, 2),
+                })
+            return stats
+
+
+# ============================================
+# REQUESTS AND RESPONSE DECODING
+# Payload builders, decoders and incremental JSON for streamed responses
+# ============================================
+
+def text_payload(prompt: str) -> Dict[str, Any]:
+    """generateContent body for a plain text prompt."""
+    return {"contents": [{"parts": [{"text": prompt}]}]}
+
+
+def structured_payload(prompt: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """generateContent body asking for JSON matching schema."""
+    return {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": {
+            "responseMimeType": "application/json",
+            "responseSchema": schema
+        }
+    }
+
+
+def _candidate_text(result: Dict[str, Any]) -> str:
+    """Text of the first candidate (all parts joined); empty for chunks without text."""
+    candidates = result.get("candidates") or [{}]
+    parts = candidates[0].get("content", {}).get("parts", ())
+    return "".join(part.get("text", "") for part in parts)
+
+
+def decode_json(response: requests.Response) -> Dict[str, Any]:
+    """The raw generateContent response."""
+    return response.json()
+
+
+def decode_structured(response: requests.Response) -> Any:
+    """The JSON value the model returned for a structured call."""
+    return json.loads(_candidate_text(response.json()))
+
+
+def decode_stream(response: requests.Response) -> requests.Response:
+    """The open streaming response, for iter_sse_events()."""
+    return response
+
+
+def iter_sse_events(response: requests.Response) -> Iterator[Dict[str, Any]]:
+    """Parsed `data:` payloads of a server-sent events response, as they arrive."""
+    data: List[str] = []
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("data:"):
+            data.append(line[5:].lstrip())
+        elif not line and data:
+            yield json.loads("\n".join(data))
+            data = []
+    if data:
+        yield json.loads("\n".join(data))
+
+
+class JSONArrayStream:
+    """
+    Incremental parser for a JSON array arriving in arbitrary text chunks.
+
+    feed() returns the array elements completed by each chunk, so callers
+    can act on the first element while the rest is still being generated.
+    A top-level value that is not an array is returned whole by close().
+
+    Usage:
+        parser = JSONArrayStream()
+        for chunk in chunks:
+            for item in parser.feed(chunk):
+                ...
+        leftover = parser.close()
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0           # next character to scan
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start: Optional[int] = None  # start of the current element
+        self.is_array: Optional[bool] = None
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Add text; return the array elements it completed."""
+        self._text += chunk
+        text = self._text
+        done = []
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch.isspace():
+                pass
+            elif self._depth == 0:
+                if self.is_array is not None:
+                    raise ValueError(f"Unexpected {ch!r} after the top-level JSON value")
+                self.is_array = ch == "["
+                if self.is_array:
+                    self._depth = 1
+                else:
+                    # Not an array: collect the whole value for close()
+                    self._start = i
+                    self._depth = 1 if ch in "{[" else 0
+                    self._in_string = ch == '"'
+                    if self._depth == 0 and not self._in_string:
+                        self._depth = -1  # bare scalar, runs to the end
+            elif self._depth == -1:
+                pass
+            elif not self.is_array:
+                if ch == '"':
+                    self._in_string = True
+                elif ch in "{[":
+                    self._depth += 1
+                elif ch in "}]":
+                    self._depth -= 1
+            elif ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._start is None:
+                    self._start = i
+            elif ch in "{[":
+                if self._depth == 1 and self._start is None:
+                    self._start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._start is not None:
+                    done.append(json.loads(text[self._start:i + 1]))
+                    self._start = None
+                elif self._depth == 0:
+                    if self._start is not None:  # trailing scalar element
+                        done.append(json.loads(text[self._start:i]))
+                        self._start = None
+                    self.is_array = True
+            elif ch == "," and self._depth == 1:
+                if self._start is not None:  # scalar element
+                    done.append(json.loads(text[self._start:i]))
+                    self._start = None
+            elif self._depth == 1 and self._start is None:
+                self._start = i
+            i += 1
+
+        # Keep only the unfinished element
+        cut = self._start if self._start is not None else i
+        self._text = text[cut:]
+        self._pos = i - cut
+        if self._start is not None:
+            self._start = 0
+        return done
+
+    def close(self) -> List[Any]:
+        """Finish parsing; return the non-array top-level value, if that is what arrived."""
+        if self.is_array is None:
+            raise ValueError("Empty JSON stream")
+        if self.is_array:
+            if self._depth != 0:
+                raise ValueError("JSON array stream ended before the closing ']'")
+            return []
+        return [json.loads(self._text)]
+
 
 # ============================================
 # QUOTA-AWARE API WRAPPER
 # Multi-key rotation with automatic failover
 # ============================================
 
+class DeadlineExceeded(Exception):
+    """A call ran out of its time budget before any key answered."""
+
+
+# Latency samples needed before hedge delays and adaptive timeouts kick in
+MIN_LATENCY_SAMPLES = 20
+
+
 class QuotaAwareGemini:
     """
     Multi-key Gemini API wrapper with automatic quota failover.
     Python equivalent of infrastructure/quota-monitor.js.
+
+    Tail latency controls (all off by default):
+    - hedge: if a request is still pending after the hedge_percentile
+      latency of recent requests (or hedge_after seconds), send a duplicate
+      on another key and take whichever answers first
+    - adaptive_timeout: per-attempt timeout of timeout_multiplier x the p99
+      latency, between min_timeout and timeout, instead of a flat timeout
+    - deadline: total seconds a call may take across all attempts and
+      backoffs; DeadlineExceeded is raised when it runs out
+
+    max_concurrency_per_key caps the requests in flight on one key (hedged
+    duplicates aside). Without a scheduler an attempt then starts on the
+    current key if it has room, else on the next key that does, and waits
+    while every key is full. limit_keys() applies such a cap for the
+    duration of a block.
     """
 
-    def __init__(self, keys: List[str], verbose: bool = False):
+    BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+    def __init__(
+        self,
+        keys: List[str],
+        verbose: bool = False,
+        base_url: str = BASE_URL,
+        pool_size: int = 10,
+        cache: Optional[ResponseCache] = None,
+        scheduler: Optional["KeyScheduler"] = None,
+        timeout: float = 30.0,
+        adaptive_timeout: bool = False,
+        min_timeout: float = 1.0,
+        timeout_multiplier: float = 4.0,
+        hedge: bool = False,
+        hedge_percentile: int = 95,
+        hedge_after: Optional[float] = None,
+        deadline: Optional[float] = None,
+        max_concurrency_per_key: Optional[int] = None
+    ):
         self.keys = [k for k in keys if k]  # Filter empty keys
 
         if not self.keys:
@@ -47,270 +604,2831 @@ class QuotaAwareGemini:
         self.error_counts = [0] * len(self.keys)
         self.verbose = verbose
         self.total_requests = 0
+        self.base_url = base_url.rstrip("/")
+        # Recent successful request latencies per key (seconds)
+        self.latencies = [deque(maxlen=1024) for _ in self.keys]
+
+        # Optional proactive rate limiting / key health (see KeyScheduler)
+        if scheduler is not None and scheduler.key_count != len(self.keys):
+            raise ValueError(f"KeyScheduler is for {scheduler.key_count} keys, got {len(self.keys)}")
+        self.scheduler = scheduler
+
+        # One pooled keep-alive session instead of a new connection per call
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Optional response cache; identical concurrent requests share one call
+        self.cache = cache
+        self.coalesced_requests = 0
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+
+        # Timeouts, hedging and per-call deadlines
+        self.timeout = timeout
+        self.adaptive_timeout = adaptive_timeout
+        self.min_timeout = min_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.hedge = hedge and len(self.keys) > 1
+        self.hedge_percentile = hedge_percentile
+        self.hedge_after = hedge_after
+        self.deadline = deadline
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+        self.deadlines_exceeded = 0
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        self._pool_size = pool_size
+
+        # Requests in flight per key, when limited (limit_keys() adds caps)
+        self.max_concurrency_per_key = max_concurrency_per_key
+        self._in_flight = [0] * len(self.keys)
+        self._key_caps: List[int] = []
+        self._key_room = threading.Condition()
+
+    def call(
+        self,
+        prompt: str,
+        model: str = "gemini-flash-latest",
+        deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Make an API call with automatic key rotation on quota errors.
+
+        Args:
+            prompt: The text prompt to send
+            model: Model name (default: gemini-flash-latest)
+            deadline: Seconds this call may take in total (default: self.deadline)
+
+        Returns:
+            Parsed JSON response from Gemini API
+
+        Raises:
+            Exception: If all keys are exhausted
+            DeadlineExceeded: If the deadline passes first
+        """
+        deadline_at = self._deadline_at(deadline)
+        return self._through_cache(
+            model, prompt, None,
+            lambda: self._request(self._endpoint(model), text_payload(prompt), decode_json, deadline_at)
+        )
+
+    def call_structured(
+        self,
+        prompt: str,
+        schema: Dict[str, Any],
+        model: str = "gemini-flash-latest",
+        deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Make an API call expecting structured JSON output.
+
+        Args:
+            prompt: The text prompt
+            schema: JSON Schema for response format
+            model: Model name
+            deadline: Seconds this call may take in total (default: self.deadline)
+
+        Returns:
+            Parsed JSON matching the schema
+        """
+        deadline_at = self._deadline_at(deadline)
+        return self._through_cache(
+            model, prompt, schema,
+            lambda: self._request(
+                self._endpoint(model), structured_payload(prompt, schema), decode_structured, deadline_at
+            )
+        )
+
+    def stream_structured(
+        self,
+        prompt: str,
+        schema: Dict[str, Any],
+        model: str = "gemini-flash-latest",
+        deadline: Optional[float] = None
+    ) -> Iterator[Any]:
+        """
+        Structured call over streamGenerateContent, yielding results as they arrive.
 
-    def call(self, prompt: str, model: str = "gemini-flash-latest") -> Dict[str, Any]:
+        For an array schema each element is yielded as soon as its JSON is
+        complete, before the rest of the response has been generated; any
+        other schema yields its single value at the end. Retries and key
+        rotation apply until the stream opens; a failure mid-stream raises.
+
+        Args:
+            prompt: The text prompt
+            schema: JSON Schema for response format (usually {"type": "array", ...})
+            model: Model name
+            deadline: Seconds allowed until the stream opens (default: self.deadline)
+
+        Yields:
+            Parsed array elements (or the single parsed value)
+        """
+        key = ResponseCache.make_key(model, prompt, schema) if self.cache is not None else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield from (cached if schema.get("type") == "array" else [cached])
+                return
+
+        response = self._request(
+            self._stream_endpoint(model), structured_payload(prompt, schema), decode_stream,
+            self._deadline_at(deadline), stream=True
+        )
+        parser = JSONArrayStream()
+        items = []
+        with response:
+            for chunk in iter_sse_events(response):
+                for item in parser.feed(_candidate_text(chunk)):
+                    items.append(item)
+                    yield item
+        for item in parser.close():
+            items.append(item)
+            yield item
+
+        if key is not None:
+            self.cache.put(key, items if parser.is_array else items[0])
+
+    def _request(
+        self,
+        endpoint: str,
+        payload: Dict[str, Any],
+        decode: Callable[[requests.Response], Any],
+        deadline_at: Optional[float] = None,
+        stream: bool = False
+    ) -> Any:
+        """
+        POST payload with key rotation, backoff, error counting and deadlines.
+
+        This is the request loop of both clients: AsyncQuotaAwareGemini runs
+        it on its thread pool.
+
+        Args:
+            endpoint: generateContent or streamGenerateContent URL
+            payload: Request body
+            decode: Turns the successful response into the return value
+            deadline_at: Monotonic time the whole call must finish by (see _deadline_at)
+            stream: Don't read the body up front (decode gets an open response)
+
+        Returns:
+            decode(response)
+        """
+        attempts = 0
+        tokens = estimate_tokens(json.dumps(payload["contents"]))
+
+        while attempts < self._max_attempts():
+            index, holds_slot = self._acquire_key(tokens, deadline_at)
+            key_label = f"Key {index + 1}/{len(self.keys)}"
+
+            response = None
+            try:
+                # May answer from a hedged duplicate on another key
+                slot = index if holds_slot else None
+                try:
+                    response, index = self._send(index, endpoint, payload, deadline_at, stream)
+                finally:
+                    if slot is not None:
+                        self._release_key(slot)
+                key_label = f"Key {index + 1}/{len(self.keys)}"
+
+                # Handle quota exhaustion (429 Too Many Requests)
+                if response.status_code == 429:
+                    self._key_failed(index, response)
+                    if self.verbose:
+                        print(f"   {key_label} quota exceeded (429), rotating...")
+
+                # Handle server errors
+                elif response.status_code >= 500:
+                    self._key_failed(index, response)
+                    if self.verbose:
+                        print(f"   {key_label} server error ({response.status_code}), rotating...")
+
+                else:
+                    # Raise for other errors (4xx except 429)
+                    response.raise_for_status()
+
+                    # Success
+                    self._key_succeeded(index, response)
+
+                    if self.verbose:
+                        print(f"   {key_label} request #{self.total_requests} successful")
+
+                    result = decode(response)
+                    # A streamed response now belongs to the caller
+                    response = None
+                    return result
+
+            except requests.exceptions.RequestException as e:
+                self._key_failed(index)
+                if self.verbose:
+                    print(f"   {key_label} request failed: {e}")
+
+            finally:
+                # Release the pooled connection of every failed attempt
+                # before backing off; streamed bodies are never read
+                if response is not None:
+                    response.close()
+
+            attempts += 1
+            self._backoff(attempts, deadline_at)
+
+        self._check_deadline(deadline_at)
+        raise Exception(
+            f"All {len(self.keys)} API keys exhausted or failed after {attempts} attempts. "
+            "Try again in 1 minute for quota reset."
+        )
+
+    def _through_cache(
+        self,
+        model: str,
+        prompt: str,
+        schema: Optional[Dict[str, Any]],
+        fetch: Callable[[], Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Serve from the cache, join an identical in-flight request, or fetch."""
+        if self.cache is None:
+            return fetch()
+
+        key = ResponseCache.make_key(model, prompt, schema)
+        cached, future, owner = self._join_inflight(key)
+        if cached is not None:
+            return cached
+        if not owner:
+            return future.result()
+
+        try:
+            value = fetch()
+        except BaseException as e:
+            self._settle_inflight(key, future, error=e)
+            raise
+        self._settle_inflight(key, future, value)
+        return value
+
+    def _join_inflight(self, key: str) -> Tuple[Optional[Any], Optional[Future], bool]:
+        """
+        Look a request up in the cache and among identical requests in flight.
+
+        Returns:
+            (cached value, None, False) on a hit; otherwise (None, future, owner)
+            where the owner must fetch and _settle_inflight() the future, and
+            everyone else waits for it
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced_requests += 1
+                return None, future, False
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached, None, False
+            future = self._inflight[key] = Future()
+            return None, future, True
+
+    def _settle_inflight(self, key: str, future: Future, value: Any = None, error: Optional[BaseException] = None):
+        """Cache a fetched value (unless it failed) and hand the outcome to waiting callers."""
+        try:
+            if error is None:
+                self.cache.put(key, value)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def _max_attempts(self) -> int:
+        """Attempts per call: each key once, or a few waits on a single scheduled key."""
+        if self.scheduler is None:
+            return len(self.keys)
+        return max(len(self.keys), 3)
+
+    def _acquire_key(self, tokens: int, deadline_at: Optional[float] = None) -> Tuple[int, bool]:
+        """
+        Pick the key for the next attempt, waiting for rate-limit headroom or a free slot if needed.
+
+        Returns:
+            (key index, whether the attempt holds a slot to _release_key afterwards)
+        """
+        self._check_deadline(deadline_at)
+        if self.scheduler is None:
+            index = self._reserve_key(deadline_at)
+            return (self.current_index, False) if index is None else (index, True)
+        index, delay = self.scheduler.reserve(tokens)
+        if delay > 0:
+            if deadline_at is not None and time.monotonic() + delay >= deadline_at:
+                self.scheduler.release(index)
+                self._deadline_exceeded()
+            time.sleep(delay)
+        return index, False
+
+    @contextmanager
+    def limit_keys(self, max_concurrency_per_key: int):
+        """
+        Cap the requests in flight per key while the block runs.
+
+        The tightest of this cap, any other active limit_keys() cap and
+        self.max_concurrency_per_key applies to every call on this client,
+        so concurrent callers spread over the keys instead of all sending on
+        the current one. A KeyScheduler, if set, still picks the keys.
+        """
+        if max_concurrency_per_key < 1:
+            raise ValueError("max_concurrency_per_key must be at least 1")
+        with self._key_room:
+            self._key_caps.append(max_concurrency_per_key)
+        try:
+            yield self
+        finally:
+            with self._key_room:
+                self._key_caps.remove(max_concurrency_per_key)
+                self._key_room.notify_all()
+
+    def _key_cap(self) -> Optional[int]:
+        """Requests allowed in flight per key right now (None = unlimited)."""
+        caps = self._key_caps if self.max_concurrency_per_key is None else [self.max_concurrency_per_key, *self._key_caps]
+        return min(caps) if caps else None
+
+    def _reserve_key(self, deadline_at: Optional[float]) -> Optional[int]:
+        """The current key, or the next one with a free slot, waiting until one has room (None = unlimited)."""
+        with self._key_room:
+            while True:
+                cap = self._key_cap()
+                if cap is None:
+                    return None
+                for offset in range(len(self.keys)):
+                    index = (self.current_index + offset) % len(self.keys)
+                    if self._in_flight[index] < cap:
+                        self._in_flight[index] += 1
+                        return index
+                timeout = None if deadline_at is None else deadline_at - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    self._deadline_exceeded()
+                self._key_room.wait(timeout)
+
+    def _release_key(self, index: int):
+        """Free the slot an attempt held on a key."""
+        with self._key_room:
+            self._in_flight[index] -= 1
+            self._key_room.notify()
+
+    # ---- deadlines ----
+
+    def _deadline_at(self, deadline: Optional[float]) -> Optional[float]:
+        """Monotonic time a call must finish by (None = no deadline)."""
+        if deadline is None:
+            deadline = self.deadline
+        return None if deadline is None else time.monotonic() + deadline
+
+    def _check_deadline(self, deadline_at: Optional[float]):
+        if deadline_at is not None and time.monotonic() >= deadline_at:
+            self._deadline_exceeded()
+
+    def _deadline_exceeded(self):
+        self.deadlines_exceeded += 1
+        raise DeadlineExceeded("Call deadline exceeded before any API key answered")
+
+    # ---- timeouts and hedging ----
+
+    def _recent_latency(self, percentile: int) -> Optional[float]:
+        """Latency percentile (seconds) over all keys' recent requests, once enough are seen."""
+        samples = sorted(itertools.chain.from_iterable(self.latencies))
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, len(samples) * percentile // 100)]
+
+    def _attempt_timeout(self, deadline_at: Optional[float]) -> float:
+        """Per-attempt timeout: flat or adaptive, never past the call deadline."""
+        timeout = self.timeout
+        if self.adaptive_timeout:
+            p99 = self._recent_latency(99)
+            if p99 is not None:
+                timeout = min(self.timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+        if deadline_at is not None:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                self._deadline_exceeded()
+            timeout = min(timeout, remaining)
+        return timeout
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Seconds to wait on a request before hedging it (None = don't hedge yet)."""
+        if self.hedge_after is not None:
+            return self.hedge_after
+        return self._recent_latency(self.hedge_percentile)
+
+    def _post_once(
+        self,
+        index: int,
+        endpoint: str,
+        payload: Dict[str, Any],
+        timeout: float,
+        stream: bool = False
+    ) -> requests.Response:
+        """One POST on one key."""
+        return self.session.post(
+            endpoint,
+            headers={
+                "x-goog-api-key": self.keys[index],
+                "Content-Type": "application/json"
+            },
+            json=payload,
+            timeout=timeout,
+            stream=stream
+        )
+
+    def _send(
+        self,
+        index: int,
+        endpoint: str,
+        payload: Dict[str, Any],
+        deadline_at: Optional[float],
+        stream: bool = False
+    ) -> Tuple[requests.Response, int]:
+        """
+        POST payload on a key, hedging onto a second key if it is slow.
+
+        Returns:
+            (response, index of the key that produced it). The caller records
+            the outcome for that key; a hedge loser is recorded when it lands.
+
+        Raises:
+            requests.exceptions.RequestException: If the request (and any hedge) failed
+        """
+        timeout = self._attempt_timeout(deadline_at)
+        # A stream is consumed after _send returns, so it is never hedged
+        hedge_delay = self._hedge_delay() if self.hedge and not stream else None
+        if hedge_delay is None or hedge_delay >= timeout:
+            return self._post_once(index, endpoint, payload, timeout, stream), index
+
+        if self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(
+                max_workers=2 * self._pool_size, thread_name_prefix="gemini-hedge"
+            )
+        primary = self._hedge_executor.submit(self._post_once, index, endpoint, payload, timeout)
+        done, _ = wait([primary], timeout=hedge_delay)
+        if done:
+            return primary.result(), index
+
+        backup_index = self._backup_key(index, payload)
+        if backup_index is None:
+            return primary.result(), index
+
+        self.hedged_requests += 1
+        backup = self._hedge_executor.submit(
+            self._post_once, backup_index, endpoint, payload, self._attempt_timeout(deadline_at)
+        )
+        keys = {primary: index, backup: backup_index}
+        winner = primary
+        for future in as_completed(keys):
+            if _usable_response(future):
+                winner = future
+                break
+
+        for future, key_index in keys.items():
+            if future is not winner:
+                future.add_done_callback(partial(self._settle_hedge, key_index))
+        if winner is backup:
+            self.hedge_wins += 1
+        return winner.result(), keys[winner]
+
+    def _backup_key(self, index: int, payload: Dict[str, Any]) -> Optional[int]:
+        """A different key that can take a hedged request right now, if any."""
+        if self.scheduler is None:
+            return (index + 1) % len(self.keys)
+        return self.scheduler.try_reserve(estimate_tokens(json.dumps(payload["contents"])), exclude=index)
+
+    def _settle_hedge(self, index: int, future: Future):
+        """Record the outcome of a hedged request nobody waited for."""
+        if _usable_response(future):
+            self._key_succeeded(index, future.result())
+        else:
+            self._key_failed(index, None if future.exception() else future.result())
+        if not future.exception():
+            future.result().close()
+
+    def _key_succeeded(self, index: int, response: requests.Response):
+        """Record a successful request on a key."""
+        self.request_counts[index] += 1
+        self.total_requests += 1
+        self.latencies[index].append(response.elapsed.total_seconds())
+        if self.scheduler is not None:
+            self.scheduler.record_success(index, _used_tokens(response))
+
+    def _key_failed(self, index: int, response: Optional[requests.Response] = None):
+        """Record a failed request on a key and move away from it."""
+        self.error_counts[index] += 1
+        if self.scheduler is not None:
+            throttled = response is not None and response.status_code == 429
+            self.scheduler.record_failure(index, _retry_after(response), throttled)
+        # Concurrent failures on the same key rotate only once
+        if self.current_index == index:
+            self._rotate_key()
+
+    def latency_percentiles(self, index: int, percentiles: Sequence[int] = (50, 95, 99)) -> Dict[str, float]:
+        """Latency percentiles (ms) over a key's recent successful requests."""
+        samples = sorted(self.latencies[index])
+        if not samples:
+            return {}
+        result = {
+            f"p{p}": round(samples[min(len(samples) - 1, len(samples) * p // 100)] * 1000, 1)
+            for p in percentiles
+        }
+        result["samples"] = len(samples)
+        return result
+
+    def _endpoint(self, model: str) -> str:
+        """generateContent URL for a model."""
+        return f"{self.base_url}/models/{model}:generateContent"
+
+    def _stream_endpoint(self, model: str) -> str:
+        """streamGenerateContent URL (server-sent events) for a model."""
+        return f"{self.base_url}/models/{model}:streamGenerateContent?alt=sse"
+
+    def _rotate_key(self):
+        """Rotate to the next API key."""
+        self.current_index = (self.current_index + 1) % len(self.keys)
+
+    @staticmethod
+    def _backoff_delay(attempt: int) -> float:
+        """Exponential backoff schedule: 0.1s, 0.2s, 0.4s, ... capped at 2s."""
+        return min(0.1 * (2 ** (attempt - 1)), 2.0)
+
+    def _backoff(self, attempt: int, deadline_at: Optional[float] = None):
+        """Exponential backoff delay (the scheduler paces requests itself)."""
+        if self.scheduler is None:
+            delay = self._backoff_delay(attempt)
+            if deadline_at is not None:
+                delay = min(delay, max(0.0, deadline_at - time.monotonic()))
+            time.sleep(delay)
+
+    def close(self):
+        """Close pooled connections (and the hedging thread pool)."""
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        self.session.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get current API usage statistics."""
+        total_requests = sum(self.request_counts)
+        total_errors = sum(self.error_counts)
+
+        stats = {
+            "current_key": self.current_index + 1,
+            "total_keys": len(self.keys),
+            "request_counts": self.request_counts.copy(),
+            "error_counts": self.error_counts.copy(),
+            "total_requests": total_requests,
+            "total_errors": total_errors,
+            "success_rate": f"{((total_requests - total_errors) / total_requests * 100):.1f}%"
+                if total_requests > 0 else "N/A",
+            "latency_ms": [self.latency_percentiles(i) for i in range(len(self.keys))]
+        }
+        if self.scheduler is not None:
+            stats["scheduler"] = self.scheduler.get_stats()
+        if self.hedge:
+            stats["hedging"] = {"hedged": self.hedged_requests, "hedge_wins": self.hedge_wins}
+        if self.deadlines_exceeded:
+            stats["deadlines_exceeded"] = self.deadlines_exceeded
+        if self.cache is not None:
+            stats["cache"] = self.cache.get_stats()
+            stats["cache"]["coalesced"] = self.coalesced_requests
+        return stats
+
+    def print_stats(self):
+        """Print API usage statistics."""
+        stats = self.get_stats()
+
+        print("\n--- API Quota Stats ---")
+        print(f"   Current: Key {stats['current_key']}/{stats['total_keys']}")
+        print(f"   Total Requests: {stats['total_requests']}")
+        print(f"   Total Errors: {stats['total_errors']}")
+        print(f"   Success Rate: {stats['success_rate']}")
+        if "hedging" in stats:
+            print(f"   Hedged: {stats['hedging']['hedged']} requests, "
+                  f"{stats['hedging']['hedge_wins']} won by the hedge")
+        print("   Per-key breakdown:")
+        for i, (req, err) in enumerate(zip(stats['request_counts'], stats['error_counts'])):
+            latency = stats['latency_ms'][i]
+            timing = f", p50 {latency['p50']}ms / p95 {latency['p95']}ms" if latency else ""
+            print(f"     Key {i + 1}: {req} requests, {err} errors{timing}")
+        if "cache" in stats:
+            cache = stats["cache"]
+            print(f"   Cache: {cache['hits']} hits, {cache['misses']} misses, "
+                  f"{cache['coalesced']} coalesced ({cache['hit_rate']} hit rate)")
+        print("------------------------\n")
+
+
+class AsyncQuotaAwareGemini(QuotaAwareGemini):
+    """
+    asyncio variant of QuotaAwareGemini.
+
+    Each call runs the blocking client's request loop (_request) on a
+    dedicated thread pool of len(keys) x max_concurrency_per_key workers,
+    so the event loop never blocks and rotation, error counting, backoff,
+    per-attempt timeouts, hedging and deadlines are the blocking client's
+    own. Each key allows at most max_concurrency_per_key requests in flight
+    (hedged duplicates aside). Calls beyond the pool size wait for a worker
+    without blocking the loop, and that wait counts against their deadline.
+    Identical concurrent calls share one request through the same
+    in-flight table as the blocking client.
+
+    Usage:
+        async with AsyncQuotaAwareGemini(keys) as api:
+            results = await asyncio.gather(*(api.call(p) for p in prompts))
+    """
+
+    def __init__(
+        self,
+        keys: List[str],
+        verbose: bool = False,
+        base_url: str = QuotaAwareGemini.BASE_URL,
+        max_concurrency_per_key: int = 4,
+        cache: Optional[ResponseCache] = None,
+        scheduler: Optional["KeyScheduler"] = None,
+        timeout: float = 30.0,
+        adaptive_timeout: bool = False,
+        hedge: bool = False,
+        hedge_percentile: int = 95,
+        hedge_after: Optional[float] = None,
+        deadline: Optional[float] = None
+    ):
+        keys = [k for k in keys if k]
+        super().__init__(
+            keys, verbose, base_url,
+            pool_size=max(1, len(keys) * max_concurrency_per_key),
+            cache=cache,
+            scheduler=scheduler,
+            timeout=timeout,
+            adaptive_timeout=adaptive_timeout,
+            hedge=hedge,
+            hedge_percentile=hedge_percentile,
+            hedge_after=hedge_after,
+            deadline=deadline,
+            max_concurrency_per_key=max_concurrency_per_key
+        )
+        self._workers = len(self.keys) * max_concurrency_per_key
+        self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="gemini")
+        # Created on first use so it binds to the running event loop
+        self._capacity: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> "AsyncQuotaAwareGemini":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close pooled connections and the request thread pool."""
+        self._executor.shutdown(wait=False)
+        super().close()
+
+    async def call(
+        self,
+        prompt: str,
+        model: str = "gemini-flash-latest",
+        deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
         """
         Make an API call with automatic key rotation on quota errors.
 
         Args:
             prompt: The text prompt to send
             model: Model name (default: gemini-flash-latest)
+            deadline: Seconds this call may take in total (default: self.deadline)
 
         Returns:
             Parsed JSON response from Gemini API
 
-        Raises:
-            Exception: If all keys are exhausted
-        """
-        attempts = 0
-        endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+        Raises:
+            Exception: If all keys are exhausted
+            DeadlineExceeded: If the deadline passes first
+        """
+        deadline_at = self._deadline_at(deadline)
+        return await self._through_cache_async(
+            model, prompt, None, deadline_at,
+            partial(self._request, self._endpoint(model), text_payload(prompt), decode_json, deadline_at)
+        )
+
+    async def call_structured(
+        self,
+        prompt: str,
+        schema: Dict[str, Any],
+        model: str = "gemini-flash-latest",
+        deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Make an API call expecting structured JSON output.
+
+        Args:
+            prompt: The text prompt
+            schema: JSON Schema for response format
+            model: Model name
+            deadline: Seconds this call may take in total (default: self.deadline)
+
+        Returns:
+            Parsed JSON matching the schema
+        """
+        deadline_at = self._deadline_at(deadline)
+        return await self._through_cache_async(
+            model, prompt, schema, deadline_at,
+            partial(
+                self._request, self._endpoint(model), structured_payload(prompt, schema),
+                decode_structured, deadline_at
+            )
+        )
+
+    async def _through_cache_async(
+        self,
+        model: str,
+        prompt: str,
+        schema: Optional[Dict[str, Any]],
+        deadline_at: Optional[float],
+        fetch: Callable[[], Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """_through_cache(), awaiting the shared request instead of blocking on it."""
+        if self.cache is None:
+            return await self._in_thread(fetch, deadline_at)
+
+        key = ResponseCache.make_key(model, prompt, schema)
+        cached, future, owner = self._join_inflight(key)
+        if cached is not None:
+            return cached
+        if owner:
+            # A task, so one cancelled caller doesn't abandon the shared request
+            asyncio.ensure_future(self._fill_inflight(key, future, fetch, deadline_at))
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    async def _fill_inflight(self, key: str, future: Future, fetch: Callable[[], Any], deadline_at: Optional[float]):
+        """Fetch on the thread pool and settle the in-flight future (which carries any error)."""
+        try:
+            value = await self._in_thread(fetch, deadline_at)
+        except BaseException as e:
+            self._settle_inflight(key, future, error=e)
+        else:
+            try:
+                self._settle_inflight(key, future, value)
+            except Exception:
+                pass  # The cache error is already on the future
+
+    async def _in_thread(self, fetch: Callable[[], Any], deadline_at: Optional[float]) -> Any:
+        """Run a blocking request on the pool once a worker is free, by the deadline."""
+        if self._capacity is None:
+            self._capacity = asyncio.Semaphore(self._workers)
+        await self._acquire_within(self._capacity, deadline_at)
+        loop = asyncio.get_running_loop()
+        job = self._executor.submit(fetch)
+
+        def release(_):
+            # The worker is busy until the request returns, even if the caller stopped waiting
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._capacity.release)
+
+        job.add_done_callback(release)
+        return await asyncio.wrap_future(job)
+
+    async def _acquire_within(self, semaphore: asyncio.Semaphore, deadline_at: Optional[float]):
+        """Acquire a semaphore, raising DeadlineExceeded if the deadline passes first."""
+        self._check_deadline(deadline_at)
+        if deadline_at is None or not semaphore.locked():
+            await semaphore.acquire()
+            return
+        try:
+            await asyncio.wait_for(semaphore.acquire(), deadline_at - time.monotonic())
+        except asyncio.TimeoutError:
+            self._deadline_exceeded()
+
+
+def create_from_env(verbose: bool = False) -> QuotaAwareGemini:
+    """
+    Create QuotaAwareGemini from environment variables.
+    Looks for GEMINI_KEY_1, GEMINI_KEY_2, etc.
+    Falls back to GEMINI_API_KEY if no numbered keys found.
+    Enables the response cache if GEMINI_CACHE_PATH is set.
+    """
+    keys = []
+
+    # Collect numbered keys
+    for i in range(1, 11):
+        key = os.getenv(f"GEMINI_KEY_{i}")
+        if key:
+            keys.append(key)
+
+    # Fallback to single key
+    if not keys:
+        single_key = os.getenv("GEMINI_API_KEY")
+        if single_key:
+            print("   No GEMINI_KEY_* found, using single GEMINI_API_KEY")
+            keys.append(single_key)
+
+    if not keys:
+        raise ValueError(
+            "No API keys found. Set GEMINI_KEY_1, GEMINI_KEY_2, ... "
+            "or GEMINI_API_KEY environment variables."
+        )
+
+    cache = None
+    cache_path = os.getenv("GEMINI_CACHE_PATH")
+    if cache_path:
+        cache = ResponseCache(cache_path)
+        print(f"   Response cache: {cache_path}")
+
+    print(f"   QuotaAwareGemini initialized with {len(keys)} key(s)")
+    return QuotaAwareGemini(keys, verbose=verbose, cache=cache)
+
+
+# ============================================
+# RULE COMPILATION
+# Validate generated condition_code once, reuse the compiled function
+# ============================================
+
+class RuleCompileError(ValueError):
+    """Raised when generated condition_code is not an allowed expression."""
+
+
+# AST nodes a generated condition may contain. Anything else (lambdas,
+# comprehensions, walrus, f-strings, ...) is rejected before compilation.
+ALLOWED_NODES = (
+    ast.Expression, ast.Load,
+    ast.BoolOp, ast.And, ast.Or,
+    ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+    ast.In, ast.NotIn, ast.Is, ast.IsNot,
+    ast.IfExp, ast.Call, ast.Attribute, ast.Subscript, ast.Slice, ast.Name, ast.Constant,
+    ast.List, ast.Tuple, ast.Set,
+)
+
+# Largest exponent allowed in `x ** n`. n must be a numeric literal and x
+# may not contain another power, so (9 ** 64) ** 64 is rejected.
+MAX_EXPONENT = 64
+
+# Largest integer factor a condition may multiply by. Together with the
+# ban on repeating str/list literals, this keeps `'x' * 10 ** 9`-style
+# conditions from allocating huge sequences.
+MAX_REPEAT = 10_000
+
+# Method calls allowed in a condition: ctx.get plus common string helpers
+ALLOWED_METHODS = frozenset({"get", "lower", "upper", "strip", "startswith", "endswith"})
+
+
+@dataclass(frozen=True)
+class CompiledCondition:
+    """A validated condition and the native function compiled from it"""
+    source: str
+    tree: ast.Expression
+    code: CodeType
+    func: Callable[[Dict[str, Any]], bool]
+
+
+def _validate_condition(tree: ast.Expression, source: str):
+    """Reject any node outside the whitelist."""
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise RuleCompileError(
+                f"{type(node).__name__} is not allowed in condition: {source}"
+            )
+        if isinstance(node, ast.Name) and node.id != "ctx":
+            raise RuleCompileError(f"Unknown name '{node.id}' in condition: {source}")
+        if isinstance(node, ast.Attribute) and node.attr not in ALLOWED_METHODS:
+            raise RuleCompileError(f"Attribute '{node.attr}' is not allowed in condition: {source}")
+        if isinstance(node, ast.Call) and not isinstance(node.func, ast.Attribute):
+            raise RuleCompileError(f"Only method calls are allowed in condition: {source}")
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            exponent = _constant_number(node.right)
+            if exponent is None or abs(exponent) > MAX_EXPONENT:
+                raise RuleCompileError(
+                    f"Exponent must be a number between -{MAX_EXPONENT} and {MAX_EXPONENT} in condition: {source}"
+                )
+            if any(isinstance(inner, ast.BinOp) and isinstance(inner.op, ast.Pow) for inner in ast.walk(node.left)):
+                raise RuleCompileError(f"Nested powers are not allowed in condition: {source}")
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mult):
+            if _is_sequence_literal(node.left) or _is_sequence_literal(node.right):
+                raise RuleCompileError(f"Repeating a literal sequence is not allowed in condition: {source}")
+            if _repeat_bound(node) > MAX_REPEAT:
+                raise RuleCompileError(
+                    f"Integer factors may multiply to at most {MAX_REPEAT} in condition: {source}"
+                )
+
+
+def _is_sequence_literal(node: ast.expr) -> bool:
+    """Whether node is a str/bytes literal or a list, tuple or set display."""
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, (str, bytes))
+    return isinstance(node, (ast.List, ast.Tuple, ast.Set))
+
+
+def _repeat_bound(node: ast.expr) -> int:
+    """
+    Upper bound on the integer factor node's constants can scale a value by.
+
+    Context values count as 1: a field's own size is the caller's data.
+    Comparisons yield a bool, and floats can't repeat a sequence.
+    """
+    if isinstance(node, ast.Constant):
+        return abs(int(node.value)) if isinstance(node.value, int) else 1
+    if isinstance(node, ast.Compare):
+        return 1
+    if isinstance(node, ast.BinOp):
+        left, right = _repeat_bound(node.left), _repeat_bound(node.right)
+        if isinstance(node.op, ast.Mult):
+            return left * right
+        if isinstance(node.op, (ast.Add, ast.Sub)):
+            return left + right
+        if isinstance(node.op, ast.Pow):
+            # Validation allows only a literal exponent within MAX_EXPONENT
+            exponent = _constant_number(node.right)
+            return left ** int(exponent) if exponent >= 1 else 1
+        if isinstance(node.op, ast.Div):
+            return 1
+        return left
+    return max((_repeat_bound(child) for child in ast.iter_child_nodes(node) if isinstance(child, ast.expr)), default=1)
+
+
+def _constant_number(node: ast.expr) -> Optional[Union[int, float]]:
+    """The value of a numeric literal such as 2, -0.5 or +3, else None."""
+    sign = 1
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        sign = -1 if isinstance(node.op, ast.USub) else 1
+        node = node.operand
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return sign * node.value
+    return None
+
+
+@lru_cache(maxsize=10_000)
+def compile_condition(source: str) -> CompiledCondition:
+    """
+    Validate and compile a condition expression into a native function.
+
+    The expression is parsed and checked against ALLOWED_NODES once, then
+    wrapped as `lambda ctx: <expression>` so evaluating a rule is a plain
+    function call instead of an eval() of the source string. Results are
+    cached by source text, so identical generated rules share one function.
+
+    Args:
+        source: Python expression using the ctx.get('field') pattern
+
+    Returns:
+        CompiledCondition holding the validated AST, code object and function
+
+    Raises:
+        RuleCompileError: If the expression is invalid or not allowed
+    """
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError as e:
+        raise RuleCompileError(f"Invalid condition syntax: {e.msg}: {source}") from e
+
+    _validate_condition(tree, source)
+
+    wrapper = ast.Expression(body=ast.Lambda(
+        args=ast.arguments(
+            posonlyargs=[], args=[ast.arg(arg="ctx")],
+            kwonlyargs=[], kw_defaults=[], defaults=[]
+        ),
+        body=tree.body
+    ))
+    ast.fix_missing_locations(wrapper)
+    code = compile(wrapper, "<condition>", "eval")
+    func = eval(code, {"__builtins__": {}})
+
+    return CompiledCondition(source=source, tree=tree, code=code, func=func)
+
+
+def make_condition(code: str) -> Callable[[Dict[str, Any]], bool]:
+    """Create a condition function from code string."""
+    return compile_condition(code).func
+
+
+class ContextLookup(NamedTuple):
+    """A read of one context field in a condition"""
+    field: str
+    default: Optional[ast.expr]   # ctx.get's default expression; None if absent
+    subscript: bool               # ctx['field'] rather than ctx.get(...)
+
+    @property
+    def constant_default(self) -> bool:
+        """Whether the default is absent or a literal constant."""
+        return self.default is None or isinstance(self.default, ast.Constant)
+
+    @property
+    def default_value(self) -> Any:
+        """The literal default (None when absent); only valid with constant_default."""
+        return None if self.default is None else self.default.value
+
+
+def _is_ctx(node: ast.expr) -> bool:
+    return isinstance(node, ast.Name) and node.id == "ctx"
+
+
+def context_lookup(node: ast.expr, subscripts: bool = False) -> Optional[ContextLookup]:
+    """
+    Match ctx.get('field') / ctx.get('field', default), and ctx['field'] if subscripts.
+
+    The field name must be a string constant. Every module that reads
+    conditions field by field (index, batch, sessions, analysis, codegen,
+    typed facts) recognises lookups with this one function.
+
+    Returns:
+        ContextLookup, or None if node is not such a lookup
+    """
+    if isinstance(node, ast.Call):
+        if not (
+            isinstance(node.func, ast.Attribute)
+            and node.func.attr == "get"
+            and _is_ctx(node.func.value)
+            and not node.keywords
+            and 1 <= len(node.args) <= 2
+            and isinstance(node.args[0], ast.Constant)
+            and isinstance(node.args[0].value, str)
+        ):
+            return None
+        return ContextLookup(node.args[0].value, node.args[1] if len(node.args) == 2 else None, False)
+    if (
+        subscripts
+        and isinstance(node, ast.Subscript)
+        and _is_ctx(node.value)
+        and isinstance(node.slice, ast.Constant)
+        and isinstance(node.slice.value, str)
+    ):
+        return ContextLookup(node.slice.value, None, True)
+    return None
+
+
+_FORMATTER = string.Formatter()
+_CONVERSIONS = {None: None, "s": str, "r": repr, "a": ascii}
+_MISSING = object()
+
+
+def _format_each_call(template: str) -> Callable[[Dict[str, Any]], str]:
+    """Render with str.format on every call (templates compile_template can't pre-parse)."""
+    def action(ctx: Dict[str, Any]) -> str:
+        # Format with context values
+        try:
+            return template.format(**ctx)
+        except KeyError:
+            return template
+    return action
+
+
+# Render function -> the template it was compiled from (see template_source)
+_TEMPLATE_SOURCES: "weakref.WeakKeyDictionary[Callable, str]" = weakref.WeakKeyDictionary()
+
+
+@lru_cache(maxsize=10_000)
+def compile_template(template: str) -> Callable[[Dict[str, Any]], str]:
+    """
+    Pre-parse an action_message template into a render function.
+
+    Same result as template.format(**ctx) (and the template itself when a
+    field is missing), but the template is scanned once here instead of on
+    every call, and the context isn't unpacked into keyword arguments.
+    Templates using positional, attribute, index or nested fields fall back
+    to str.format.
+    """
+    render = _parse_template(template)
+    _TEMPLATE_SOURCES[render] = template
+    return render
+
+
+def template_source(func: Callable[[Dict[str, Any]], str]) -> Optional[str]:
+    """The template a compile_template() function renders, or None for any other function."""
+    try:
+        return _TEMPLATE_SOURCES.get(func)
+    except TypeError:  # not weak-referenceable, so not a compiled template
+        return None
+
+
+def _parse_template(template: str) -> Callable[[Dict[str, Any]], str]:
+    try:
+        parsed = list(_FORMATTER.parse(template))
+    except ValueError:
+        # Malformed: let every render raise the same error str.format would
+        return _format_each_call(template)
+
+    parts = []
+    for literal, field, spec, conversion in parsed:
+        if field is not None and (not field.isidentifier() or "{" in spec or conversion not in _CONVERSIONS):
+            return _format_each_call(template)
+        parts.append((literal, field, spec, _CONVERSIONS.get(conversion)))
+
+    if all(field is None for _, field, _, _ in parts):
+        text = "".join(literal for literal, _, _, _ in parts)
+        return lambda ctx: text
+
+    def action(ctx: Dict[str, Any]) -> str:
+        out = []
+        for literal, field, spec, convert in parts:
+            out.append(literal)
+            if field is None:
+                continue
+            value = ctx.get(field, _MISSING)
+            if value is _MISSING:
+                return template
+            if convert is not None:
+                value = convert(value)
+            out.append(format(value, spec))
+        return "".join(out)
+    return action
+
+
+def make_action(template: str) -> Callable[[Dict[str, Any]], str]:
+    """Create an action function from message template."""
+    return compile_template(template)
+
+
+# ============================================
+# INSTRUMENTATION
+# Per-rule counters and timing histograms
+# ============================================
+
+# Histogram bucket upper bounds in seconds (Prometheus "le" labels)
+METRIC_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 1e-2, 0.1)
+
+
+class _RuleStats:
+    """Counters and histograms for one rule name"""
+    __slots__ = (
+        "evaluations", "matches", "errors",
+        "condition_buckets", "condition_seconds", "action_buckets", "action_seconds", "actions"
+    )
+
+    def __init__(self, bucket_count: int):
+        self.evaluations = 0
+        self.matches = 0
+        self.errors = 0
+        # One slot per bucket plus +Inf; cumulated on export
+        self.condition_buckets = [0] * (bucket_count + 1)
+        self.condition_seconds = 0.0
+        self.action_buckets = [0] * (bucket_count + 1)
+        self.action_seconds = 0.0
+        self.actions = 0
+
+
+class RuleMetrics:
+    """
+    Per-rule metrics collected by an instrumented LogicEngine.
+
+    For every condition evaluate() runs, under any strategy, the rule's
+    evaluation count and condition time are recorded, plus matches, errors
+    and action time when it fires. match() and EvaluationSession record
+    the conditions they run the same way, without action time (their
+    actions render on demand). evaluate_batch() and evaluate_many() work on
+    whole columns or in other processes and record nothing. Samples from
+    one evaluation are merged under a lock, so one RuleMetrics can be
+    shared by threads and engines.
+
+    Export with snapshot() (plain dict) or to_prometheus() (text format).
+    """
+
+    def __init__(self, buckets: Sequence[float] = METRIC_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._rules: Dict[str, _RuleStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, samples: List[Tuple[str, float, bool, bool, Optional[float]]]):
+        """
+        Merge the samples of one evaluation.
+
+        Args:
+            samples: (rule name, condition seconds, fired, error, action seconds or None)
+        """
+        buckets = self.buckets
+        with self._lock:
+            for name, condition_time, fired, error, action_time in samples:
+                stats = self._rules.get(name)
+                if stats is None:
+                    stats = self._rules[name] = _RuleStats(len(buckets))
+                stats.evaluations += 1
+                stats.condition_buckets[bisect.bisect_left(buckets, condition_time)] += 1
+                stats.condition_seconds += condition_time
+                if fired:
+                    stats.matches += 1
+                if error:
+                    stats.errors += 1
+                if action_time is not None:
+                    stats.actions += 1
+                    stats.action_buckets[bisect.bisect_left(buckets, action_time)] += 1
+                    stats.action_seconds += action_time
+
+    def reset(self):
+        """Drop all collected metrics."""
+        with self._lock:
+            self._rules = {}
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return {rule name: counters and timing summaries}."""
+        with self._lock:
+            return {
+                name: {
+                    "evaluations": stats.evaluations,
+                    "matches": stats.matches,
+                    "errors": stats.errors,
+                    "condition_seconds": stats.condition_seconds,
+                    "action_seconds": stats.action_seconds,
+                    "mean_condition_us": stats.condition_seconds / stats.evaluations * 1e6,
+                    "condition_buckets": dict(zip(self._labels(), itertools.accumulate(stats.condition_buckets))),
+                    "action_buckets": dict(zip(self._labels(), itertools.accumulate(stats.action_buckets))),
+                }
+                for name, stats in self._rules.items()
+            }
+
+    def slowest(self, count: int = 10) -> List[Tuple[str, float]]:
+        """Rules with the most total condition + action time, as (name, seconds)."""
+        with self._lock:
+            totals = [(name, s.condition_seconds + s.action_seconds) for name, s in self._rules.items()]
+        return sorted(totals, key=lambda item: item[1], reverse=True)[:count]
+
+    def to_prometheus(self, prefix: str = "logic_engine") -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            rules = [(_prometheus_label(name), stats) for name, stats in self._rules.items()]
+        labels = self._labels()
+        lines = []
+
+        for metric, attribute, text in (
+            ("rule_evaluations_total", "evaluations", "Conditions evaluated"),
+            ("rule_matches_total", "matches", "Conditions that fired (including errors)"),
+            ("rule_errors_total", "errors", "Conditions or actions that raised"),
+        ):
+            lines.append(f"# HELP {prefix}_{metric} {text}.")
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+            for name, stats in rules:
+                lines.append(f'{prefix}_{metric}{{rule="{name}"}} {getattr(stats, attribute)}')
+
+        for metric, kind, text in (
+            ("rule_condition_seconds", "condition", "Condition evaluation time"),
+            ("rule_action_seconds", "action", "Action rendering time"),
+        ):
+            lines.append(f"# HELP {prefix}_{metric} {text}.")
+            lines.append(f"# TYPE {prefix}_{metric} histogram")
+            for name, stats in rules:
+                counts = list(itertools.accumulate(getattr(stats, f"{kind}_buckets")))
+                for label, count in zip(labels, counts):
+                    lines.append(f'{prefix}_{metric}_bucket{{rule="{name}",le="{label}"}} {count}')
+                lines.append(f'{prefix}_{metric}_sum{{rule="{name}"}} {getattr(stats, f"{kind}_seconds")!r}')
+                lines.append(f'{prefix}_{metric}_count{{rule="{name}"}} {counts[-1]}')
+
+        return "\n".join(lines) + "\n"
+
+    def _labels(self) -> List[str]:
+        return [repr(float(bound)) for bound in self.buckets] + ["+Inf"]
+
+
+def _timed_condition(rule: "Rule", position: int, context: Dict[str, Any], samples: Dict[int, list]) -> bool:
+    """
+    Run rule.condition(context) and store its RuleMetrics sample under position.
+
+    The sample is a list so the caller can fill in action time (and an
+    action error) before passing the samples to RuleMetrics.record().
+    Exceptions from the condition are recorded, then re-raised.
+    """
+    started = time.perf_counter()
+    try:
+        fired = bool(rule.condition(context))
+    except Exception:
+        samples[position] = [rule.name, time.perf_counter() - started, True, True, None]
+        raise
+    samples[position] = [rule.name, time.perf_counter() - started, fired, False, None]
+    return fired
+
+
+def _prometheus_label(value: str) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+# ============================================
+# LOGIC ENGINE (from solution.py)
+# ============================================
+
+@dataclass
+class Rule:
+    """A single business rule"""
+    name: str
+    condition: Callable[[Dict[str, Any]], bool]
+    action: Callable[[Dict[str, Any]], str]
+    # Source form for generated rules (see RULE_SCHEMA); None for hand-written lambdas
+    condition_code: Optional[str] = None
+    action_message: Optional[str] = None
+    # Context fields the condition reads; derived from condition_code when None
+    fields: Optional[FrozenSet[str]] = None
+    # Conflict resolution: higher priority fires first; one winner per group
+    # with the "best-per-group" strategy
+    priority: int = 0
+    group: Optional[str] = None
+
+    def to_definition(self) -> Dict[str, Any]:
+        """Return the RULE_SCHEMA form of this rule (plus priority, group and explicit fields)."""
+        if self.condition_code is None or self.action_message is None:
+            raise ValueError(
+                f"Rule '{self.name}' has no condition_code/action_message; "
+                "only rules built from RULE_SCHEMA definitions can be serialized"
+            )
+        definition = {
+            "name": self.name,
+            "condition_code": self.condition_code,
+            "action_message": self.action_message
+        }
+        if self.priority:
+            definition["priority"] = self.priority
+        if self.group is not None:
+            definition["group"] = self.group
+        if self.fields is not None:
+            definition["fields"] = sorted(self.fields)
+        return definition
+
+    def __reduce__(self):
+        # Closures can't be pickled: ship the source form and recompile
+        return (rule_from_definition, (self.to_definition(),))
+
+
+# Firing strategies for LogicEngine.evaluate() / match()
+FIRE_ALL = "all"                        # every matching rule, in insertion order
+FIRE_FIRST = "first"                    # the highest-priority matching rule only
+FIRE_BEST_PER_GROUP = "best-per-group"  # the highest-priority match in each group
+STRATEGIES = (FIRE_ALL, FIRE_FIRST, FIRE_BEST_PER_GROUP)
+
+
+class RuleSet:
+    """
+    Immutable, versioned snapshot of an engine's rules
+
+    evaluate() only needs the index. The rules tuple, positions and ranks
+    are derived from it on first read, so publishing a single add_rule
+    doesn't rebuild them.
+    """
+
+    def __init__(self, version: int, index: "RuleIndex"):
+        self.version = version
+        self.index = index
+
+    @cached_property
+    def rules(self) -> Tuple[Rule, ...]:
+        """Rules in insertion order"""
+        return self.index.rules()
+
+    @cached_property
+    def positions(self) -> Dict[int, int]:
+        """RuleIndex sequence number -> position in rules"""
+        return self.index.positions()
+
+    @cached_property
+    def ranks(self) -> Optional[Dict[int, int]]:
+        """RuleIndex sequence number -> salience rank; None when no rule has a priority"""
+        return self.index.ranks()
+
+
+class MatchResult:
+    """
+    Rules that fired for one context, as positions into a RuleSet.
+
+    Built by LogicEngine.match(). Nothing is rendered until `actions` is
+    read, so callers that only need to know which rules fired never pay for
+    string formatting. Render before mutating the context: templates read
+    it lazily.
+    """
+    __slots__ = ("rules", "indices", "errors", "context", "_actions")
+
+    def __init__(
+        self,
+        rules: Tuple[Rule, ...],
+        indices: array,
+        errors: Dict[int, Exception],
+        context: Dict[str, Any]
+    ):
+        self.rules = rules
+        self.indices = indices  # array("I") of fired positions, in firing order
+        self.errors = errors    # position -> exception raised by the condition
+        self.context = context
+        self._actions: Optional[List[str]] = None
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __bool__(self) -> bool:
+        return len(self.indices) > 0
+
+    @property
+    def names(self) -> List[str]:
+        """Names of the fired rules."""
+        rules = self.rules
+        return [rules[i].name for i in self.indices]
+
+    @property
+    def mask(self) -> int:
+        """Bitset of fired positions (bit i set when rules[i] fired)."""
+        bits = 0
+        for i in self.indices:
+            bits |= 1 << i
+        return bits
+
+    @property
+    def actions(self) -> List[str]:
+        """Action strings, identical to LogicEngine.evaluate() (rendered on first access)."""
+        if self._actions is None:
+            self._actions = self._render()
+        return self._actions
+
+    def _render(self) -> List[str]:
+        return render_fired(self.rules, self.indices, self.errors, self.context)
+
+
+class LogicEngine:
+    """
+    Simple rules engine for evaluating conditions and taking actions
+
+    Rules live in an immutable RuleSet snapshot. evaluate() reads the current
+    snapshot without locking; add_rule/remove_rule build a new snapshot and
+    publish it with a single reference swap, so readers on other threads see
+    either the old rule set or the new one, never a mix. Group several
+    changes into one publish with `with engine.update(): ...`.
+    """
+
+    def __init__(self, instrument: bool = False):
+        # Per-rule metrics for evaluate(), match() and sessions; None = instrumentation off
+        self.metrics: Optional[RuleMetrics] = RuleMetrics() if instrument else None
+        self._snapshot = RuleSet(0, RuleIndex())
+        self._write_lock = threading.RLock()
+        # Writer's working copy while an update is open
+        self._pending: Optional[RuleIndex] = None
+
+    @property
+    def rules(self) -> List[Rule]:
+        """Rules of the current snapshot, in insertion order (a new list; see snapshot().rules)"""
+        return list(self._snapshot.rules)
+
+    @property
+    def version(self) -> int:
+        """Number of rule-set updates published so far"""
+        return self._snapshot.version
+
+    def snapshot(self) -> RuleSet:
+        """Return the current rule-set snapshot."""
+        return self._snapshot
+
+    @contextmanager
+    def update(self):
+        """
+        Apply several add_rule/remove_rule calls as one atomic update.
+
+        Changes are made on a private copy and published together when the
+        block exits; if the block raises, nothing is published. Other
+        writers wait, readers keep using the previous snapshot meanwhile.
+
+        Example:
+            with engine.update():
+                engine.remove_rule("Old Discount")
+                engine.add_rule(new_rule)
+        """
+        with self._write_lock:
+            if self._pending is not None:
+                # Nested update: the outermost one publishes
+                yield self
+                return
+            self._pending = self._snapshot.index.copy()
+            try:
+                yield self
+                self._publish(self._pending)
+            finally:
+                self._pending = None
+
+    def add_rule(self, rule: Rule):
+        """Add a rule to the engine"""
+        with self.update():
+            self._pending.add(rule)
+
+    def remove_rule(self, name: str):
+        """Remove a rule by name"""
+        with self.update():
+            self._pending.remove(name)
+
+    def _publish(self, index: "RuleIndex"):
+        """Swap in a new snapshot built from index (called with the write lock held)."""
+        self._snapshot = RuleSet(self._snapshot.version + 1, index)
+
+    def to_definitions(self) -> List[Dict[str, str]]:
+        """Return all rules in RULE_SCHEMA form."""
+        return [rule.to_definition() for rule in self._snapshot.rules]
+
+    @classmethod
+    def from_definitions(cls, definitions: Iterable[Dict[str, Any]]) -> "LogicEngine":
+        """Build an engine from RULE_SCHEMA rule definitions."""
+        engine = cls()
+        with engine.update():
+            for definition in definitions:
+                engine.add_rule(rule_from_definition(definition))
+        return engine
+
+    def __reduce__(self):
+        # Pickle as source form; indexes are rebuilt on load
+        return (self.__class__.from_definitions, (self.to_definitions(),))
+
+    def evaluate(self, context: Dict[str, Any], strategy: str = FIRE_ALL) -> List[str]:
+        """
+        Evaluate all rules against the context, return actions taken
+
+        With FIRE_FIRST or FIRE_BEST_PER_GROUP, rules are tried in salience
+        order (priority, then insertion order) and evaluation stops as soon
+        as the outcome is decided; see match().
+        """
+        if self.metrics is not None:
+            return self._evaluate_instrumented(context, strategy)
+        if strategy != FIRE_ALL:
+            return self.match(context, strategy).actions
+
+        actions_taken = []
+
+        # Only rules the index cannot rule out are tested, in insertion order
+        for rule in self._snapshot.index.candidates(context):
+            try:
+                if rule.condition(context):
+                    result = rule.action(context)
+                    actions_taken.append(f"{rule.name}: {result}")
+            except Exception as e:
+                actions_taken.append(f"{rule.name}: ERROR - {str(e)}")
+
+        return actions_taken
+
+    def _evaluate_instrumented(self, context: Dict[str, Any], strategy: str) -> List[str]:
+        """evaluate() that times every condition and action into self.metrics."""
+        clock = time.perf_counter
+        snapshot = self._snapshot
+        rules = snapshot.rules
+        fired = array("I")
+        errors: Dict[int, Exception] = {}
+        samples: Dict[int, list] = {}
+        self._match_into(snapshot, context, strategy, fired, errors, samples)
+
+        actions_taken = []
+        for position in fired:
+            rule = rules[position]
+            if position in errors:
+                actions_taken.append(f"{rule.name}: ERROR - {str(errors[position])}")
+                continue
+            sample = samples[position]
+            started = clock()
+            try:
+                result = rule.action(context)
+                actions_taken.append(f"{rule.name}: {result}")
+            except Exception as e:
+                sample[3] = True
+                actions_taken.append(f"{rule.name}: ERROR - {str(e)}")
+            sample[4] = clock() - started
+
+        self.metrics.record(list(samples.values()))
+        return actions_taken
+
+    def match(self, context: Dict[str, Any], strategy: str = FIRE_ALL) -> MatchResult:
+        """
+        Evaluate rules against the context without rendering actions.
+
+        Strategies:
+            FIRE_ALL: every matching rule, in insertion order
+            FIRE_FIRST: stop at the first match in salience order
+            FIRE_BEST_PER_GROUP: the first match in salience order for each
+                group; rules of a decided group are skipped, rules without a
+                group behave as with FIRE_ALL
+
+        A condition that raises is reported as an ERROR action but never wins
+        its group or stops evaluation. With metrics on, every condition tried
+        is recorded; action time is not, since actions render on demand.
+
+        Returns:
+            MatchResult with fired rule positions; its `actions` property
+            renders the same strings evaluate() returns, on demand
+
+        Raises:
+            ValueError: If strategy is not one of STRATEGIES
+        """
+        snapshot = self._snapshot
+        fired = array("I")
+        errors: Dict[int, Exception] = {}
+        samples = None if self.metrics is None else {}
+        self._match_into(snapshot, context, strategy, fired, errors, samples)
+        if samples is not None:
+            self.metrics.record(list(samples.values()))
+        return MatchResult(snapshot.rules, fired, errors, context)
+
+    def _match_into(
+        self,
+        snapshot: RuleSet,
+        context: Dict[str, Any],
+        strategy: str,
+        fired: array,
+        errors: Dict[int, Exception],
+        samples: Optional[Dict[int, list]] = None
+    ):
+        """Collect fired positions and errors for a strategy, timing conditions into samples if given."""
+        if strategy != FIRE_ALL:
+            if strategy not in STRATEGIES:
+                raise ValueError(f"Unknown strategy '{strategy}', expected one of {STRATEGIES}")
+            self._match_by_salience(snapshot, context, strategy == FIRE_FIRST, fired, errors, samples)
+            return
+
+        rules = snapshot.rules
+        positions = snapshot.positions
+        if samples is not None:
+            for seq in snapshot.index.candidate_seqs(context):
+                position = positions[seq]
+                try:
+                    if _timed_condition(rules[position], position, context, samples):
+                        fired.append(position)
+                except Exception as e:
+                    errors[position] = e
+                    fired.append(position)
+            return
+
+        for seq in snapshot.index.candidate_seqs(context):
+            position = positions[seq]
+            try:
+                if rules[position].condition(context):
+                    fired.append(position)
+            except Exception as e:
+                errors[position] = e
+                fired.append(position)
+
+    @staticmethod
+    def _match_by_salience(
+        snapshot: RuleSet,
+        context: Dict[str, Any],
+        first_only: bool,
+        fired: array,
+        errors: Dict[int, Exception],
+        samples: Optional[Dict[int, list]] = None
+    ):
+        """Try candidate rules highest priority first, stopping once the outcome is decided."""
+        rules = snapshot.rules
+        positions = snapshot.positions
+        seqs = snapshot.index.candidate_seqs(context)
+        if snapshot.ranks is not None:
+            seqs = sorted(seqs, key=snapshot.ranks.__getitem__)
+
+        decided: Set[str] = set()
+        for seq in seqs:
+            position = positions[seq]
+            rule = rules[position]
+            if rule.group is not None and rule.group in decided:
+                continue
+            try:
+                if samples is None:
+                    matched = rule.condition(context)
+                else:
+                    matched = _timed_condition(rule, position, context, samples)
+                if not matched:
+                    continue
+            except Exception as e:
+                errors[position] = e
+                fired.append(position)
+                continue
+            fired.append(position)
+            if first_only:
+                return
+            if rule.group is not None:
+                decided.add(rule.group)
+
+    def session(self, context: Dict[str, Any]) -> "EvaluationSession":
+        """Start an incremental evaluation session (see EvaluationSession)."""
+        return EvaluationSession(self, context)
+
+    def evaluate_batch(
+        self,
+        batch: Union[Dict[str, Sequence[Any]], List[Dict[str, Any]]],
+        with_actions: bool = True
+    ) -> "BatchResult":
+        """
+        Evaluate all rules against many contexts at once.
+
+        Conditions from condition_code are run as NumPy array operations
+        over whole columns; anything that can't be vectorized safely falls
+        back to a per-row loop. Row results are identical to evaluate().
+        Nothing is recorded in self.metrics.
+
+        Args:
+            batch: Columnar dict ({"quantity": array, ...}) or a list of context dicts
+            with_actions: Render per-row action strings (False = match matrix only)
+
+        Returns:
+            BatchResult with a rules x rows match matrix and per-row actions
+        """
+        return evaluate_batch(self._snapshot.rules, batch, with_actions)
+
+    def evaluate_many(
+        self,
+        contexts: Iterable[Dict[str, Any]],
+        workers: Optional[int] = None,
+        chunksize: int = 256
+    ) -> Iterator[List[str]]:
+        """
+        Evaluate a stream of contexts across a pool of worker processes.
+
+        Rules are sent to the workers in RULE_SCHEMA form and recompiled
+        there, so every rule needs condition_code and action_message.
+        Results are yielded in input order as soon as they are ready.
+
+        Args:
+            contexts: Any iterable of context dicts (read lazily)
+            workers: Number of processes (default: CPU count)
+            chunksize: Contexts sent to a worker per task
+
+        Returns:
+            Iterator of evaluate() results, one per context
+        """
+        return evaluate_many(self, contexts, workers, chunksize)
+
+
+# ============================================
+# RULE INDEX
+# Skip rules whose leading field test cannot match the context
+# ============================================
+
+# Context values the index can compare without risking an exception
+_SIMPLE_TYPES = (str, int, float, bool, type(None))
+
+# Comparison operators, and their mirror image for `constant <op> ctx.get(...)`
+_COMPARE_OPS = {ast.Eq: "==", ast.Gt: ">", ast.GtE: ">=", ast.Lt: "<", ast.LtE: "<="}
+_MIRRORED_OPS = {"==": "==", ">": "<", ">=": "<=", "<": ">", "<=": ">="}
+
+
+def _field_lookup(node: ast.expr) -> Optional[Tuple[str, Any]]:
+    """Match ctx.get('field') or ctx.get('field', constant), return (field, default)."""
+    lookup = context_lookup(node)
+    if lookup is None or not lookup.constant_default or not isinstance(lookup.default_value, _SIMPLE_TYPES):
+        return None
+    return lookup.field, lookup.default_value
+
+
+def _is_threshold(value: Any) -> bool:
+    """A numeric constant usable in a sorted threshold list."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value == value
+
+
+def analyze_index_test(condition_code: str) -> Optional[Tuple[Tuple[str, Any], str, Any]]:
+    """
+    Find the field test that decides whether a condition can match.
+
+    Only the whole condition, or the first operand of a top-level `and`, is
+    considered: it is evaluated first, so when it is false the rule cannot
+    fire and cannot raise either.
+
+    Returns:
+        ((field, default), kind, payload) where kind is one of "truthy",
+        "==", "in", ">", ">=", "<", "<=", or None if the condition can't be indexed
+    """
+    test = compile_condition(condition_code).tree.body
+    if isinstance(test, ast.BoolOp) and isinstance(test.op, ast.And):
+        test = test.values[0]
+
+    lookup = _field_lookup(test)
+    if lookup is not None:
+        return lookup, "truthy", None
+
+    if not isinstance(test, ast.Compare):
+        return None
+
+    # Chained comparisons short-circuit on the first pair
+    left, right = test.left, test.comparators[0]
+    op_type = type(test.ops[0])
+
+    lookup = _field_lookup(left)
+    if lookup is not None:
+        if op_type is ast.In and isinstance(right, (ast.List, ast.Tuple, ast.Set)):
+            members = []
+            for element in right.elts:
+                if not isinstance(element, ast.Constant) or not isinstance(element.value, _SIMPLE_TYPES):
+                    return None
+                members.append(element.value)
+            return lookup, "in", frozenset(members)
+        op = _COMPARE_OPS.get(op_type)
+    else:
+        lookup = _field_lookup(right)
+        op = _MIRRORED_OPS.get(_COMPARE_OPS.get(op_type))
+        right = left
+
+    if lookup is None or op is None or not isinstance(right, ast.Constant):
+        return None
+    if op == "==":
+        return (lookup, op, right.value) if isinstance(right.value, _SIMPLE_TYPES) else None
+    return (lookup, op, right.value) if _is_threshold(right.value) else None
+
+
+class _FieldIndex:
+    """Rules keyed by one (field, default) lookup"""
+
+    def __init__(self):
+        self.equality: Dict[Any, Set[int]] = {}
+        self.truthy: Set[int] = set()
+        # op -> (sorted thresholds, seqs in the same order)
+        self.thresholds: Dict[str, Tuple[List[float], List[int]]] = {}
+        self.seqs: Set[int] = set()
+
+    def copy(self) -> "_FieldIndex":
+        clone = _FieldIndex()
+        clone.equality = {value: set(seqs) for value, seqs in self.equality.items()}
+        clone.truthy = set(self.truthy)
+        clone.thresholds = {op: (list(values), list(seqs)) for op, (values, seqs) in self.thresholds.items()}
+        clone.seqs = set(self.seqs)
+        return clone
+
+    def add(self, seq: int, kind: str, payload: Any):
+        self.seqs.add(seq)
+        if kind == "truthy":
+            self.truthy.add(seq)
+        elif kind == "==":
+            self.equality.setdefault(payload, set()).add(seq)
+        elif kind == "in":
+            for member in payload:
+                self.equality.setdefault(member, set()).add(seq)
+        else:
+            values, seqs = self.thresholds.setdefault(kind, ([], []))
+            position = bisect.bisect_right(values, payload)
+            values.insert(position, payload)
+            seqs.insert(position, seq)
+
+    def discard(self, seq: int, kind: str, payload: Any):
+        self.seqs.discard(seq)
+        if kind == "truthy":
+            self.truthy.discard(seq)
+        elif kind in ("==", "in"):
+            for member in (payload,) if kind == "==" else payload:
+                bucket = self.equality[member]
+                bucket.discard(seq)
+                if not bucket:
+                    del self.equality[member]
+        else:
+            values, seqs = self.thresholds[kind]
+            # Jump to the threshold, then scan rules sharing that value
+            position = bisect.bisect_left(values, payload)
+            while seqs[position] != seq:
+                position += 1
+            del values[position], seqs[position]
+            if not seqs:
+                del self.thresholds[kind]
+
+    def matches(self, value: Any, out: Set[int]):
+        """Add every rule whose test may be true (or may raise) for value."""
+        if type(value) not in _SIMPLE_TYPES:
+            # Unknown type: comparisons could do anything, let the rules decide
+            out.update(self.seqs)
+            return
+
+        if value and self.truthy:
+            out.update(self.truthy)
+        if self.equality:
+            bucket = self.equality.get(value)
+            if bucket:
+                out.update(bucket)
+        if not self.thresholds:
+            return
+
+        if not (isinstance(value, (int, float)) and value == value):
+            # str/None/NaN: ordering comparisons raise or behave oddly
+            for _, seqs in self.thresholds.values():
+                out.update(seqs)
+            return
+
+        # e.g. value >= t  <=>  t <= value, so matching thresholds form a prefix
+        for op, (values, seqs) in self.thresholds.items():
+            if op == ">=":
+                out.update(seqs[:bisect.bisect_right(values, value)])
+            elif op == ">":
+                out.update(seqs[:bisect.bisect_left(values, value)])
+            elif op == "<=":
+                out.update(seqs[bisect.bisect_left(values, value):])
+            else:
+                out.update(seqs[bisect.bisect_right(values, value):])
+
+
+class _IndexLayer:
+    """Rules by sequence number with their field indexes (one layer of a RuleIndex)"""
+
+    def __init__(self):
+        self.rules: Dict[int, Rule] = {}
+        self.seqs_by_name: Dict[str, Tuple[int, ...]] = {}
+        self.tests: Dict[int, Tuple[Tuple[str, Any], str, Any]] = {}
+        self.fields: Dict[Tuple[str, Any], _FieldIndex] = {}
+        self.fallback: Set[int] = set()
+        # Field indexes this layer may modify (others are shared with the original)
+        self._owned: Set[Tuple[str, Any]] = set()
+
+    def copy(self) -> "_IndexLayer":
+        """Return an independent layer sharing unmodified field indexes."""
+        clone = _IndexLayer.__new__(_IndexLayer)
+        clone.rules = dict(self.rules)
+        clone.seqs_by_name = dict(self.seqs_by_name)
+        clone.tests = dict(self.tests)
+        clone.fields = dict(self.fields)
+        clone.fallback = set(self.fallback)
+        clone._owned = set()
+        return clone
+
+    def _field_for_write(self, lookup: Tuple[str, Any]) -> _FieldIndex:
+        """Field index for lookup, copied first if it is shared with another layer."""
+        if lookup not in self._owned:
+            shared = self.fields.get(lookup)
+            self.fields[lookup] = shared.copy() if shared is not None else _FieldIndex()
+            self._owned.add(lookup)
+        return self.fields[lookup]
+
+    def add(self, seq: int, rule: Rule):
+        self.rules[seq] = rule
+        self.seqs_by_name[rule.name] = self.seqs_by_name.get(rule.name, ()) + (seq,)
+
+        test = analyze_index_test(rule.condition_code) if rule.condition_code is not None else None
+        if test is None:
+            self.fallback.add(seq)
+            return
+
+        lookup, kind, payload = test
+        self.tests[seq] = test
+        self._field_for_write(lookup).add(seq, kind, payload)
+
+    def discard(self, seq: int):
+        name = self.rules.pop(seq).name
+        seqs = tuple(other for other in self.seqs_by_name[name] if other != seq)
+        if seqs:
+            self.seqs_by_name[name] = seqs
+        else:
+            del self.seqs_by_name[name]
+
+        test = self.tests.pop(seq, None)
+        if test is None:
+            self.fallback.discard(seq)
+            return
+        lookup, kind, payload = test
+        field_index = self._field_for_write(lookup)
+        field_index.discard(seq, kind, payload)
+        if not field_index.seqs:
+            del self.fields[lookup]
+            self._owned.discard(lookup)
+
+    def candidate_seqs(self, context: Dict[str, Any]) -> Iterable[int]:
+        """Sequence numbers of rules that may match the context, in insertion order."""
+        if not self.fields:
+            return self.rules.keys()
+
+        seqs = set(self.fallback)
+        for (field, default), field_index in self.fields.items():
+            field_index.matches(context.get(field, default), seqs)
+        return sorted(seqs)
+
+
+# Rules added or removed since the last merge that a RuleIndex copy carries
+# privately; beyond max(this, sqrt(rules)) the next copy merges them
+MIN_RECENT_CHANGES = 64
+
+
+class RuleIndex:
+    """
+    Field index over a rule set.
+
+    Rules whose condition_code starts with a single-field test against a
+    constant (==, in, >, >=, <, <=, or plain truthiness) are indexed with hash
+    maps and sorted threshold lists. Everything else, including hand-written
+    lambda rules, is kept on a fallback list that is always evaluated.
+
+    The index also stores the rules themselves (by insertion sequence, with
+    a name -> sequences map), so removing a rule by name doesn't scan the
+    rule list.
+
+    An index is two layers: a large base that is never modified once built
+    (and so is shared by every copy), and a small layer of recently added
+    rules plus the set of base rules removed since. copy() duplicates only
+    the small layer, so publishing one add_rule/remove_rule costs about
+    sqrt(n) instead of n. When the recent changes outgrow sqrt(n) (at least
+    MIN_RECENT_CHANGES), copy() merges them into a new base.
+    """
+
+    def __init__(self):
+        self._next_seq = 0
+        self._base = _IndexLayer()
+        self._recent = _IndexLayer()
+        # Base sequence numbers removed since the base was built
+        self._removed: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._base.rules) - len(self._removed) + len(self._recent.rules)
+
+    def copy(self) -> "RuleIndex":
+        """Return an independent index; the base layer is shared, not copied."""
+        clone = RuleIndex.__new__(RuleIndex)
+        clone._next_seq = self._next_seq
+        changes = len(self._recent.rules) + len(self._removed)
+        if changes > max(MIN_RECENT_CHANGES, math.isqrt(len(self._base.rules))):
+            clone._base = self._merged()
+            clone._recent = _IndexLayer()
+            clone._removed = set()
+        else:
+            clone._base = self._base
+            clone._recent = self._recent.copy()
+            clone._removed = set(self._removed)
+        return clone
+
+    def _merged(self) -> _IndexLayer:
+        """A new base layer holding every live rule."""
+        if not self._base.rules:
+            return self._recent.copy()
+        layer = self._base.copy()
+        for seq in self._removed:
+            layer.discard(seq)
+        for seq, rule in self._recent.rules.items():
+            layer.add(seq, rule)
+        return layer
+
+    def _items(self) -> Iterator[Tuple[int, Rule]]:
+        """(sequence number, rule) pairs in insertion order."""
+        removed = self._removed
+        # Seqs only grow and recent rules are newer than the base, so dict order is insertion order
+        for seq, rule in self._base.rules.items():
+            if seq not in removed:
+                yield seq, rule
+        yield from self._recent.rules.items()
+
+    def rules(self) -> Tuple[Rule, ...]:
+        """All indexed rules in insertion order."""
+        if not self._removed and not self._recent.rules:
+            return tuple(self._base.rules.values())
+        return tuple(rule for _, rule in self._items())
+
+    def add(self, rule: Rule):
+        """Index a rule."""
+        seq = self._next_seq
+        self._next_seq += 1
+        self._recent.add(seq, rule)
+
+    def remove(self, name: str):
+        """Drop every rule with this name from the index."""
+        self._removed.update(self._base.seqs_by_name.get(name, ()))
+        for seq in self._recent.seqs_by_name.get(name, ()):
+            self._recent.discard(seq)
+
+    def positions(self) -> Dict[int, int]:
+        """Map each sequence number to its rule's position in rules()."""
+        return {seq: position for position, (seq, _) in enumerate(self._items())}
+
+    def ranks(self) -> Optional[Dict[int, int]]:
+        """Map each sequence number to its salience rank (priority desc, then insertion order)."""
+        items = list(self._items())
+        if not any(rule.priority for _, rule in items):
+            return None
+        items.sort(key=lambda item: -item[1].priority)
+        return {seq: rank for rank, (seq, _) in enumerate(items)}
+
+    def candidate_seqs(self, context: Dict[str, Any]) -> Iterable[int]:
+        """Sequence numbers of rules that may match the context, in insertion order."""
+        seqs = self._base.candidate_seqs(context)
+        if self._removed:
+            removed = self._removed
+            seqs = [seq for seq in seqs if seq not in removed]
+        if self._recent.rules:
+            seqs = list(seqs)
+            seqs += self._recent.candidate_seqs(context)
+        return seqs
+
+    def candidates(self, context: Dict[str, Any]) -> List[Rule]:
+        """Rules that may match the context, in insertion order."""
+        base = self._base.rules
+        if not self._removed and not self._recent.rules:
+            if not self._base.fields:
+                return list(base.values())
+            return [base[seq] for seq in self._base.candidate_seqs(context)]
+        recent = self._recent.rules
+        return [base[seq] if seq in base else recent[seq] for seq in self.candidate_seqs(context)]
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get index coverage statistics."""
+        base, recent = self._base, self._recent
+        return {
+            "rules": len(self),
+            "indexed": len(base.tests) - len(self._removed.intersection(base.tests)) + len(recent.tests),
+            "fallback": len(base.fallback - self._removed) + len(recent.fallback),
+            "fields": len(base.fields.keys() | recent.fields.keys()),
+            "recent": len(recent.rules) + len(self._removed),
+        }
+
+
+# ============================================
+# MEMOIZED EVALUATION
+# Each distinct condition and template once per context
+# ============================================
+
+# Marks a memoized condition, template or network node not yet evaluated
+# for the current context
+PENDING = object()
+
+
+class MemoizedFailure:
+    """Memoized exception raised by a condition, template or network node."""
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+def render_fired(
+    rules: Sequence[Rule],
+    fired: Iterable[int],
+    errors: Dict[int, Any],
+    context: Dict[str, Any]
+) -> List[str]:
+    """
+    Action strings for fired rules, as LogicEngine.evaluate() returns them.
+
+    Generated actions are pure template renders, so a template shared by
+    several fired rules is rendered once; hand-written actions (no
+    action_message) run for every rule.
+
+    Args:
+        rules: Rules the positions refer to
+        fired: Positions of the fired rules, in firing order
+        errors: Position -> exception (or message) raised by its condition
+        context: The context the rules fired for
+
+    Returns:
+        "name: result" or "name: ERROR - message" per fired rule
+    """
+    rendered: Dict[str, str] = {}
+    actions_taken = []
+    for i in fired:
+        rule = rules[i]
+        error = errors.get(i)
+        if error is None:
+            try:
+                template = rule.action_message
+                if template is None:
+                    result = rule.action(context)
+                else:
+                    result = rendered.get(template)
+                    if result is None:
+                        result = rendered[template] = rule.action(context)
+                actions_taken.append(f"{rule.name}: {result}")
+                continue
+            except Exception as e:
+                error = e
+        actions_taken.append(f"{rule.name}: ERROR - {str(error)}")
+    return actions_taken
+
+
+def evaluate_memoized(
+    context: Any,
+    conditions: Sequence[int],
+    templates: Sequence[int],
+    name_of: Callable[[int], str],
+    condition_funcs: Sequence[Optional[Callable[[Any], Any]]],
+    template_funcs: Sequence[Optional[Callable[[Any], str]]],
+    alive: Optional[Sequence[int]] = None,
+    load_condition: Optional[Callable[[int], Callable[[Any], Any]]] = None,
+    load_template: Optional[Callable[[int], Callable[[Any], str]]] = None
+) -> List[str]:
+    """
+    LogicEngine.evaluate() over rules stored as condition and template ids.
+
+    Rule i uses condition_funcs[conditions[i]] and
+    template_funcs[templates[i]]; each distinct condition runs, and each
+    distinct template renders, at most once per context.
 
-        while attempts < len(self.keys):
-            key = self.keys[self.current_index]
-            key_label = f"Key {self.current_index + 1}/{len(self.keys)}"
+    Args:
+        context: Passed to every condition and template
+        conditions: Condition id per rule position
+        templates: Template id per rule position
+        name_of: Rule name for a position (only called for fired rules)
+        condition_funcs: Function per condition id (None = call load_condition)
+        template_funcs: Function per template id (None = call load_template)
+        alive: Optional flag per position; positions with a false flag are skipped
+        load_condition: Builds a condition function missing from condition_funcs
+        load_template: Builds a template function missing from template_funcs
 
+    Returns:
+        Actions taken, in rule order
+    """
+    outcomes = [PENDING] * len(condition_funcs)
+    rendered = [PENDING] * len(template_funcs)
+    actions_taken = []
+
+    for position, condition_id in enumerate(conditions):
+        if alive is not None and not alive[position]:
+            continue
+        outcome = outcomes[condition_id]
+        if outcome is PENDING:
+            condition = condition_funcs[condition_id] or load_condition(condition_id)
             try:
-                response = requests.post(
-                    endpoint,
-                    headers={
-                        "x-goog-api-key": key,
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "contents": [{"parts": [{"text": prompt}]}]
-                    },
-                    timeout=30
-                )
+                outcome = bool(condition(context))
+            except Exception as e:
+                outcome = MemoizedFailure(e)
+            outcomes[condition_id] = outcome
+        if outcome is False:
+            continue
+
+        if outcome is True:
+            template_id = templates[position]
+            outcome = rendered[template_id]
+            if outcome is PENDING:
+                template = template_funcs[template_id] or load_template(template_id)
+                try:
+                    outcome = template(context)
+                except Exception as e:
+                    outcome = MemoizedFailure(e)
+                rendered[template_id] = outcome
+            if outcome.__class__ is not MemoizedFailure:
+                actions_taken.append(f"{name_of(position)}: {outcome}")
+                continue
 
-                # Handle quota exhaustion (429 Too Many Requests)
-                if response.status_code == 429:
-                    self.error_counts[self.current_index] += 1
-                    if self.verbose:
-                        print(f"   {key_label} quota exceeded (429), rotating...")
-                    self._rotate_key()
-                    attempts += 1
-                    self._backoff(attempts)
-                    continue
+        actions_taken.append(f"{name_of(position)}: ERROR - {str(outcome.error)}")
 
-                # Handle server errors
-                if response.status_code >= 500:
-                    self.error_counts[self.current_index] += 1
-                    if self.verbose:
-                        print(f"   {key_label} server error ({response.status_code}), rotating...")
-                    self._rotate_key()
-                    attempts += 1
-                    self._backoff(attempts)
-                    continue
+    return actions_taken
 
-                # Raise for other errors (4xx except 429)
-                response.raise_for_status()
 
-                # Success
-                self.request_counts[self.current_index] += 1
-                self.total_requests += 1
+# ============================================
+# INCREMENTAL EVALUATION
+# Re-run only the rules whose fields changed
+# ============================================
 
-                if self.verbose:
-                    print(f"   {key_label} request #{self.total_requests} successful")
+@lru_cache(maxsize=10_000)
+def condition_fields(condition_code: str) -> Optional[FrozenSet[str]]:
+    """
+    Context fields a condition reads.
 
-                return response.json()
+    Returns:
+        The field names of every ctx.get('field', ...) call and ctx['field']
+        subscript, or None if the condition uses ctx any other way (so it
+        may read any field)
+    """
+    tree = compile_condition(condition_code).tree
+    fields = set()
+    references = 0
+    for node in ast.walk(tree):
+        if _is_ctx(node):
+            references += 1
+        else:
+            lookup = context_lookup(node, subscripts=True)
+            if lookup is not None:
+                fields.add(lookup.field)
+                references -= 1
+    return frozenset(fields) if references == 0 else None
+
+
+def rule_fields(rule: Rule) -> Optional[FrozenSet[str]]:
+    """Declared or derived field dependencies of a rule (None = unknown)."""
+    if rule.fields is not None:
+        return rule.fields
+    if rule.condition_code is not None:
+        return condition_fields(rule.condition_code)
+    return None
 
-            except requests.exceptions.RequestException as e:
-                self.error_counts[self.current_index] += 1
-                if self.verbose:
-                    print(f"   {key_label} request failed: {e}")
-                self._rotate_key()
-                attempts += 1
-                self._backoff(attempts)
 
-        raise Exception(
-            f"All {len(self.keys)} API keys exhausted or failed after {attempts} attempts. "
-            "Try again in 1 minute for quota reset."
-        )
+@dataclass
+class SessionDiff:
+    """Rules whose outcome changed after EvaluationSession.update()"""
+    fired: List[str]
+    unfired: List[str]
+    evaluated: int  # conditions re-run for this update
 
-    def call_structured(
+
+class EvaluationSession:
+    """
+    A context that is evaluated once, then re-evaluated incrementally.
+
+    Each rule's field dependencies come from its declared `fields` or from
+    the ctx.get('field') calls in its condition_code. update() re-runs only
+    the rules reading a changed field (plus rules with unknown dependencies)
+    and reports which rules started or stopped firing. If the engine's rules
+    changed since the last update, everything is re-evaluated.
+
+    Example:
+        session = engine.session({"quantity": 5, "order_total": 80})
+        diff = session.update(quantity=12)
+        print(diff.fired, session.actions)
+    """
+
+    def __init__(self, engine: LogicEngine, context: Dict[str, Any]):
+        self.engine = engine
+        self.context = dict(context)
+        self._bind(engine.snapshot())
+
+    def _bind(self, snapshot: RuleSet):
+        """Evaluate every rule against the current context under snapshot."""
+        self._snapshot = snapshot
+        self._dependents: Dict[str, List[int]] = {}
+        self._always: List[int] = []
+        for position, rule in enumerate(snapshot.rules):
+            fields = rule_fields(rule)
+            if fields is None:
+                self._always.append(position)
+            else:
+                for field in fields:
+                    self._dependents.setdefault(field, []).append(position)
+
+        self._fired: Set[int] = set()
+        self._errors: Dict[int, Exception] = {}
+        self._run(range(len(snapshot.rules)))
+
+    def _run(self, positions: Iterable[int]) -> Tuple[List[int], List[int]]:
+        """Re-run conditions at positions; return (newly fired, newly unfired)."""
+        rules = self._snapshot.rules
+        context = self.context
+        metrics = self.engine.metrics
+        samples = None if metrics is None else {}
+        fired, unfired = [], []
+        for position in positions:
+            was_fired = position in self._fired
+            self._errors.pop(position, None)
+            try:
+                if samples is None:
+                    now_fired = bool(rules[position].condition(context))
+                else:
+                    now_fired = _timed_condition(rules[position], position, context, samples)
+            except Exception as e:
+                # evaluate() reports an ERROR action for a raising condition
+                self._errors[position] = e
+                now_fired = True
+            if now_fired and not was_fired:
+                self._fired.add(position)
+                fired.append(position)
+            elif was_fired and not now_fired:
+                self._fired.discard(position)
+                unfired.append(position)
+        if samples is not None:
+            metrics.record(list(samples.values()))
+        return fired, unfired
+
+    def update(
         self,
-        prompt: str,
-        schema: Dict[str, Any],
-        model: str = "gemini-flash-latest"
-    ) -> Dict[str, Any]:
+        changes: Optional[Dict[str, Any]] = None,
+        remove: Iterable[str] = (),
+        **fields: Any
+    ) -> SessionDiff:
         """
-        Make an API call expecting structured JSON output.
+        Change context fields and re-evaluate the affected rules.
 
         Args:
-            prompt: The text prompt
-            schema: JSON Schema for response format
-            model: Model name
+            changes: Fields to set (alternatively pass them as keyword arguments)
+            remove: Fields to delete from the context
 
         Returns:
-            Parsed JSON matching the schema
+            SessionDiff with the names of rules that started / stopped firing
         """
-        attempts = 0
-        endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
-
-        while attempts < len(self.keys):
-            key = self.keys[self.current_index]
-            key_label = f"Key {self.current_index + 1}/{len(self.keys)}"
-
-            try:
-                response = requests.post(
-                    endpoint,
-                    headers={
-                        "x-goog-api-key": key,
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "contents": [{"parts": [{"text": prompt}]}],
-                        "generationConfig": {
-                            "responseMimeType": "application/json",
-                            "responseSchema": schema
-                        }
-                    },
-                    timeout=30
-                )
-
-                if response.status_code == 429:
-                    self.error_counts[self.current_index] += 1
-                    if self.verbose:
-                        print(f"   {key_label} quota exceeded (429), rotating...")
-                    self._rotate_key()
-                    attempts += 1
-                    self._backoff(attempts)
-                    continue
-
-                if response.status_code >= 500:
-                    self.error_counts[self.current_index] += 1
-                    self._rotate_key()
-                    attempts += 1
-                    self._backoff(attempts)
-                    continue
-
-                response.raise_for_status()
-
-                self.request_counts[self.current_index] += 1
-                self.total_requests += 1
+        changed = set()
+        for field, value in {**(changes or {}), **fields}.items():
+            old = self.context.get(field, _MISSING)
+            # 1 == 1.0 == True, but they render and compare differently
+            if type(old) is not type(value) or old != value:
+                changed.add(field)
+            self.context[field] = value
+        for field in remove:
+            if self.context.pop(field, _MISSING) is not _MISSING:
+                changed.add(field)
+
+        rules_before = self._snapshot.rules
+        fired_before = {position: rules_before[position] for position in self._fired}
+        snapshot = self.engine.snapshot()
+
+        if snapshot is not self._snapshot:
+            self._bind(snapshot)
+            fired_now = {id(snapshot.rules[position]) for position in self._fired}
+            previous = {id(rule) for rule in fired_before.values()}
+            return SessionDiff(
+                fired=[snapshot.rules[p].name for p in sorted(self._fired) if id(snapshot.rules[p]) not in previous],
+                unfired=[rule.name for p, rule in sorted(fired_before.items()) if id(rule) not in fired_now],
+                evaluated=len(snapshot.rules)
+            )
+
+        affected = set(self._always)
+        for field in changed:
+            affected.update(self._dependents.get(field, ()))
+        fired, unfired = self._run(sorted(affected))
+        rules = snapshot.rules
+        return SessionDiff(
+            fired=[rules[p].name for p in fired],
+            unfired=[rules[p].name for p in unfired],
+            evaluated=len(affected)
+        )
 
-                result = response.json()
-                json_text = result["candidates"][0]["content"]["parts"][0]["text"]
-                return json.loads(json_text)
+    def result(self) -> MatchResult:
+        """Current matches; actions render lazily as with LogicEngine.match()."""
+        return MatchResult(
+            self._snapshot.rules, array("I", sorted(self._fired)), dict(self._errors), self.context
+        )
 
-            except requests.exceptions.RequestException as e:
-                self.error_counts[self.current_index] += 1
-                self._rotate_key()
-                attempts += 1
-                self._backoff(attempts)
+    @property
+    def fired(self) -> List[str]:
+        """Names of the rules currently firing."""
+        return self.result().names
 
-        raise Exception(f"All {len(self.keys)} API keys exhausted")
+    @property
+    def actions(self) -> List[str]:
+        """Actions for the current context, identical to engine.evaluate(context)."""
+        return self.result().actions
 
-    def _rotate_key(self):
-        """Rotate to the next API key."""
-        self.current_index = (self.current_index + 1) % len(self.keys)
 
-    def _backoff(self, attempt: int):
-        """Exponential backoff delay."""
-        delay = min(0.1 * (2 ** (attempt - 1)), 2.0)
-        time.sleep(delay)
+# ============================================
+# BATCH EVALUATION
+# Columnar contexts, vectorized conditions
+# ============================================
 
-    def get_stats(self) -> Dict[str, Any]:
-        """Get current API usage statistics."""
-        total_requests = sum(self.request_counts)
-        total_errors = sum(self.error_counts)
+@dataclass
+class BatchResult:
+    """Result of LogicEngine.evaluate_batch"""
+    rule_names: List[str]
+    matches: Any               # np.ndarray of bool, shape (rules, rows)
+    actions: List[List[str]]   # per row, same as evaluate(row); empty if with_actions=False
+
+
+class _NotVectorizable(Exception):
+    """A condition (or this batch's data) needs the per-row loop."""
+
+
+# Integers beyond this lose precision as float64
+_EXACT_FLOAT_INT = 2 ** 53
+
+
+class _Columns:
+    """Typed NumPy columns plus presence masks for a batch of contexts."""
+
+    def __init__(self, batch: Union[Dict[str, Sequence[Any]], List[Dict[str, Any]]]):
+        if isinstance(batch, dict):
+            lengths = {len(column) for column in batch.values()}
+            if len(lengths) > 1:
+                raise ValueError(f"Batch columns have different lengths: {sorted(lengths)}")
+            self.size = lengths.pop() if lengths else 0
+            self._source = batch
+            self._rows: Optional[List[Dict[str, Any]]] = None
+        else:
+            self.size = len(batch)
+            self._source = None
+            self._rows = list(batch)
+        # field -> (kind, values, present mask or None when every row has it)
+        self._cache: Dict[str, Tuple[str, Any, Any]] = {}
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Per-row context dicts, built on first use for columnar input."""
+        if self._rows is None:
+            columns = {
+                field: column.tolist() if hasattr(column, "tolist") else list(column)
+                for field, column in self._source.items()
+            }
+            self._rows = [
+                {field: values[i] for field, values in columns.items()}
+                for i in range(self.size)
+            ]
+        return self._rows
+
+    def column(self, field: str) -> Tuple[str, Any, Any]:
+        """Return (kind, values, present) where kind is bool/int/float/str/object/missing."""
+        if field not in self._cache:
+            self._cache[field] = self._load(field)
+        return self._cache[field]
+
+    def _load(self, field: str) -> Tuple[str, Any, Any]:
+        if self._source is not None:
+            if field not in self._source:
+                return "missing", None, np.zeros(self.size, dtype=bool)
+            column = self._source[field]
+            if isinstance(column, np.ndarray):
+                return self._kind_of_array(column), column, None
+            values, present = list(column), None
+        else:
+            present = np.fromiter((field in row for row in self._rows), dtype=bool, count=self.size)
+            values = [row.get(field) for row in self._rows]
+            if present.all():
+                present = None
+            elif not present.any():
+                return "missing", None, present
+
+        kept = values if present is None else [v for v, p in zip(values, present) if p]
+        kind = self._kind_of_values(kept)
+        if kind == "object":
+            return kind, None, present
+
+        filler = {"bool": False, "int": 0, "float": 0.0, "str": ""}[kind]
+        if present is not None:
+            values = [v if p else filler for v, p in zip(values, present)]
+        dtype = {"bool": bool, "int": np.int64, "float": np.float64, "str": str}[kind]
+        return kind, np.array(values, dtype=dtype), present
+
+    @staticmethod
+    def _kind_of_array(column) -> str:
+        if column.dtype == bool:
+            return "bool"
+        if np.issubdtype(column.dtype, np.integer):
+            return "int"
+        if np.issubdtype(column.dtype, np.floating):
+            return "float"
+        if column.dtype.kind == "U":
+            return "str"
+        return "object"
+
+    @staticmethod
+    def _kind_of_values(values: List[Any]) -> str:
+        types = {type(v) for v in values}
+        if types <= {bool}:
+            return "bool"
+        if types <= {int}:
+            return "int" if all(-2 ** 63 <= v < 2 ** 63 for v in values) else "object"
+        if types <= {int, float}:
+            exact = all(abs(v) <= _EXACT_FLOAT_INT for v in values if type(v) is int)
+            return "float" if exact else "object"
+        if types <= {str}:
+            # NumPy strips trailing NUL characters from fixed-width strings
+            return "object" if any(v.endswith("\0") for v in values) else "str"
+        return "object"
+
+
+def _vector_lookup(node: ast.expr) -> Optional[Tuple[str, Any]]:
+    """Match ctx.get('field') / ctx.get('field', constant)."""
+    lookup = context_lookup(node)
+    if lookup is None or not lookup.constant_default:
+        return None
+    return lookup.field, lookup.default_value
 
-        return {
-            "current_key": self.current_index + 1,
-            "total_keys": len(self.keys),
-            "request_counts": self.request_counts.copy(),
-            "error_counts": self.error_counts.copy(),
-            "total_requests": total_requests,
-            "total_errors": total_errors,
-            "success_rate": f"{((total_requests - total_errors) / total_requests * 100):.1f}%"
-                if total_requests > 0 else "N/A"
-        }
 
-    def print_stats(self):
-        """Print API usage statistics."""
-        stats = self.get_stats()
+_VECTOR_OPS = {
+    ast.Eq: lambda a, b: a == b,
+    ast.NotEq: lambda a, b: a != b,
+    ast.Gt: lambda a, b: a > b,
+    ast.GtE: lambda a, b: a >= b,
+    ast.Lt: lambda a, b: a < b,
+    ast.LtE: lambda a, b: a <= b,
+}
+_MIRRORED_AST_OPS = {ast.Eq: ast.Eq, ast.NotEq: ast.NotEq, ast.Gt: ast.Lt, ast.GtE: ast.LtE, ast.Lt: ast.Gt, ast.LtE: ast.GtE}
+
+
+def _same_family(kind: str, constant: Any) -> bool:
+    """Whether Python would compare a column of this kind with constant by value."""
+    if kind == "str":
+        return isinstance(constant, str)
+    return isinstance(constant, (bool, int, float))
+
+
+def _vector_truth(field: str, default: Any):
+    """Truthiness of ctx.get(field, default) per row."""
+    def truth(columns: _Columns):
+        kind, values, present = columns.column(field)
+        if kind == "object":
+            raise _NotVectorizable()
+        if kind == "missing":
+            return np.full(columns.size, bool(default))
+        if kind == "bool":
+            result = values.copy()
+        elif kind == "str":
+            result = np.char.str_len(values) > 0
+        else:
+            result = values != 0
+        if present is not None:
+            result[~present] = bool(default)
+        return result
+    return truth
+
+
+def _vector_compare(field: str, default: Any, op_type: type, constant: Any):
+    """ctx.get(field, default) <op> constant per row."""
+    op = _VECTOR_OPS[op_type]
+    equality = op_type in (ast.Eq, ast.NotEq)
+
+    def compare(columns: _Columns):
+        kind, values, present = columns.column(field)
+        if kind == "object":
+            raise _NotVectorizable()
+
+        if kind == "missing":
+            result = None
+        elif _same_family(kind, constant):
+            # Python compares int and float exactly, NumPy goes through float64
+            if kind == "int" and isinstance(constant, float) and (
+                abs(constant) > _EXACT_FLOAT_INT or np.abs(values).max(initial=0) > _EXACT_FLOAT_INT
+            ):
+                raise _NotVectorizable()
+            if kind == "float" and type(constant) is int and abs(constant) > _EXACT_FLOAT_INT:
+                raise _NotVectorizable()
+            try:
+                result = np.asarray(op(values, constant), dtype=bool)
+            except Exception:
+                raise _NotVectorizable()
+            if result.shape != (columns.size,):
+                raise _NotVectorizable()
+        elif equality:
+            # e.g. 'vip' == 10 is simply False
+            result = np.full(columns.size, op_type is ast.NotEq)
+        else:
+            # e.g. 'vip' >= 10 raises TypeError: let the per-row loop report it
+            raise _NotVectorizable()
+
+        if result is None or present is not None:
+            try:
+                fallback = bool(op(default, constant))
+            except Exception:
+                raise _NotVectorizable()
+            if result is None:
+                return np.full(columns.size, fallback)
+            result[~present] = fallback
+        return result
+    return compare
+
+
+def _compile_vector_node(node: ast.expr):
+    """Build a closure that evaluates the truthiness of node over columns."""
+    if isinstance(node, ast.Constant):
+        value = bool(node.value)
+        return lambda columns: np.full(columns.size, value)
+
+    lookup = _vector_lookup(node)
+    if lookup is not None:
+        return _vector_truth(*lookup)
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        operand = _compile_vector_node(node.operand)
+        return lambda columns: ~operand(columns)
+
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile_vector_node(value) for value in node.values]
+        conjunction = isinstance(node.op, ast.And)
+
+        def combine(columns: _Columns):
+            result = parts[0](columns)
+            for part in parts[1:]:
+                result = (result & part(columns)) if conjunction else (result | part(columns))
+            return result
+        return combine
+
+    if isinstance(node, ast.Compare):
+        # Chains like 1 <= x <= 5 become (1 <= x) & (x <= 5)
+        pairs = []
+        operands = [node.left] + node.comparators
+        for left, op, right in zip(operands, node.ops, operands[1:]):
+            pairs.append(_compile_vector_pair(left, op, right))
+
+        def chain(columns: _Columns):
+            result = pairs[0](columns)
+            for pair in pairs[1:]:
+                result &= pair(columns)
+            return result
+        return chain
+
+    raise _NotVectorizable()
+
+
+def _compile_vector_pair(left: ast.expr, op: ast.cmpop, right: ast.expr):
+    """One comparison between a ctx.get lookup and a constant (or constant list)."""
+    op_type = type(op)
+    lookup = _vector_lookup(left)
+    if lookup is None:
+        lookup = _vector_lookup(right)
+        if lookup is None or op_type not in _MIRRORED_AST_OPS or not isinstance(left, ast.Constant):
+            raise _NotVectorizable()
+        return _vector_compare(*lookup, _MIRRORED_AST_OPS[op_type], left.value)
+
+    if op_type in (ast.In, ast.NotIn) and isinstance(right, (ast.List, ast.Tuple, ast.Set)):
+        if not all(isinstance(e, ast.Constant) for e in right.elts):
+            raise _NotVectorizable()
+        members = [_vector_compare(*lookup, ast.Eq, e.value) for e in right.elts]
+        if isinstance(right, ast.Set) and not all(isinstance(e.value, (str, int, float, bool)) for e in right.elts):
+            raise _NotVectorizable()
+        negate = op_type is ast.NotIn
+
+        def membership(columns: _Columns):
+            result = np.zeros(columns.size, dtype=bool)
+            for member in members:
+                result |= member(columns)
+            return ~result if negate else result
+        return membership
+
+    if op_type not in _VECTOR_OPS or not isinstance(right, ast.Constant):
+        raise _NotVectorizable()
+    return _vector_compare(*lookup, op_type, right.value)
+
+
+@lru_cache(maxsize=10_000)
+def compile_vectorized(condition_code: str) -> Optional[Callable[[_Columns], Any]]:
+    """
+    Compile a condition into a column-wise closure tree, or None if it
+    uses constructs that have no exact NumPy equivalent.
 
-        print("\n--- API Quota Stats ---")
-        print(f"   Current: Key {stats['current_key']}/{stats['total_keys']}")
-        print(f"   Total Requests: {stats['total_requests']}")
-        print(f"   Total Errors: {stats['total_errors']}")
-        print(f"   Success Rate: {stats['success_rate']}")
-        print("   Per-key breakdown:")
-        for i, (req, err) in enumerate(zip(stats['request_counts'], stats['error_counts'])):
-            print(f"     Key {i + 1}: {req} requests, {err} errors")
-        print("------------------------\n")
+    Supported: ctx.get lookups compared with constants (==, !=, <, <=, >, >=,
+    in / not in a literal list), truthiness, and/or/not and chained comparisons.
+    The closure raises _NotVectorizable when the batch's data types would make
+    Python raise or compare differently, e.g. strings against numbers.
+    """
+    try:
+        return _compile_vector_node(compile_condition(condition_code).tree.body)
+    except _NotVectorizable:
+        return None
 
 
-def create_from_env(verbose: bool = False) -> QuotaAwareGemini:
-    """
-    Create QuotaAwareGemini from environment variables.
-    Looks for GEMINI_KEY_1, GEMINI_KEY_2, etc.
-    Falls back to GEMINI_API_KEY if no numbered keys found.
-    """
-    keys = []
+def evaluate_batch(
+    rules: List["Rule"],
+    batch: Union[Dict[str, Sequence[Any]], List[Dict[str, Any]]],
+    with_actions: bool = True
+) -> BatchResult:
+    """Evaluate rules against a batch of contexts (see LogicEngine.evaluate_batch)."""
+    if np is None:
+        raise ImportError("evaluate_batch requires NumPy: pip install numpy")
+
+    columns = _Columns(batch)
+    matches = np.zeros((len(rules), columns.size), dtype=bool)
+    errors: Dict[Tuple[int, int], str] = {}
+    # Identical conditions are evaluated once per batch
+    shared: Dict[str, Any] = {}
+
+    for i, rule in enumerate(rules):
+        code = rule.condition_code
+        vectorized = compile_vectorized(code) if code is not None else None
+        if vectorized is not None:
+            if code not in shared:
+                try:
+                    shared[code] = vectorized(columns)
+                except _NotVectorizable:
+                    shared[code] = None
+            if shared[code] is not None:
+                matches[i] = shared[code]
+                continue
+
+        for row, context in enumerate(columns.rows()):
+            try:
+                if rule.condition(context):
+                    matches[i, row] = True
+            except Exception as e:
+                errors[(i, row)] = str(e)
 
-    # Collect numbered keys
-    for i in range(1, 11):
-        key = os.getenv(f"GEMINI_KEY_{i}")
-        if key:
-            keys.append(key)
+    actions: List[List[str]] = [[] for _ in range(columns.size)]
+    if not with_actions:
+        return BatchResult(rule_names=[rule.name for rule in rules], matches=matches, actions=actions)
 
-    # Fallback to single key
-    if not keys:
-        single_key = os.getenv("GEMINI_API_KEY")
-        if single_key:
-            print("   No GEMINI_KEY_* found, using single GEMINI_API_KEY")
-            keys.append(single_key)
+    # Group fired cells by row; np.nonzero walks rows in order, rules in order within a row
+    fired: Dict[int, List[int]] = {}
+    for row, i in zip(*(indices.tolist() for indices in np.nonzero(matches.T))):
+        fired.setdefault(row, []).append(i)
+    for i, row in errors:
+        fired.setdefault(row, []).append(i)
 
-    if not keys:
-        raise ValueError(
-            "No API keys found. Set GEMINI_KEY_1, GEMINI_KEY_2, ... "
-            "or GEMINI_API_KEY environment variables."
-        )
+    rows = columns.rows() if fired else []
+    for row, fired_rules in fired.items():
+        context = rows[row]
+        row_errors = {i: errors[(i, row)] for i in fired_rules if (i, row) in errors} if errors else {}
+        actions[row] = render_fired(rules, sorted(fired_rules) if errors else fired_rules, row_errors, context)
 
-    print(f"   QuotaAwareGemini initialized with {len(keys)} key(s)")
-    return QuotaAwareGemini(keys, verbose=verbose)
+    return BatchResult(rule_names=[rule.name for rule in rules], matches=matches, actions=actions)
 
 
 # ============================================
-# LOGIC ENGINE (from solution.py)
+# PARALLEL EVALUATION
+# Shard context streams across worker processes
 # ============================================
 
-@dataclass
-class Rule:
-    """A single business rule"""
-    name: str
-    condition: Callable[[Dict[str, Any]], bool]
-    action: Callable[[Dict[str, Any]], str]
+# Engine rebuilt from rule definitions in each worker process
+_worker_engine: Optional[LogicEngine] = None
 
 
-class LogicEngine:
-    """Simple rules engine for evaluating conditions and taking actions"""
+def _init_worker(engine_class: type, definitions: List[Dict[str, str]]):
+    """Process pool initializer: compile the rules once per worker."""
+    global _worker_engine
+    _worker_engine = engine_class.from_definitions(definitions)
 
-    def __init__(self):
-        self.rules: List[Rule] = []
 
-    def add_rule(self, rule: Rule):
-        """Add a rule to the engine"""
-        self.rules.append(rule)
+def _evaluate_chunk(contexts: List[Dict[str, Any]]) -> List[List[str]]:
+    """Evaluate one chunk of contexts in a worker."""
+    return [_worker_engine.evaluate(context) for context in contexts]
 
-    def remove_rule(self, name: str):
-        """Remove a rule by name"""
-        self.rules = [r for r in self.rules if r.name != name]
 
-    def evaluate(self, context: Dict[str, Any]) -> List[str]:
-        """Evaluate all rules against the context, return actions taken"""
-        actions_taken = []
+def evaluate_many(
+    engine: LogicEngine,
+    contexts: Iterable[Dict[str, Any]],
+    workers: Optional[int] = None,
+    chunksize: int = 256
+) -> Iterator[List[str]]:
+    """Evaluate contexts in worker processes (see LogicEngine.evaluate_many)."""
+    workers = workers or os.cpu_count() or 1
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
 
-        for rule in self.rules:
-            try:
-                if rule.condition(context):
-                    result = rule.action(context)
-                    actions_taken.append(f"{rule.name}: {result}")
-            except Exception as e:
-                actions_taken.append(f"{rule.name}: ERROR - {str(e)}")
+    # Snapshot (and validate) the rules before any worker starts
+    definitions = engine.to_definitions()
 
-        return actions_taken
+    if workers == 1:
+        for context in contexts:
+            yield engine.evaluate(context)
+        return
+
+    iterator = iter(contexts)
+    chunks = iter(lambda: list(itertools.islice(iterator, chunksize)), [])
+
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(type(engine), definitions)
+    )
+    try:
+        # Keep a bounded number of chunks in flight so huge inputs stream
+        pending = deque(pool.submit(_evaluate_chunk, chunk) for chunk in itertools.islice(chunks, workers * 2))
+        while pending:
+            results = pending.popleft().result()
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pending.append(pool.submit(_evaluate_chunk, chunk))
+            yield from results
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
 
 
 # ============================================
@@ -343,6 +3461,109 @@ RULE_SCHEMA = {
     "required": ["name", "condition_code", "action_message"]
 }
 
+# Schema for several rules in one response (see stream_rules)
+RULES_SCHEMA = {
+    "type": "array",
+    "description": "All business rules described in the request",
+    "items": RULE_SCHEMA
+}
+
+# Schema for a batch of described rules; "index" maps each rule back to its description
+BATCH_RULES_SCHEMA = {
+    "type": "array",
+    "description": "One business rule per numbered description",
+    "items": {
+        "type": "object",
+        "properties": {
+            "index": {
+                "type": "integer",
+                "description": "Number of the description this rule implements"
+            },
+            **RULE_SCHEMA["properties"]
+        },
+        "required": ["index"] + RULE_SCHEMA["required"]
+    }
+}
+
+# Response size limits for batched generation: Gemini's default
+# maxOutputTokens, the share of it a batch may plan to use, and the
+# starting estimate of one rule's size (refined from actual responses)
+MAX_OUTPUT_TOKENS = 8192
+BATCH_OUTPUT_SHARE = 0.75
+RULE_OUTPUT_TOKENS = 150
+
+# Context fields generated rules may use (shared by the generation prompts)
+RULE_CONTEXT_FIELDS = """- quantity (int): Number of items
+- order_total (float): Total order amount
+- is_new_customer (bool): First-time customer flag
+- membership_tier (str): "basic", "premium", or "vip"
+- month (str): Current month name
+- loyalty_points (int): Customer loyalty points
+- category (str): Product category"""
+
+
+def rule_from_definition(definition: Dict[str, Any]) -> Rule:
+    """
+    Build a Rule from its RULE_SCHEMA form (plus optional priority, group and fields).
+
+    Raises:
+        RuleCompileError: If condition_code is not an allowed expression
+    """
+    fields = definition.get("fields")
+    return Rule(
+        name=definition["name"],
+        condition=make_condition(definition["condition_code"]),
+        action=make_action(definition["action_message"]),
+        condition_code=definition["condition_code"],
+        action_message=definition["action_message"],
+        fields=None if fields is None else frozenset(fields),
+        priority=definition.get("priority", 0),
+        group=definition.get("group")
+    )
+
+
+def build_rule_prompt(description: str) -> str:
+    """Prompt asking Gemini for one RULE_SCHEMA rule."""
+    return f"""Generate a business rule based on this description:
+
+"{description}"
+
+The rule should work with a context dictionary that may contain fields like:
+{RULE_CONTEXT_FIELDS}
+
+Generate a valid Python condition expression using ctx.get('field') pattern.
+The action_message should describe what happens when the rule triggers."""
+
+
+def build_rules_prompt(policy: str) -> str:
+    """Prompt asking Gemini for every rule in a policy, as a RULES_SCHEMA array."""
+    return f"""Generate one business rule for each requirement in this policy:
+
+"{policy}"
+
+Each rule should work with a context dictionary that may contain fields like:
+{RULE_CONTEXT_FIELDS}
+
+Return a JSON array with one rule per requirement, in the order they appear.
+Generate valid Python condition expressions using ctx.get('field') pattern.
+Each action_message should describe what happens when the rule triggers."""
+
+
+def build_batch_rules_prompt(descriptions: Sequence[str]) -> str:
+    """Prompt asking Gemini for one rule per description, as a BATCH_RULES_SCHEMA array."""
+    numbered = "\n".join(f"[{i}] {description}" for i, description in enumerate(descriptions))
+    return f"""Generate one business rule for each numbered description below:
+
+{numbered}
+
+Each rule should work with a context dictionary that may contain fields like:
+{RULE_CONTEXT_FIELDS}
+
+Return a JSON array with one rule per description. Set each rule's index to
+the number of the description it implements.
+Generate valid Python condition expressions using ctx.get('field') pattern.
+Each action_message should describe what happens when the rule triggers."""
+
 
 def generate_rule_from_description(
     api: QuotaAwareGemini,
@@ -363,52 +3584,18 @@ def generate_rule_from_description(
     Returns:
         Rule object ready to add to engine, or None on failure
     """
-    prompt = f"""Generate a business rule based on this description:
-
-"{description}"
-
-The rule should work with a context dictionary that may contain fields like:
-- quantity (int): Number of items
-- order_total (float): Total order amount
-- is_new_customer (bool): First-time customer flag
-- membership_tier (str): "basic", "premium", or "vip"
-- month (str): Current month name
-- loyalty_points (int): Customer loyalty points
-- category (str): Product category
-
-Generate a valid Python condition expression using ctx.get('field') pattern.
-The action_message should describe what happens when the rule triggers."""
+    prompt = build_rule_prompt(description)
 
     try:
         result = api.call_structured(prompt, RULE_SCHEMA)
 
         # Convert JSON rule to Python Rule object
-        # SAFETY: The condition_code is evaluated in a restricted context
+        # SAFETY: The condition_code is validated against an AST whitelist
+        # and compiled once; invalid code raises RuleCompileError
         condition_code = result["condition_code"]
         action_message = result["action_message"]
 
-        def make_condition(code: str):
-            """Create a condition lambda from code string."""
-            def condition(ctx: Dict[str, Any]) -> bool:
-                # Evaluate in restricted namespace
-                return eval(code, {"__builtins__": {}}, {"ctx": ctx})
-            return condition
-
-        def make_action(template: str):
-            """Create an action lambda from message template."""
-            def action(ctx: Dict[str, Any]) -> str:
-                # Format with context values
-                try:
-                    return template.format(**ctx)
-                except KeyError:
-                    return template
-            return action
-
-        rule = Rule(
-            name=result["name"],
-            condition=make_condition(condition_code),
-            action=make_action(action_message)
-        )
+        rule = rule_from_definition(result)
 
         print(f"   Generated rule: {result['name']}")
         print(f"   Condition: {condition_code}")
@@ -423,6 +3610,221 @@ The action_message should describe what happens when the rule triggers."""
         return None
 
 
+@dataclass
+class GenerationResult:
+    """Outcome of generating one rule in a batch"""
+    description: str
+    rule: Optional[Rule] = None
+    error: Optional[str] = None
+
+
+async def generate_rules_async(
+    api: AsyncQuotaAwareGemini,
+    descriptions: List[str],
+    deadline: Optional[float] = None
+) -> List[GenerationResult]:
+    """
+    Generate rules for many descriptions concurrently.
+
+    Requests fan out across all keys, limited by the client's per-key
+    concurrency. A failed description is reported in its result and does
+    not stop the batch. deadline (default: api.deadline) applies to each call.
+
+    Returns:
+        One GenerationResult per description, in input order
+    """
+    async def generate(description: str) -> GenerationResult:
+        try:
+            result = await api.call_structured(build_rule_prompt(description), RULE_SCHEMA, deadline=deadline)
+            return GenerationResult(description, rule=rule_from_definition(result))
+        except Exception as e:
+            return GenerationResult(description, error=str(e))
+
+    return list(await asyncio.gather(*(generate(d) for d in descriptions)))
+
+
+def stream_rules(
+    api: QuotaAwareGemini,
+    policy: str,
+    engine: Optional["LogicEngine"] = None
+) -> Iterator[GenerationResult]:
+    """
+    Generate all rules of a policy in one streamed call, yielding each as it arrives.
+
+    The response is parsed incrementally (JSONArrayStream), so the first
+    rule is compiled - and added to engine, if given - while the model is
+    still generating the rest. A rule that fails to compile is reported in
+    its result and skipped.
+
+    Args:
+        api: QuotaAwareGemini instance
+        policy: Natural language description of one or more rules
+        engine: Optional engine to add each valid rule to on arrival
+
+    Yields:
+        One GenerationResult per generated rule, in response order
+    """
+    for definition in api.stream_structured(build_rules_prompt(policy), RULES_SCHEMA):
+        description = definition.get("description") or definition.get("name", "")
+        try:
+            rule = rule_from_definition(definition)
+        except Exception as e:
+            yield GenerationResult(description, error=str(e))
+            continue
+        if engine is not None:
+            engine.add_rule(rule)
+        yield GenerationResult(description, rule=rule)
+
+
+def generate_rules_from_descriptions(
+    api: QuotaAwareGemini,
+    descriptions: List[str],
+    max_concurrency_per_key: int = 4,
+    deadline: Optional[float] = None
+) -> List[GenerationResult]:
+    """
+    Generate rules for many descriptions concurrently with a blocking client.
+
+    Each description is one api.call_structured() on a thread pool of up
+    to len(api.keys) x max_concurrency_per_key workers, so the batch uses api's
+    own pooled session, cache, hedging, deadlines and statistics. While the
+    batch runs, api.limit_keys(max_concurrency_per_key) holds every key to
+    that many requests in flight, so the workers spread over the keys
+    (api's KeyScheduler picks the keys instead, if it has one). Give api a
+    pool_size of at least the worker count to keep every connection alive.
+
+    Args:
+        api: QuotaAwareGemini instance (use generate_rules_async for the async client)
+        descriptions: Natural language rule descriptions
+        max_concurrency_per_key: Requests in flight per key
+        deadline: Seconds each call may take (default: api.deadline)
+
+    Returns:
+        One GenerationResult per description, in input order
+    """
+    if isinstance(api, AsyncQuotaAwareGemini):
+        raise TypeError("Use 'await generate_rules_async(api, descriptions)' with AsyncQuotaAwareGemini")
+
+    def generate(description: str) -> GenerationResult:
+        try:
+            result = api.call_structured(build_rule_prompt(description), RULE_SCHEMA, deadline=deadline)
+            return GenerationResult(description, rule=rule_from_definition(result))
+        except Exception as e:
+            return GenerationResult(description, error=str(e))
+
+    workers = max(1, min(len(descriptions), len(api.keys) * max_concurrency_per_key))
+    with api.limit_keys(max_concurrency_per_key):
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gemini-generate") as executor:
+            return list(executor.map(generate, descriptions))
+
+
+def batch_size_for(
+    tokens_per_rule: float,
+    max_output_tokens: int = MAX_OUTPUT_TOKENS,
+    max_batch: int = 25
+) -> int:
+    """Descriptions per request so the expected response fits the output token limit."""
+    fitting = int(max_output_tokens * BATCH_OUTPUT_SHARE // max(1.0, tokens_per_rule))
+    return max(1, min(max_batch, fitting))
+
+
+def generate_rules_batched(
+    api: QuotaAwareGemini,
+    descriptions: List[str],
+    max_batch: int = 25,
+    max_output_tokens: int = MAX_OUTPUT_TOKENS
+) -> List[GenerationResult]:
+    """
+    Generate rules for many descriptions, several per structured call.
+
+    Each request carries the prompt preamble and field list once, followed
+    by the numbered descriptions, and asks for a BATCH_RULES_SCHEMA array.
+    Rules are matched to descriptions by their index, not their position.
+
+    Batch size follows the response limit: as many descriptions as fit
+    in BATCH_OUTPUT_SHARE of max_output_tokens, using the size of the
+    rules received so far (RULE_OUTPUT_TOKENS before the first response).
+    When a response cannot be decoded or is not a BATCH_RULES_SCHEMA array
+    (usually a truncated response), the batch is split in half and both
+    halves are retried, and the per-rule estimate is doubled. Transport
+    failures, exhausted keys and DeadlineExceeded do not depend on the
+    batch's size: every description in the batch is reported as failed
+    with that error, without resending it in smaller pieces. When some
+    descriptions get no rule or a rule that does not compile, only those
+    are retried, in batches half the size. A description is reported as
+    failed once it has failed in a batch of its own.
+
+    Args:
+        api: QuotaAwareGemini instance
+        descriptions: Natural language rule descriptions
+        max_batch: Most descriptions in one request
+        max_output_tokens: Response token limit of the model
+
+    Returns:
+        One GenerationResult per description, in input order
+    """
+    results: List[Optional[GenerationResult]] = [None] * len(descriptions)
+    pending = deque(range(len(descriptions)))
+    retries: deque = deque()  # batches of description indices to resend
+    tokens_per_rule = float(RULE_OUTPUT_TOKENS)
+
+    while pending or retries:
+        if retries:
+            batch = retries.popleft()
+        else:
+            size = batch_size_for(tokens_per_rule, max_output_tokens, max_batch)
+            batch = [pending.popleft() for _ in range(min(size, len(pending)))]
+
+        try:
+            response = api.call_structured(
+                build_batch_rules_prompt([descriptions[i] for i in batch]), BATCH_RULES_SCHEMA
+            )
+            if not isinstance(response, list):
+                raise ValueError(f"Expected a JSON array of rules, got {type(response).__name__}")
+        except Exception as e:
+            # requests raises some transport errors (InvalidURL, ...) as ValueError too
+            if not isinstance(e, ValueError) or isinstance(e, requests.exceptions.RequestException):
+                # The client already retried across keys; splitting would only multiply requests
+                for i in batch:
+                    results[i] = GenerationResult(descriptions[i], error=str(e))
+                continue
+            # Undecodable or off-schema: smaller batches give shorter responses
+            tokens_per_rule *= 2
+            if len(batch) == 1:
+                results[batch[0]] = GenerationResult(descriptions[batch[0]], error=str(e))
+            else:
+                half = len(batch) // 2
+                retries.extendleft([batch[half:], batch[:half]])
+            continue
+
+        definitions: Dict[int, Dict[str, Any]] = {}
+        for definition in response:
+            position = definition.get("index") if isinstance(definition, dict) else None
+            if isinstance(position, int) and 0 <= position < len(batch):
+                definitions.setdefault(position, definition)
+        if definitions:
+            received = sum(estimate_tokens(json.dumps(d)) for d in definitions.values()) / len(definitions)
+            tokens_per_rule = (tokens_per_rule + received) / 2
+
+        failed = []
+        for position, i in enumerate(batch):
+            definition = definitions.get(position)
+            try:
+                if definition is None:
+                    raise ValueError("No rule returned for this description")
+                results[i] = GenerationResult(descriptions[i], rule=rule_from_definition(definition))
+            except Exception as e:
+                if len(batch) == 1:
+                    results[i] = GenerationResult(descriptions[i], error=str(e))
+                else:
+                    failed.append(i)
+
+        size = max(1, len(batch) // 2)
+        retries.extendleft(reversed([failed[j:j + size] for j in range(0, len(failed), size)]))
+
+    return results
+
+
 # ============================================
 # DEMO: AI-Powered Rule Generation
 # ============================================
@@ -461,11 +3863,16 @@ if __name__ == "__main__":
 
     print("\nGenerating rules from natural language...\n")
 
-    for desc in rule_descriptions:
-        print(f"\nInput: \"{desc}\"")
-        rule = generate_rule_from_description(api, desc)
-        if rule:
-            engine.add_rule(rule)
+    # All descriptions are sent concurrently across the available keys
+    for generated in generate_rules_from_descriptions(api, rule_descriptions):
+        print(f"\nInput: \"{generated.description}\"")
+        if generated.rule:
+            print(f"   Generated rule: {generated.rule.name}")
+            print(f"   Condition: {generated.rule.condition_code}")
+            print(f"   Action: {generated.rule.action_message}")
+            engine.add_rule(generated.rule)
+        else:
+            print(f"   Failed to generate rule: {generated.error}")
 
     # Test the generated rules
     print("\n" + "=" * 60)
@@ -0,0 +1,228 @@
+"""
+Module 06 - Discrimination-Network Matcher
+==========================================
+
+A Rete-style alternative to the linear LogicEngine loop.
+
+Generated rules repeat the same sub-tests over and over (dozens of rules
+check ctx.get('membership_tier') == 'premium'). ReteLogicEngine breaks each
+rule's condition_code into a small network:
+
+- Alpha nodes: atomic tests such as field comparisons, shared by every rule
+  that contains the same test
+- Join nodes: and / or / not combinations of other nodes, also shared
+- Terminals: one per distinct condition, listing the rules that use it
+
+Every distinct node runs at most once per context, and lazily, so `and`/`or`
+short-circuit exactly like the original expression. Each distinct
+action_message is likewise rendered once per context. Rules without
+condition_code (hand-written lambdas) are kept as opaque terminals.
+
+evaluate() returns exactly what LogicEngine.evaluate() returns, including
+the per-rule "ERROR - ..." entries. Like LogicEngine's rule set, the
+network is published as a whole with the snapshot: appended rules extend
+a new network that shares the existing nodes, any other change builds a
+fresh one, and threads evaluating meanwhile keep using the network they
+started with.
+
+Usage:
+    from rete_matcher import ReteLogicEngine
+    engine = ReteLogicEngine()
+    engine.add_rule(rule_from_definition({...}))
+"""
+
+import ast
+from typing import List, Dict, Any, Callable, Tuple
+
+from logic_engine_ai import (
+    FIRE_ALL, PENDING, LogicEngine, MemoizedFailure, Rule, RuleIndex, compile_condition, render_fired
+)
+
+
+def _same_rule(a: Rule, b: Rule) -> bool:
+    """Whether two rules need the same place in the network (same name and source form)."""
+    if a is b:
+        return True
+    return (
+        a.condition_code is not None and b.condition_code is not None
+        and a.action_message is not None and b.action_message is not None
+        and (a.name, a.condition_code, a.action_message) == (b.name, b.condition_code, b.action_message)
+    )
+
+
+class _Network:
+    """
+    Nodes and terminals for one published rule set.
+
+    A published network is never changed. extended() returns a new network
+    for appended rules that shares this one's nodes: the node list only
+    grows, and readers only reach nodes that existed when their terminals
+    were built.
+    """
+    __slots__ = ("rules", "nodes", "node_ids", "terminals", "opaque")
+
+    def __init__(self, rules: Tuple[Rule, ...] = ()):
+        self.rules = rules
+        self.nodes: List[Callable[[Dict[str, Any], list], bool]] = []
+        self.node_ids: Dict[str, int] = {}
+        # Distinct terminal node id -> positions (into rules) of rules using it
+        self.terminals: Dict[int, List[int]] = {}
+        self.opaque: List[int] = []
+        for position, rule in enumerate(rules):
+            self._link(position, rule)
+
+    def extended(self, rules: Tuple[Rule, ...]) -> "_Network":
+        """A network for rules, which start with this network's rules."""
+        network = _Network.__new__(_Network)
+        network.rules = rules
+        network.nodes = self.nodes
+        network.node_ids = self.node_ids
+        network.terminals = {node_id: list(positions) for node_id, positions in self.terminals.items()}
+        network.opaque = list(self.opaque)
+        for position in range(len(self.rules), len(rules)):
+            network._link(position, rules[position])
+        return network
+
+    def _link(self, position: int, rule: Rule):
+        """Attach a rule to the terminal for its condition."""
+        if rule.condition_code is None:
+            self.opaque.append(position)
+            return
+        tree = compile_condition(rule.condition_code).tree
+        node_id = self._node(tree.body)
+        self.terminals.setdefault(node_id, []).append(position)
+
+    def _node(self, expr: ast.expr) -> int:
+        """Return the id of the shared node for an expression, creating it if needed."""
+        key = ast.dump(expr)
+        node_id = self.node_ids.get(key)
+        if node_id is not None:
+            return node_id
+
+        if isinstance(expr, ast.BoolOp):
+            children = tuple(self._node(value) for value in expr.values)
+            node = self._join(children, isinstance(expr.op, ast.And))
+        elif isinstance(expr, ast.UnaryOp) and isinstance(expr.op, ast.Not):
+            node = self._negation(self._node(expr.operand))
+        else:
+            node = None
+
+        node_id = len(self.nodes)
+        if node is None:
+            node = self._alpha(node_id, compile_condition(ast.unparse(expr)).func)
+        else:
+            node = self._memoized(node_id, node)
+        self.nodes.append(node)
+        self.node_ids[key] = node_id
+        return node_id
+
+    def _alpha(self, node_id: int, test: Callable[[Dict[str, Any]], Any]):
+        """Alpha node: an atomic test evaluated once per context."""
+        def alpha(ctx: Dict[str, Any], memo: list) -> bool:
+            value = memo[node_id]
+            if value is PENDING:
+                try:
+                    value = memo[node_id] = bool(test(ctx))
+                except Exception as e:
+                    memo[node_id] = MemoizedFailure(e)
+                    raise
+            elif value.__class__ is MemoizedFailure:
+                raise value.error
+            return value
+        return alpha
+
+    def _join(self, children: Tuple[int, ...], conjunction: bool):
+        """Join node: and / or over child nodes, short-circuiting in order."""
+        nodes = self.nodes
+
+        def join(ctx: Dict[str, Any], memo: list) -> bool:
+            for child in children:
+                if bool(nodes[child](ctx, memo)) is not conjunction:
+                    return not conjunction
+            return conjunction
+        return join
+
+    def _negation(self, child: int):
+        """Join node: logical not of a child node."""
+        nodes = self.nodes
+
+        def negation(ctx: Dict[str, Any], memo: list) -> bool:
+            return not nodes[child](ctx, memo)
+        return negation
+
+    def _memoized(self, node_id: int, node: Callable[[Dict[str, Any], list], bool]):
+        """Cache a join node's result (or exception) for the current context."""
+        def memoized(ctx: Dict[str, Any], memo: list) -> bool:
+            value = memo[node_id]
+            if value is PENDING:
+                try:
+                    value = memo[node_id] = node(ctx, memo)
+                except Exception as e:
+                    memo[node_id] = MemoizedFailure(e)
+                    raise
+            elif value.__class__ is MemoizedFailure:
+                raise value.error
+            return value
+        return memoized
+
+
+class ReteLogicEngine(LogicEngine):
+    """LogicEngine that shares condition sub-tests through a discrimination network"""
+
+    def __init__(self, instrument: bool = False):
+        super().__init__(instrument)
+        self._network = _Network()
+
+    def _publish(self, index: RuleIndex):
+        """Publish the new rule set with its network: extended for appended rules, else rebuilt."""
+        previous = self._network
+        super()._publish(index)
+        rules = self.rules
+        if len(rules) >= len(previous.rules) and all(map(_same_rule, previous.rules, rules)):
+            self._network = previous.extended(rules)
+        else:
+            self._network = _Network(rules)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get network size statistics."""
+        network = self._network
+        return {
+            "rules": len(network.rules),
+            "nodes": len(network.nodes),
+            "terminals": len(network.terminals),
+            "opaque_rules": len(network.opaque),
+        }
+
+    def evaluate(self, context: Dict[str, Any], strategy: str = FIRE_ALL) -> List[str]:
+        """Evaluate all rules against the context, return actions taken"""
+        if strategy != FIRE_ALL or self.metrics is not None:
+            # Salience strategies stop early and instrumentation times each
+            # rule separately; neither uses the network
+            return super().evaluate(context, strategy)
+
+        network = self._network
+        nodes = network.nodes
+        rules = network.rules
+        memo = [PENDING] * len(nodes)
+        errors: Dict[int, Exception] = {}
+        fired: List[int] = []
+
+        for node_id, positions in network.terminals.items():
+            try:
+                if nodes[node_id](context, memo):
+                    fired.extend(positions)
+            except Exception as e:
+                for position in positions:
+                    errors[position] = e
+                fired.extend(positions)
+
+        for position in network.opaque:
+            try:
+                if rules[position].condition(context):
+                    fired.append(position)
+            except Exception as e:
+                errors[position] = e
+                fired.append(position)
+
+        fired.sort()
+        return render_fired(rules, fired, errors, context)
@@ -0,0 +1,567 @@
+"""
+Module 06 - Static Rule Analysis
+================================
+
+Generated rule sets are full of near-duplicates: two "bulk discount" rules
+with quantity >= 10 and quantity >= 12, the same rule generated twice, or
+a condition like quantity > 50 and quantity < 10 that can never be true.
+Every one of them is still evaluated on every context.
+
+analyze_rules() reads each condition_code as a conjunction of per-field
+constraints - numeric intervals from <, <=, >, >=, sets from ==, in and
+same-field `or`, exclusions from != and not in, and truthiness - and finds:
+
+- unsatisfiable: the constraints on some field contradict each other
+- duplicate: same name, action, priority and group as an earlier rule, with
+  an equivalent condition (the rule only repeats that rule's action line)
+- equivalent: a different rule whose condition is equivalent to an earlier
+  one; it can share that condition's source (and compiled function)
+- subsumed: the rule can only fire when another rule fires too
+
+prune_definitions() drops unsatisfiable and duplicate rules, and rewrites
+equivalent conditions to one shared source, so engines that run each
+distinct condition once per context (ReteLogicEngine, CompactLogicEngine)
+evaluate it once. Subsumed rules are only flagged: whether both discounts
+should apply is a business decision.
+
+The constraints assume fields hold values of the type their comparisons
+imply (numbers for <, >=, ...). With any other value - a string quantity,
+or None from a missing field without a default - such a condition raises
+and evaluate() reports "ERROR - ..." for the rule, unsatisfiable or not.
+So by default only conditions that cannot raise (==, !=, truthiness and
+membership in a literal list or tuple) are removed as unsatisfiable or
+rewritten to an equivalent source; the others are reported (an
+unsatisfiable one with may_raise set) and kept, and pruning never changes
+evaluate() output beyond dropping the repeated lines of duplicate rules.
+assume_types=True applies the constraints to every condition. Conditions
+or parts of conditions the analysis doesn't understand are compared by
+their exact syntax only, so it never merges rules it can't prove
+equivalent.
+
+Usage:
+    from rule_analysis import prune_definitions
+    definitions, report = prune_definitions(definitions)
+    print(report.summary())
+    engine = LogicEngine.from_definitions(definitions)
+
+    python rule_analysis.py rules.json -o pruned.json
+"""
+
+import ast
+import json
+import math
+import argparse
+from dataclasses import dataclass, field, replace
+from typing import List, Dict, Any, Optional, Tuple, FrozenSet, Iterable
+
+from logic_engine_ai import compile_condition, context_lookup
+
+# (field, default) of a ctx.get call
+Lookup = Tuple[str, Any]
+
+_ORDERING = {ast.Gt: ">", ast.GtE: ">=", ast.Lt: "<", ast.LtE: "<="}
+_MIRRORED = {">": "<", ">=": "<=", "<": ">", "<=": ">=", "==": "==", "!=": "!="}
+_NEGATED = {">": "<=", ">=": "<", "<": ">=", "<=": ">", "==": "!=", "!=": "==", "in": "not in", "not in": "in"}
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and value == value
+
+
+# ============================================
+# FIELD CONSTRAINTS
+# ============================================
+
+@dataclass(frozen=True)
+class Constraint:
+    """The values one ctx.get lookup may take for a condition to hold."""
+    lo: float = -math.inf
+    lo_open: bool = False
+    hi: float = math.inf
+    hi_open: bool = False
+    numeric: bool = False                       # an ordering comparison applies
+    allowed: Optional[FrozenSet[Any]] = None    # from ==, in; None = any value
+    excluded: FrozenSet[Any] = frozenset()      # from !=, not in
+    truth: Optional[bool] = None                # from bare / negated lookups
+
+    def admits(self, value: Any) -> bool:
+        """Whether the lookup returning value satisfies the constraint."""
+        try:
+            if self.allowed is not None and value not in self.allowed:
+                return False
+            if value in self.excluded:
+                return False
+        except TypeError:  # unhashable
+            return False
+        if self.truth is not None and bool(value) is not self.truth:
+            return False
+        if self.numeric:
+            if not _is_number(value):
+                return False
+            if value < self.lo or (value == self.lo and self.lo_open):
+                return False
+            if value > self.hi or (value == self.hi and self.hi_open):
+                return False
+        return True
+
+    def _finite(self) -> Optional[FrozenSet[Any]]:
+        """Every admitted value, if there are finitely many."""
+        if self.allowed is not None:
+            return frozenset(value for value in self.allowed if self.admits(value))
+        if self.numeric and self.lo == self.hi:
+            return frozenset(value for value in (self.lo,) if self.admits(value))
+        if self.numeric and self.truth is False:
+            return frozenset(value for value in (0,) if self.admits(value))
+        return None
+
+    def is_empty(self) -> bool:
+        if self.numeric and (self.lo > self.hi or (self.lo == self.hi and (self.lo_open or self.hi_open))):
+            return True
+        finite = self._finite()
+        return finite is not None and not finite
+
+    def intersect(self, other: "Constraint") -> "Constraint":
+        lo, lo_open = max((self.lo, self.lo_open), (other.lo, other.lo_open))
+        hi, hi_open = min((self.hi, not self.hi_open), (other.hi, not other.hi_open))
+        if self.allowed is None:
+            allowed = other.allowed
+        elif other.allowed is None:
+            allowed = self.allowed
+        else:
+            allowed = self.allowed & other.allowed
+        if self.truth is not None and other.truth is not None and self.truth is not other.truth:
+            allowed = frozenset()
+        return Constraint(
+            lo, lo_open, hi, not hi_open,
+            self.numeric or other.numeric,
+            allowed,
+            self.excluded | other.excluded,
+            self.truth if self.truth is not None else other.truth
+        )
+
+    def implies(self, other: "Constraint") -> bool:
+        """Whether every value admitted here is admitted by other (False when unsure)."""
+        finite = self._finite()
+        if finite is not None:
+            return all(other.admits(value) for value in finite)
+        if other.allowed is not None or (other.truth is False and self.truth is not False):
+            return False
+        if any(self.admits(value) for value in other.excluded):
+            return False
+        if other.truth is True and not (self.truth is True or (self.numeric and not self.admits(0))):
+            return False
+        if other.numeric:
+            if not self.numeric:
+                return False
+            if self.lo < other.lo or (self.lo == other.lo and other.lo_open and not self.lo_open):
+                return False
+            if self.hi > other.hi or (self.hi == other.hi and other.hi_open and not self.hi_open):
+                return False
+        return True
+
+    def canonical(self) -> Tuple:
+        """Hashable form; equal for constraints that admit the same values."""
+        if self.is_empty():
+            return ("empty",)
+        finite = self._finite()
+        if finite is not None:
+            return ("in", finite)
+        return (self.lo, self.lo_open, self.hi, self.hi_open, self.numeric,
+                frozenset(value for value in self.excluded if self.admits_type(value)), self.truth)
+
+    def admits_type(self, value: Any) -> bool:
+        """Whether value could pass the numeric/truth parts (exclusions beyond them are moot)."""
+        return replace(self, excluded=frozenset()).admits(value)
+
+
+def _comparison(op: str, value: Any) -> Optional[Constraint]:
+    """Constraint for `lookup <op> value`."""
+    if op in ("==", "in"):
+        return Constraint(allowed=frozenset(value) if op == "in" else frozenset((value,)))
+    if op in ("!=", "not in"):
+        return Constraint(excluded=frozenset(value) if op == "not in" else frozenset((value,)))
+    if not _is_number(value):
+        return None
+    if op == ">":
+        return Constraint(lo=value, lo_open=True, numeric=True)
+    if op == ">=":
+        return Constraint(lo=value, numeric=True)
+    if op == "<":
+        return Constraint(hi=value, hi_open=True, numeric=True)
+    return Constraint(hi=value, numeric=True)
+
+
+# ============================================
+# CONDITION PARSING
+# ============================================
+
+@dataclass
+class ConditionSummary:
+    """A condition as per-lookup constraints plus conjuncts the analysis can't read."""
+    fields: Dict[Lookup, Constraint] = field(default_factory=dict)
+    opaque: FrozenSet[str] = frozenset()   # ast.dump of unrecognized conjuncts
+    may_raise: bool = False                # some context could make it raise
+
+    def add(self, lookup: Lookup, constraint: Constraint):
+        current = self.fields.get(lookup)
+        self.fields[lookup] = constraint if current is None else current.intersect(constraint)
+
+    def is_unsatisfiable(self) -> bool:
+        return any(constraint.is_empty() for constraint in self.fields.values())
+
+    def implies(self, other: "ConditionSummary") -> bool:
+        """Whether this condition holding guarantees other holds."""
+        if not other.opaque <= self.opaque:
+            return False
+        unconstrained = Constraint()
+        return all(
+            self.fields.get(lookup, unconstrained).implies(constraint)
+            for lookup, constraint in other.fields.items()
+        )
+
+    def canonical(self) -> Tuple:
+        return (
+            frozenset((lookup, constraint.canonical()) for lookup, constraint in self.fields.items()),
+            self.opaque
+        )
+
+
+def _lookup(node: ast.expr) -> Optional[Lookup]:
+    """(field, default) for ctx.get('field') / ctx.get('field', constant)."""
+    lookup = context_lookup(node)
+    if lookup is None or not lookup.constant_default:
+        return None
+    return lookup.field, lookup.default_value
+
+
+def _constant(node: ast.expr) -> Tuple[bool, Any]:
+    """(True, value) for a literal constant or a literal list/tuple/set of them."""
+    try:
+        value = ast.literal_eval(node)
+    except (ValueError, TypeError):
+        return False, None
+    if isinstance(value, (list, tuple, set, frozenset)):
+        try:
+            return True, frozenset(value)
+        except TypeError:
+            return False, None
+    return True, value
+
+
+def _atom(node: ast.expr, negate: bool) -> Optional[Tuple[Lookup, Constraint]]:
+    """A single-lookup test: `lookup`, `lookup <op> constant` or `constant <op> lookup`."""
+    lookup = _lookup(node)
+    if lookup is not None:
+        return lookup, Constraint(truth=not negate)
+
+    if not isinstance(node, ast.Compare) or len(node.ops) != 1:
+        return None
+    left, right, op_node = node.left, node.comparators[0], node.ops[0]
+    if isinstance(op_node, (ast.In, ast.NotIn)):
+        lookup = _lookup(left)
+        ok, value = _constant(right)
+        if lookup is None or not ok or not isinstance(value, frozenset):
+            return None
+        op = "in" if isinstance(op_node, ast.In) else "not in"
+    else:
+        op = _ORDERING.get(type(op_node)) or {ast.Eq: "==", ast.NotEq: "!="}.get(type(op_node))
+        if op is None:
+            return None
+        lookup = _lookup(left)
+        if lookup is None:
+            lookup, right = _lookup(right), left
+            op = _MIRRORED[op]
+        ok, value = _constant(right)
+        if lookup is None or not ok or isinstance(value, frozenset):
+            return None
+        try:
+            hash(value)
+        except TypeError:
+            return None
+
+    constraint = _comparison(_NEGATED[op] if negate else op, value)
+    return None if constraint is None else (lookup, constraint)
+
+
+def _same_field_disjunction(values: List[ast.expr], negate: bool) -> Optional[Tuple[Lookup, Constraint]]:
+    """`lookup == a or lookup in (b, c)` as one allowed set."""
+    if negate:
+        return None
+    lookup, allowed = None, frozenset()
+    for value in values:
+        atom = _atom(value, False)
+        if atom is None or atom[1].allowed is None or (lookup is not None and atom[0] != lookup):
+            return None
+        lookup, allowed = atom[0], allowed | atom[1].allowed
+    return lookup, Constraint(allowed=allowed)
+
+
+def _conjuncts(node: ast.expr, negate: bool, summary: ConditionSummary, opaque: List[str]):
+    """Add node (or `not node`) to summary as a conjunction of constraints."""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        _conjuncts(node.operand, not negate, summary, opaque)
+        return
+
+    # a and b, or (by De Morgan) not (a or b)
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And) is not negate:
+        for value in node.values:
+            _conjuncts(value, negate, summary, opaque)
+        return
+
+    # Chained comparisons: a < x <= b is a < x and x <= b
+    if isinstance(node, ast.Compare) and len(node.ops) > 1 and not negate:
+        operands = [node.left] + node.comparators
+        for i, op in enumerate(node.ops):
+            _conjuncts(ast.Compare(operands[i], [op], [operands[i + 1]]), False, summary, opaque)
+        return
+
+    atom = _atom(node, negate)
+    if atom is None and isinstance(node, ast.BoolOp):
+        atom = _same_field_disjunction(node.values, negate)
+    if atom is None:
+        opaque.append(("not " if negate else "") + ast.dump(node))
+    else:
+        summary.add(*atom)
+
+
+def _can_raise(node: ast.expr) -> bool:
+    """Whether evaluating node may raise for some context (True when unsure)."""
+    if isinstance(node, ast.Constant) or _lookup(node) is not None:
+        return False
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return any(_can_raise(element) for element in node.elts)
+    if isinstance(node, ast.BoolOp):
+        return any(_can_raise(value) for value in node.values)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return _can_raise(node.operand)
+    if isinstance(node, ast.IfExp):
+        return _can_raise(node.test) or _can_raise(node.body) or _can_raise(node.orelse)
+    if isinstance(node, ast.Compare):
+        for op, right in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)):
+                # A set literal raises on unhashable values, a field on non-containers
+                if not isinstance(right, (ast.List, ast.Tuple)):
+                    return True
+            elif not isinstance(op, (ast.Eq, ast.NotEq, ast.Is, ast.IsNot)):
+                # Ordering raises on mismatched types
+                return True
+        return any(_can_raise(operand) for operand in [node.left] + node.comparators)
+    return True
+
+
+def summarize_condition(condition_code: str) -> ConditionSummary:
+    """
+    Read a condition as per-field constraints.
+
+    Raises:
+        RuleCompileError: If condition_code is not an allowed expression
+    """
+    summary = ConditionSummary()
+    opaque: List[str] = []
+    body = compile_condition(condition_code).tree.body
+    _conjuncts(body, False, summary, opaque)
+    summary.opaque = frozenset(opaque)
+    summary.may_raise = _can_raise(body)
+    return summary
+
+
+# ============================================
+# RULE SET ANALYSIS
+# ============================================
+
+@dataclass
+class Finding:
+    """One analysis result; other is the earlier rule it relates to."""
+    kind: str       # "unsatisfiable", "duplicate", "equivalent" or "subsumed"
+    rule: str
+    other: Optional[str] = None
+    position: int = -1
+    # Unsatisfiable only for the types its comparisons imply; kept by default
+    may_raise: bool = False
+
+    def __str__(self) -> str:
+        if self.kind == "unsatisfiable":
+            if self.may_raise:
+                return f"'{self.rule}' can never fire, but its condition can raise for other value types"
+            return f"'{self.rule}' can never fire"
+        if self.kind == "duplicate":
+            return f"'{self.rule}' duplicates '{self.other}'"
+        if self.kind == "equivalent":
+            return f"'{self.rule}' has the same condition as '{self.other}'"
+        return f"'{self.rule}' only fires when '{self.other}' fires"
+
+
+@dataclass
+class AnalysisReport:
+    """Findings plus the evaluation work pruning removes"""
+    findings: List[Finding]
+    rules_before: int
+    rules_after: int
+    conditions_before: int      # distinct condition sources
+    conditions_after: int
+
+    def by_kind(self, kind: str) -> List[Finding]:
+        return [finding for finding in self.findings if finding.kind == kind]
+
+    def summary(self) -> str:
+        counts = {kind: len(self.by_kind(kind)) for kind in ("unsatisfiable", "duplicate", "equivalent", "subsumed")}
+        saved = self.rules_before - self.rules_after
+        return (
+            f"{counts['unsatisfiable']} unsatisfiable, {counts['duplicate']} duplicate, "
+            f"{counts['equivalent']} equivalent, {counts['subsumed']} subsumed. "
+            f"Rules evaluated per context: {self.rules_before} -> {self.rules_after} "
+            f"({saved / self.rules_before:.0%} less); "
+            f"distinct conditions: {self.conditions_before} -> {self.conditions_after}"
+            if self.rules_before else "No rules"
+        )
+
+
+def _rule_identity(definition: Dict[str, Any]) -> Tuple:
+    return (
+        definition["name"], definition["action_message"],
+        definition.get("priority", 0), definition.get("group")
+    )
+
+
+def analyze_rules(
+    definitions: Iterable[Dict[str, Any]],
+    subsumption: bool = True,
+    assume_types: bool = False
+) -> AnalysisReport:
+    """
+    Find unsatisfiable, duplicate, equivalent and subsumed rules.
+
+    Args:
+        definitions: RULE_SCHEMA rule definitions, in evaluation order
+        subsumption: Also compare every pair of distinct conditions
+            (quadratic in the number of distinct conditions)
+        assume_types: Trust the constraints of conditions that can raise
+            too (see the module docstring)
+
+    Returns:
+        AnalysisReport; rules_after / conditions_after describe the
+        prune_definitions() result
+
+    Raises:
+        RuleCompileError: If a condition_code is not an allowed expression
+    """
+    return _analyze(list(definitions), subsumption, assume_types)[1]
+
+
+def prune_definitions(
+    definitions: Iterable[Dict[str, Any]],
+    subsumption: bool = True,
+    assume_types: bool = False
+) -> Tuple[List[Dict[str, Any]], AnalysisReport]:
+    """
+    Drop unsatisfiable and duplicate rules and share equivalent conditions.
+
+    By default a condition that can raise is neither removed nor
+    rewritten, so the pruned rules evaluate to the same actions and
+    errors apart from duplicate lines. assume_types=True also prunes
+    those, which changes the "ERROR - ..." output for contexts whose
+    fields don't hold the types the comparisons imply.
+
+    Returns:
+        (pruned definitions in the original order, AnalysisReport)
+    """
+    return _analyze(list(definitions), subsumption, assume_types)
+
+
+def _analyze(
+    definitions: List[Dict[str, Any]],
+    subsumption: bool,
+    assume_types: bool
+) -> Tuple[List[Dict[str, Any]], AnalysisReport]:
+    findings: List[Finding] = []
+    summaries: Dict[str, ConditionSummary] = {}
+    # Canonical condition -> (source of its first use, rule name)
+    classes: Dict[Tuple, Tuple[str, str]] = {}
+    seen_rules: Dict[Tuple, str] = {}
+    kept: List[Dict[str, Any]] = []
+    representatives: List[Tuple[ConditionSummary, str, str]] = []
+
+    for position, definition in enumerate(definitions):
+        source = definition["condition_code"]
+        summary = summaries.get(source)
+        if summary is None:
+            summary = summaries[source] = summarize_condition(source)
+        name = definition["name"]
+        # Whether the constraints decide how the condition evaluates
+        trusted = assume_types or not summary.may_raise
+
+        if summary.is_unsatisfiable():
+            findings.append(Finding("unsatisfiable", name, position=position, may_raise=not trusted))
+            if trusted:
+                continue
+
+        # Equivalence class: same canonical constraints, or (pairwise) mutual
+        # implication; a condition that can raise only matches its own source
+        key = summary.canonical() if trusted else ("source", source)
+        known = classes.get(key)
+        new_class = known is None
+        if new_class and not summary.is_unsatisfiable():
+            known = (source, name)
+            overlaps = []
+            for other, other_source, other_name in representatives if subsumption else ():
+                forward, backward = summary.implies(other), other.implies(summary)
+                if forward and backward and trusted and (assume_types or not other.may_raise):
+                    known, new_class = (other_source, other_name), False
+                    break
+                if forward:
+                    overlaps.append(Finding("subsumed", name, other_name, position))
+                elif backward:
+                    overlaps.append(Finding("subsumed", other_name, name, position))
+            else:
+                findings.extend(overlaps)
+                representatives.append((summary, source, name))
+            classes[key] = known
+        elif new_class:
+            known = classes[key] = (source, name)
+
+        identity = (known[0],) + _rule_identity(definition)
+        if identity in seen_rules:
+            findings.append(Finding("duplicate", name, seen_rules[identity], position))
+            continue
+        seen_rules[identity] = name
+
+        if not new_class:
+            findings.append(Finding("equivalent", name, known[1], position))
+            if known[0] != source:
+                definition = dict(definition, condition_code=known[0])
+        kept.append(definition)
+
+    report = AnalysisReport(
+        findings,
+        rules_before=len(definitions),
+        rules_after=len(kept),
+        conditions_before=len({definition["condition_code"] for definition in definitions}),
+        conditions_after=len({definition["condition_code"] for definition in kept})
+    )
+    return kept, report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find redundant and unsatisfiable rules")
+    parser.add_argument("rules", help="JSON file with a list of RULE_SCHEMA definitions")
+    parser.add_argument("-o", "--output", help="Write the pruned definitions here")
+    parser.add_argument("--no-subsumption", action="store_true", help="Skip pairwise subsumption checks")
+    parser.add_argument(
+        "--assume-types", action="store_true",
+        help="Also prune conditions that can raise (changes ERROR output for unexpected value types)"
+    )
+    args = parser.parse_args()
+
+    with open(args.rules) as f:
+        definitions = json.load(f)
+    pruned, report = prune_definitions(
+        definitions, subsumption=not args.no_subsumption, assume_types=args.assume_types
+    )
+
+    for finding in report.findings:
+        print(f"   [{finding.kind}] {finding}")
+    print(report.summary())
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(pruned, f, indent=2)
@@ -0,0 +1,73 @@
+"""Make the solution modules importable the way they import each other, and share test rules."""
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import SKEWED, SPARSE, generate_contexts, generate_rule_definitions  # noqa: E402
+from gemini_stub_server import start_stub_server  # noqa: E402
+
+# Conditions and templates that raise for some contexts, plus slices and powers
+EDGE_DEFINITIONS = [
+    {"name": "no default", "condition_code": "ctx.get('quantity') > 20", "action_message": "bulk {quantity}"},
+    {"name": "missing field", "condition_code": "ctx.get('order_total', 0) > 100",
+     "action_message": "{order_total:.2f} for {coupon}"},
+    {"name": "month prefix", "condition_code": "ctx.get('month', '')[:3] == 'Jan'", "action_message": "{month}"},
+    {"name": "squared", "condition_code": "ctx.get('quantity', 0) ** 2 > 400", "action_message": "squared"},
+    {"name": "ratio", "condition_code": "ctx.get('order_total', 0) / ctx.get('quantity', 0) > 20",
+     "action_message": "ratio"},
+    {"name": "shared", "condition_code": "ctx.get('membership_tier') == 'vip' and not ctx.get('is_new_customer')",
+     "action_message": "vip {membership_tier}"},
+    {"name": "shared", "condition_code": "ctx.get('membership_tier') == 'vip' and ctx.get('quantity', 0) > 5",
+     "action_message": "vip {membership_tier}"},
+]
+
+
+def make_definitions(count=300):
+    """Generated rules plus EDGE_DEFINITIONS; some carry a priority and group."""
+    definitions = generate_rule_definitions(count) + [dict(definition) for definition in EDGE_DEFINITIONS]
+    rng = random.Random(3)
+    for definition in definitions:
+        if rng.random() < 0.3:
+            definition["priority"] = rng.randint(0, 5)
+            definition["group"] = rng.choice(["discount", "shipping"])
+    return definitions
+
+
+def make_contexts(count=150):
+    """Uniform, sparse and skewed contexts; every seventh has a value of the wrong type."""
+    contexts = generate_contexts(count) + generate_contexts(count, distribution=SPARSE)
+    contexts += generate_contexts(count, distribution=SKEWED)
+    rng = random.Random(5)
+    for ctx in contexts[::7]:
+        ctx[rng.choice(["quantity", "order_total", "month"])] = rng.choice(["12", None, 0, 7])
+    return contexts
+
+
+@pytest.fixture(scope="session")
+def definitions():
+    return make_definitions()
+
+
+@pytest.fixture(scope="session")
+def contexts():
+    return make_contexts()
+
+
+@pytest.fixture
+def stub():
+    """Start stub servers with the given options; all are shut down afterwards."""
+    servers = []
+
+    def start(**options):
+        server = start_stub_server(**options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
@@ -0,0 +1,115 @@
+"""AsyncQuotaAwareGemini against the stub server: rotation, per-key slots, deadlines, hedging."""
+
+import asyncio
+import time
+
+import pytest
+
+from logic_engine_ai import RULE_SCHEMA, AsyncQuotaAwareGemini, DeadlineExceeded, ResponseCache
+
+KEYS = ["key-a", "key-b"]
+
+
+def _run(server, calls, **options):
+    """Run calls(api) on a fresh client; return (result, stats)."""
+    async def run():
+        async with AsyncQuotaAwareGemini(KEYS, base_url=server.base_url, **options) as api:
+            return await calls(api), api.get_stats()
+    return asyncio.run(run())
+
+
+def test_concurrent_calls_spread_over_key_slots(stub):
+    server = stub(latency=0.1)
+
+    async def calls(api):
+        return await asyncio.gather(*(api.call_structured(f"rule {i}", RULE_SCHEMA) for i in range(8)))
+
+    started = time.monotonic()
+    results, stats = _run(server, calls, max_concurrency_per_key=2)
+    elapsed = time.monotonic() - started
+    assert len(results) == 8 and all(result["name"] for result in results)
+    # Four slots in total: two rounds of 0.1s, and both keys busy
+    assert stats["request_counts"] == [4, 4]
+    assert 0.2 <= elapsed < 0.6
+
+
+def test_rotates_to_next_key_on_429(stub):
+    server = stub(quota=1, window=3600)
+
+    async def calls(api):
+        return [await api.call("first"), await api.call("second")]
+
+    results, stats = _run(server, calls)
+    assert all("candidates" in result for result in results)
+    assert stats["error_counts"] == [1, 0]
+    assert server.stats["throttled"] == 1
+
+
+def test_server_errors_exhaust_every_key(stub):
+    server = stub(error_rate=1.0)
+
+    async def calls(api):
+        with pytest.raises(Exception, match="exhausted"):
+            await api.call("always failing")
+
+    _, stats = _run(server, calls)
+    assert stats["error_counts"] == [1, 1]
+
+
+def test_cache_coalesces_concurrent_calls(stub):
+    server = stub(latency=0.2)
+
+    async def calls(api):
+        return await asyncio.gather(*(api.call("same prompt") for _ in range(4)))
+
+    results, stats = _run(server, calls, cache=ResponseCache(":memory:"))
+    assert all(result == results[0] for result in results)
+    assert server.stats["requests"] == 1
+    assert stats["cache"]["coalesced"] == 3
+
+
+def test_deadline(stub):
+    server = stub(latency=1.0)
+
+    async def calls(api):
+        with pytest.raises(DeadlineExceeded):
+            await api.call("slow", deadline=0.2)
+
+    started = time.monotonic()
+    _, stats = _run(server, calls)
+    assert time.monotonic() - started < 0.9
+    assert stats["deadlines_exceeded"] == 1
+
+
+def test_hedge_beats_slow_key(stub):
+    server = stub(slow_fraction=0.5, slow_latency=0.6, seed=1)
+
+    async def calls(api):
+        return [await api.call_structured(f"rule {i}", RULE_SCHEMA) for i in range(6)]
+
+    started = time.monotonic()
+    results, stats = _run(server, calls, hedge=True, hedge_after=0.05)
+    assert len(results) == 6
+    assert stats["hedging"]["hedged"] > 0
+    assert stats["hedging"]["hedge_wins"] > 0
+    assert time.monotonic() - started < 6 * 0.6
+
+
+def test_deadline_covers_waiting_for_a_worker(stub):
+    server = stub(latency=0.5)
+
+    async def calls(api):
+        # One worker per key, both busy
+        busy = [asyncio.ensure_future(api.call(f"busy {i}")) for i in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(DeadlineExceeded):
+            await api.call("queued", deadline=0.1)
+        waited = time.monotonic() - started
+        return await asyncio.gather(*busy), waited
+
+    started = time.monotonic()
+    (results, waited), stats = _run(server, calls, max_concurrency_per_key=1)
+    assert all("candidates" in result for result in results)
+    assert waited < 0.3
+    assert stats["deadlines_exceeded"] == 1
+    assert stats["request_counts"] == [1, 1]
@@ -0,0 +1,52 @@
+"""evaluate_batch() against evaluate() row by row, for row lists and columnar input."""
+
+import ast
+
+import numpy as np
+
+from benchmark import generate_contexts
+from logic_engine_ai import LogicEngine, condition_fields, context_lookup
+
+
+def test_rows_match_evaluate(definitions, contexts):
+    engine = LogicEngine.from_definitions(definitions)
+    result = engine.evaluate_batch(contexts)
+    assert result.rule_names == [rule.name for rule in engine.rules]
+    assert result.matches.shape == (len(engine.rules), len(contexts))
+    for ctx, actions in zip(contexts, result.actions):
+        assert actions == engine.evaluate(ctx), ctx
+
+
+def test_columns_match_evaluate(definitions):
+    engine = LogicEngine.from_definitions(definitions)
+    rows = generate_contexts(300, seed=3)
+    fields = sorted({field for ctx in rows for field in ctx})
+    # Every generated context has every field, so the columns are complete
+    assert all(len(ctx) == len(fields) for ctx in rows)
+    columns = {field: [ctx[field] for ctx in rows] for field in fields}
+    columns["quantity"] = np.array(columns["quantity"])
+    columns["order_total"] = np.array(columns["order_total"])
+    result = engine.evaluate_batch(columns)
+    for ctx, actions in zip(rows, result.actions):
+        assert actions == engine.evaluate(ctx), ctx
+
+
+def test_matrix_only(definitions, contexts):
+    engine = LogicEngine.from_definitions(definitions)
+    matrix = engine.evaluate_batch(contexts, with_actions=False)
+    full = engine.evaluate_batch(contexts)
+    assert (matrix.matches == full.matches).all()
+    assert matrix.actions == [[] for _ in contexts]
+
+
+def test_context_lookup_forms():
+    parse = lambda source: ast.parse(source, mode="eval").body
+    assert context_lookup(parse("ctx.get('quantity')")) == ("quantity", None, False)
+    lookup = context_lookup(parse("ctx.get('quantity', 0)"))
+    assert lookup.constant_default and lookup.default_value == 0
+    assert not context_lookup(parse("ctx.get('a', ctx.get('b'))")).constant_default
+    assert context_lookup(parse("ctx['month']")) is None
+    assert context_lookup(parse("ctx['month']"), subscripts=True) == ("month", None, True)
+    assert context_lookup(parse("ctx.get(name)")) is None
+    assert context_lookup(parse("other.get('quantity')")) is None
+    assert condition_fields("ctx['month'] == 'May' and ctx.get('quantity', 0) > 1") == {"month", "quantity"}
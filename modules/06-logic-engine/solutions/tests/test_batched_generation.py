@@ -0,0 +1,77 @@
+"""generate_rules_batched: index mapping, splitting on bad responses, failing batches on call errors."""
+
+import json
+
+import pytest
+import requests
+
+from gemini_stub_server import stub_rule
+from logic_engine_ai import DeadlineExceeded, QuotaAwareGemini, generate_rules_batched
+
+DESCRIPTIONS = [f"rule {i}" for i in range(10)]
+
+
+class ScriptedApi:
+    """Answers call_structured with one rule per numbered description, unless fail(descriptions) raises."""
+
+    def __init__(self, fail):
+        self.fail = fail
+        self.batches = []
+
+    def call_structured(self, prompt, schema):
+        lines = [line for line in prompt.splitlines() if line.startswith("[")]
+        self.batches.append(len(lines))
+        self.fail([line.split("] ", 1)[1] for line in lines])
+        return [{"index": n, **stub_rule(n)} for n in range(len(lines))]
+
+
+def test_batches_share_requests(stub):
+    server = stub()
+    api = QuotaAwareGemini(["key-a"], base_url=server.base_url)
+    try:
+        results = generate_rules_batched(api, DESCRIPTIONS, max_batch=4)
+    finally:
+        api.close()
+    assert [result.description for result in results] == DESCRIPTIONS
+    assert all(result.rule is not None for result in results)
+    assert server.stats["requests"] == 3
+
+
+def test_undecodable_responses_split_the_batch():
+    def fail(batch):
+        if len(batch) > 2:
+            json.loads('[{"index": 0, "name": "trunc')
+
+    api = ScriptedApi(fail)
+    results = generate_rules_batched(api, DESCRIPTIONS, max_batch=8)
+    assert all(result.rule is not None for result in results)
+    assert api.batches[:3] == [8, 4, 2]
+
+
+@pytest.mark.parametrize("error", [
+    requests.exceptions.ConnectionError("connection refused"),
+    requests.exceptions.InvalidURL("bad url"),
+    Exception("All 1 API keys exhausted or failed after 3 attempts."),
+    DeadlineExceeded("Call deadline exceeded before any API key answered"),
+])
+def test_call_errors_fail_the_batch_without_splitting(error):
+    def fail(batch):
+        if "rule 0" in batch:
+            raise error
+
+    api = ScriptedApi(fail)
+    results = generate_rules_batched(api, DESCRIPTIONS, max_batch=5)
+    assert api.batches == [5, 5]
+    assert [result.error for result in results[:5]] == [str(error)] * 5
+    assert all(result.rule is not None for result in results[5:])
+
+
+def test_exhausted_keys_are_not_retried_in_pieces(stub):
+    server = stub(error_rate=1.0)
+    api = QuotaAwareGemini(["key-a", "key-b"], base_url=server.base_url)
+    try:
+        results = generate_rules_batched(api, DESCRIPTIONS, max_batch=5)
+    finally:
+        api.close()
+    assert all("exhausted" in result.error for result in results)
+    assert server.stats["requests"] == 2 * api._max_attempts()
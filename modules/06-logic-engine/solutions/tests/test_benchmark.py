@@ -0,0 +1,50 @@
+"""benchmark: workload generators, latency profiles and regression comparison."""
+
+import pytest
+
+from benchmark import (
+    DISTRIBUTIONS, SPARSE, compare_results, generate_contexts, generate_rule_definitions, latency_profile
+)
+from logic_engine_ai import LogicEngine, rule_fields
+
+FIELDS = {"quantity", "order_total", "is_new_customer", "membership_tier", "month", "loyalty_points", "category"}
+
+
+def test_generators_are_reproducible():
+    assert generate_rule_definitions(50) == generate_rule_definitions(50)
+    assert generate_rule_definitions(50) != generate_rule_definitions(50, seed=1)
+    for distribution in DISTRIBUTIONS:
+        assert generate_contexts(50, distribution=distribution) == generate_contexts(50, distribution=distribution)
+
+
+def test_generated_rules_use_the_prompt_fields():
+    engine = LogicEngine.from_definitions(generate_rule_definitions(200))
+    assert set().union(*(rule_fields(rule) for rule in engine.rules)) <= FIELDS
+    assert all(set(ctx) == FIELDS for ctx in generate_contexts(50))
+    assert any(set(ctx) < FIELDS for ctx in generate_contexts(50, distribution=SPARSE))
+
+
+def test_unknown_distribution_is_rejected():
+    with pytest.raises(ValueError, match="Unknown distribution"):
+        generate_contexts(1, distribution="bursty")
+
+
+def test_latency_profile():
+    profile = latency_profile(lambda ctx: None, generate_contexts(100), repeat=2)
+    assert set(profile) == {"p50_us", "p95_us", "p99_us", "contexts_per_sec"}
+    assert 0 <= profile["p50_us"] <= profile["p95_us"] <= profile["p99_us"]
+    assert profile["contexts_per_sec"] > 0
+
+
+def test_compare_results_respects_direction_and_tolerance():
+    def run(**values):
+        return {"metrics": {
+            name: {"value": value, "unit": "", "better": "higher" if name.endswith("per_sec") else "lower"}
+            for name, value in values.items()
+        }}
+
+    baseline = run(a_per_sec=1000, b_us=10, c_us=10, gone_us=5)
+    current = run(a_per_sec=800, b_us=11, c_us=8, new_us=1)
+    regressions = compare_results(baseline, current, tolerance=0.15)
+    assert len(regressions) == 1 and regressions[0].startswith("a_per_sec:")
+    assert compare_results(baseline, current, tolerance=0.25) == []
@@ -0,0 +1,78 @@
+"""ResponseCache TTL and LRU eviction, and QuotaAwareGemini cache hits and coalescing."""
+
+import itertools
+import threading
+from unittest import mock
+
+from logic_engine_ai import RULE_SCHEMA, QuotaAwareGemini, ResponseCache
+
+KEYS = ["key-a", "key-b"]
+
+
+def _clock(times):
+    """Patch the cache's wall clock to return times in order."""
+    return mock.patch("logic_engine_ai.time.time", side_effect=times)
+
+
+def test_expired_entries_are_misses():
+    cache = ResponseCache(":memory:", ttl=10)
+    with _clock([100.0, 105.0, 111.0]):
+        cache.put("key", {"value": 1})
+        assert cache.get("key") == {"value": 1}
+        assert cache.get("key") is None
+    assert cache.get_stats()["entries"] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(":memory:", max_entries=2, ttl=None)
+    with _clock(itertools.count(1.0)):
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+        assert [cache.get(key) for key in "abc"] == [1, None, 3]
+
+
+def test_make_key_depends_on_every_part():
+    key = ResponseCache.make_key("model", "prompt", RULE_SCHEMA)
+    assert key == ResponseCache.make_key("model", "prompt", dict(reversed(RULE_SCHEMA.items())))
+    assert key != ResponseCache.make_key("model", "prompt")
+    assert key != ResponseCache.make_key("other", "prompt", RULE_SCHEMA)
+
+
+def test_cache_answers_repeated_calls(stub):
+    server = stub()
+    api = QuotaAwareGemini(KEYS, base_url=server.base_url, cache=ResponseCache(":memory:"))
+    try:
+        first = api.call_structured("cached prompt", RULE_SCHEMA)
+        second = api.call_structured("cached prompt", RULE_SCHEMA)
+        api.call_structured("other prompt", RULE_SCHEMA)
+    finally:
+        api.close()
+    assert first == second
+    assert server.stats["requests"] == 2
+    assert api.get_stats()["cache"]["hits"] == 1
+
+
+def test_cache_coalesces_concurrent_calls(stub):
+    server = stub(latency=0.2)
+    api = QuotaAwareGemini(KEYS, base_url=server.base_url, cache=ResponseCache(":memory:"))
+    results = []
+    barrier = threading.Barrier(4)
+
+    def caller():
+        barrier.wait()
+        results.append(api.call("same prompt"))
+
+    threads = [threading.Thread(target=caller) for _ in range(4)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        api.close()
+    assert len(results) == 4 and all(result == results[0] for result in results)
+    assert server.stats["requests"] == 1
+    assert api.get_stats()["cache"]["coalesced"] == 3
@@ -0,0 +1,63 @@
+"""GeneratedLogicEngine: equivalence with LogicEngine, lazy regeneration and inlining."""
+
+from codegen_engine import GeneratedLogicEngine
+from logic_engine_ai import LogicEngine, Rule, compile_condition
+
+
+def test_matches_logic_engine(definitions, contexts):
+    reference = LogicEngine.from_definitions(definitions)
+    engine = GeneratedLogicEngine.from_definitions(definitions)
+    for ctx in contexts:
+        assert engine.evaluate(ctx) == reference.evaluate(ctx), ctx
+
+
+def test_matches_logic_engine_after_updates(definitions, contexts):
+    reference = LogicEngine.from_definitions(definitions[:200])
+    engine = GeneratedLogicEngine.from_definitions(definitions[:200])
+    names = sorted({definition["name"] for definition in definitions[:200]})
+    for name in names[::5]:
+        reference.remove_rule(name)
+        engine.remove_rule(name)
+    extra = LogicEngine.from_definitions(definitions[200:])
+    for rule in extra.rules:
+        reference.add_rule(rule)
+        engine.add_rule(rule)
+    for ctx in contexts:
+        assert engine.evaluate(ctx) == reference.evaluate(ctx), ctx
+
+
+def test_generates_once_after_many_single_adds(definitions):
+    engine = GeneratedLogicEngine()
+    for rule in LogicEngine.from_definitions(definitions[:50]).rules:
+        engine.add_rule(rule)
+    assert engine._generated is None
+    engine.evaluate({"quantity": 12})
+    generated = engine._generated
+    assert generated[0] is engine._snapshot
+    engine.evaluate({"quantity": 3})
+    assert engine._generated is generated
+    engine.remove_rule(engine.rules[0].name)
+    assert engine._generated is generated
+    engine.evaluate({"quantity": 3})
+    assert engine._generated is not generated
+
+
+def test_inlines_after_the_compile_cache_evicts():
+    engine = GeneratedLogicEngine.from_definitions([
+        {"name": "big", "condition_code": "ctx.get('quantity', 0) >= 10", "action_message": "big"},
+    ])
+    compile_condition.cache_clear()
+    assert "_c0(ctx)" not in engine.generated_source
+    assert engine.evaluate({"quantity": 12}) == ["big: big"]
+
+
+def test_does_not_inline_a_handwritten_condition():
+    engine = GeneratedLogicEngine()
+    engine.add_rule(Rule(
+        name="lying",
+        condition=lambda ctx: False,
+        action=lambda ctx: "fired",
+        condition_code="ctx.get('quantity', 0) >= 10",
+    ))
+    assert "_c0(ctx)" in engine.generated_source
+    assert engine.evaluate({"quantity": 12}) == []
@@ -0,0 +1,52 @@
+"""CompactLogicEngine against LogicEngine: every strategy, rule changes, and the stored columns."""
+
+import pytest
+
+from compact_rules import CompactLogicEngine
+from logic_engine_ai import STRATEGIES, LogicEngine, rule_from_definition
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_matches_logic_engine(strategy, definitions, contexts):
+    reference = LogicEngine.from_definitions(definitions)
+    engine = CompactLogicEngine.from_definitions(definitions)
+    for ctx in contexts:
+        assert engine.evaluate(ctx, strategy) == reference.evaluate(ctx, strategy), ctx
+
+
+def test_matches_logic_engine_after_updates(definitions, contexts):
+    reference = LogicEngine.from_definitions(definitions[:200])
+    engine = CompactLogicEngine.from_definitions(definitions[:200])
+    names = sorted({definition["name"] for definition in definitions[:200]})
+    for name in names[::5]:
+        reference.remove_rule(name)
+        engine.remove_rule(name)
+    for rule in LogicEngine.from_definitions(definitions[200:]).rules:
+        reference.add_rule(rule)
+        engine.add_rule(rule)
+    for strategy in STRATEGIES:
+        for ctx in contexts[::3]:
+            assert engine.evaluate(ctx, strategy) == reference.evaluate(ctx, strategy), (strategy, ctx)
+
+
+def test_rules_keep_priority_group_and_fields():
+    definition = {
+        "name": "bulk", "condition_code": "ctx.get('quantity', 0) > 10", "action_message": "bulk",
+        "priority": 3, "group": "discount", "fields": ["quantity"],
+    }
+    engine = CompactLogicEngine()
+    engine.add_rule(rule_from_definition(definition))
+    engine.add_definition({**definition, "name": "other", "fields": None})
+    engine.remove_rule("other")
+    engine.store.compact()
+    assert engine.to_definitions() == [definition]
+    rule = engine.rules[0]
+    assert (rule.priority, rule.group, rule.fields) == (3, "discount", frozenset({"quantity"}))
+
+
+def test_unknown_strategy_is_rejected():
+    engine = CompactLogicEngine.from_definitions(
+        [{"name": "a", "condition_code": "True", "action_message": "a"}]
+    )
+    with pytest.raises(ValueError, match="Unknown strategy"):
+        engine.evaluate({}, "random")
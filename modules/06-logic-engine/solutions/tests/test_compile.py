@@ -0,0 +1,67 @@
+"""compile_condition: whitelist validation, the source cache, and eval() equivalence."""
+
+import pytest
+
+from logic_engine_ai import MAX_EXPONENT, MAX_REPEAT, LogicEngine, RuleCompileError, compile_condition
+
+REJECTED = [
+    "__import__('os').system('true')",
+    "(lambda: 1)()",
+    "ctx.__class__",
+    "len(ctx) > 0",
+    "other.get('quantity') > 1",
+    "[x for x in ctx]",
+    "ctx.get('quantity', 0) ** ctx.get('quantity', 0) > 1",
+    f"ctx.get('quantity', 0) ** {MAX_EXPONENT + 1} > 1",
+    "(((9 ** 64) ** 64) ** 64) ** 64 > 0",
+    "'x' * 1000000000 == 'y'",
+    "[0] * 3 == []",
+    f"ctx.get('month', '') * {MAX_REPEAT} * 2 == ''",
+    "ctx.get('month', '') * 2 ** 64 == ''",
+]
+
+ACCEPTED = [
+    "ctx.get('month', '')[:3] == 'Jan'",
+    "ctx.get('quantity', 0) ** 2 > 400",
+    "ctx.get('order_total', 0) * 100 > 5000",
+    "ctx.get('order_total', 0) * 1e9 > 1",
+    "ctx.get('membership_tier', '').lower().startswith('pre')",
+]
+
+
+@pytest.mark.parametrize("source", REJECTED)
+def test_rejects_unsafe_conditions(source):
+    with pytest.raises(RuleCompileError):
+        compile_condition(source)
+
+
+@pytest.mark.parametrize("source", ACCEPTED)
+def test_accepts_safe_conditions(source):
+    assert callable(compile_condition(source).func)
+
+
+def test_identical_sources_share_one_function():
+    assert compile_condition("ctx.get('quantity', 0) > 3") is compile_condition("ctx.get('quantity', 0) > 3")
+
+
+def test_compiled_conditions_match_eval(definitions, contexts):
+    for definition in definitions:
+        source = definition["condition_code"]
+        func = compile_condition(source).func
+        for ctx in contexts[::5]:
+            try:
+                expected = eval(source, {"__builtins__": {}}, {"ctx": ctx})
+            except Exception as e:
+                with pytest.raises(type(e)):
+                    func(ctx)
+            else:
+                assert func(ctx) == expected, (source, ctx)
+
+
+def test_engine_reports_errors_per_rule():
+    engine = LogicEngine.from_definitions([
+        {"name": "fails", "condition_code": "ctx.get('quantity') > 20", "action_message": "bulk"},
+        {"name": "works", "condition_code": "ctx.get('quantity', 0) >= 0", "action_message": "any"},
+    ])
+    assert engine.evaluate({}) == ["fails: ERROR - '>' not supported between instances of 'NoneType' and 'int'",
+                                   "works: any"]
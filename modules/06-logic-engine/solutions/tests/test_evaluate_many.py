@@ -0,0 +1,44 @@
+"""evaluate_many(): rules shipped to worker processes as source, results in input order."""
+
+import pickle
+
+import pytest
+
+from logic_engine_ai import LogicEngine, Rule, rule_from_definition
+from rete_matcher import ReteLogicEngine
+
+
+def test_rules_pickle_as_source_form(definitions, contexts):
+    engine = LogicEngine.from_definitions(definitions)
+    engine.add_rule(rule_from_definition({
+        "name": "declared", "condition_code": "ctx.get('quantity', 0) > 3", "action_message": "declared",
+        "priority": 2, "group": "discount", "fields": ["quantity", "order_total"],
+    }))
+    restored = pickle.loads(pickle.dumps(engine))
+    assert type(restored) is LogicEngine
+    assert restored.to_definitions() == engine.to_definitions()
+    assert restored.rules[-1].fields == frozenset({"quantity", "order_total"})
+    for ctx in contexts[:50]:
+        assert restored.evaluate(ctx) == engine.evaluate(ctx)
+
+
+@pytest.mark.parametrize("engine_class", [LogicEngine, ReteLogicEngine])
+def test_workers_return_results_in_input_order(engine_class, definitions, contexts):
+    engine = engine_class.from_definitions(definitions)
+    expected = [engine.evaluate(ctx) for ctx in contexts]
+    results = engine.evaluate_many((ctx for ctx in contexts), workers=2, chunksize=7)
+    assert list(results) == expected
+
+
+def test_single_worker_runs_in_process(definitions, contexts):
+    engine = LogicEngine.from_definitions(definitions)
+    assert list(engine.evaluate_many(contexts[:20], workers=1)) == [engine.evaluate(ctx) for ctx in contexts[:20]]
+
+
+def test_lambda_rules_are_rejected_before_any_worker_starts():
+    engine = LogicEngine()
+    engine.add_rule(Rule("Hand written", lambda ctx: True, lambda ctx: "yes"))
+    with pytest.raises(ValueError, match="Hand written"):
+        next(engine.evaluate_many([{}], workers=2))
+    with pytest.raises(ValueError):
+        engine.evaluate_many([{}], chunksize=0).__next__()
@@ -0,0 +1,86 @@
+"""evaluate_stream.py: JSONL in, one JSON line of actions (or an error) out."""
+
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from evaluate_stream import evaluate_jsonl
+from logic_engine_ai import LogicEngine
+
+RULES = [
+    {"name": "Bulk", "condition_code": "ctx.get('quantity', 0) >= 10", "action_message": "bulk {quantity}"},
+    {"name": "Strict", "condition_code": "ctx.get('quantity') > 5", "action_message": "strict"},
+]
+
+INPUT = "\n".join([
+    '{"quantity": 12}',
+    "",
+    "not json",
+    "[1, 2]",
+    '{"quantity": 1}',
+    "{}",
+]) + "\n"
+
+
+def _run(text, **options):
+    sink = io.StringIO()
+    stats = evaluate_jsonl(LogicEngine.from_definitions(RULES), io.StringIO(text), sink, **options)
+    return [json.loads(line) for line in sink.getvalue().splitlines()], stats
+
+
+def test_actions_and_error_lines_keep_line_numbers():
+    lines, stats = _run(INPUT)
+    assert [line["line"] for line in lines] == [1, 3, 4, 5, 6]
+    assert lines[0]["actions"] == ["Bulk: bulk 12", "Strict: strict"]
+    assert "Expecting value" in lines[1]["error"]
+    assert lines[2]["error"] == "Expected a JSON object, got list"
+    assert lines[3]["actions"] == []
+    assert lines[4]["actions"] == ["Strict: ERROR - '>' not supported between instances of 'NoneType' and 'int'"]
+    assert stats == {"lines": 5, "errors": 2}
+
+
+def test_skip_empty():
+    lines, _ = _run(INPUT, skip_empty=True)
+    assert [line["line"] for line in lines] == [1, 3, 4, 6]
+
+
+def test_workers_write_the_same_lines():
+    assert _run(INPUT * 40, workers=2, chunksize=3) == _run(INPUT * 40)
+
+
+def test_output_is_written_as_input_arrives():
+    written = []
+
+    class Sink(io.StringIO):
+        def write(self, text):
+            written.append(text)
+            return super().write(text)
+
+    def source():
+        yield '{"quantity": 12}\n'
+        # The first line must be out before the source is read further
+        assert len(written) == 1
+        yield '{"quantity": 20}\n'
+
+    evaluate_jsonl(LogicEngine.from_definitions(RULES), source(), Sink())
+    assert len(written) == 2
+
+
+@pytest.mark.parametrize("workers", ["1", "2"])
+def test_command_line(tmp_path, workers):
+    rules = tmp_path / "rules.json"
+    rules.write_text(json.dumps(RULES))
+    contexts = tmp_path / "contexts.jsonl"
+    contexts.write_text(INPUT)
+    output = tmp_path / "actions.jsonl"
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "evaluate_stream.py")
+    completed = subprocess.run(
+        [sys.executable, script, str(rules), str(contexts), "-o", str(output), "--workers", workers],
+        capture_output=True, text=True, check=True
+    )
+    assert "Evaluated 5 lines (2 parse errors)" in completed.stderr
+    assert [json.loads(line) for line in output.read_text().splitlines()] == _run(INPUT)[0]
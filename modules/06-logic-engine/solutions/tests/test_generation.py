@@ -0,0 +1,48 @@
+"""generate_rules_from_descriptions: per-key concurrency, key spread and per-description errors."""
+
+import time
+
+from logic_engine_ai import QuotaAwareGemini, generate_rules_from_descriptions
+
+KEYS = ["key-a", "key-b"]
+
+
+def test_calls_spread_over_keys_within_the_cap(stub):
+    server = stub(latency=0.1)
+    api = QuotaAwareGemini(KEYS, base_url=server.base_url)
+    started = time.monotonic()
+    try:
+        results = generate_rules_from_descriptions(api, [f"rule {i}" for i in range(8)], max_concurrency_per_key=2)
+    finally:
+        api.close()
+    elapsed = time.monotonic() - started
+    assert [result.description for result in results] == [f"rule {i}" for i in range(8)]
+    assert all(result.rule is not None for result in results)
+    # Four slots in total: two rounds of 0.1s, and both keys busy
+    assert api.get_stats()["request_counts"] == [4, 4]
+    assert 0.2 <= elapsed < 0.6
+
+
+def test_cap_only_lasts_for_the_batch(stub):
+    server = stub(latency=0.05)
+    api = QuotaAwareGemini(KEYS, base_url=server.base_url)
+    try:
+        generate_rules_from_descriptions(api, ["first", "second"], max_concurrency_per_key=1)
+        with api.limit_keys(1):
+            api.call("inside")
+        api.call("after")
+    finally:
+        api.close()
+    assert api.max_concurrency_per_key is None
+    assert api.get_stats()["request_counts"][0] == 3
+
+
+def test_failures_are_reported_per_description(stub):
+    server = stub(error_rate=1.0)
+    api = QuotaAwareGemini(KEYS, base_url=server.base_url)
+    try:
+        results = generate_rules_from_descriptions(api, ["one", "two"])
+    finally:
+        api.close()
+    assert [result.rule for result in results] == [None, None]
+    assert all("exhausted" in result.error for result in results)
@@ -0,0 +1,59 @@
+"""QuotaAwareGemini tail latency controls: hedged requests, adaptive timeouts and call deadlines."""
+
+import time
+
+import pytest
+
+from logic_engine_ai import RULE_SCHEMA, DeadlineExceeded, QuotaAwareGemini
+
+KEYS = ["key-a", "key-b"]
+
+
+def test_hedge_beats_slow_key(stub):
+    server = stub(slow_fraction=0.5, slow_latency=0.6, seed=1)
+    api = QuotaAwareGemini(KEYS, base_url=server.base_url, hedge=True, hedge_after=0.05)
+    started = time.monotonic()
+    try:
+        results = [api.call_structured(f"rule {i}", RULE_SCHEMA) for i in range(6)]
+    finally:
+        api.close()
+    assert len(results) == 6
+    hedging = api.get_stats()["hedging"]
+    assert hedging["hedged"] > 0 and hedging["hedge_wins"] > 0
+    assert time.monotonic() - started < 6 * 0.6
+
+
+def test_single_key_never_hedges(stub):
+    server = stub()
+    api = QuotaAwareGemini(KEYS[:1], base_url=server.base_url, hedge=True, hedge_after=0.0)
+    try:
+        api.call("only key")
+    finally:
+        api.close()
+    assert "hedging" not in api.get_stats()
+    assert server.stats["requests"] == 1
+
+
+def test_adaptive_timeout_follows_recent_latency(stub):
+    server = stub(latency=0.01)
+    api = QuotaAwareGemini(KEYS, base_url=server.base_url, adaptive_timeout=True, min_timeout=0.5)
+    try:
+        assert api._attempt_timeout(None) == api.timeout
+        for i in range(25):
+            api.call(f"warm up {i}")
+        assert api._attempt_timeout(None) == 0.5
+    finally:
+        api.close()
+
+
+def test_deadline_stops_slow_call(stub):
+    server = stub(latency=1.0)
+    api = QuotaAwareGemini(KEYS, base_url=server.base_url)
+    started = time.monotonic()
+    try:
+        with pytest.raises(DeadlineExceeded):
+            api.call("slow", deadline=0.2)
+    finally:
+        api.close()
+    assert time.monotonic() - started < 0.9
+    assert api.get_stats()["deadlines_exceeded"] == 1
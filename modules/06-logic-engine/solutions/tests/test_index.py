@@ -0,0 +1,68 @@
+"""RuleIndex: candidate rules never miss a match, across base/recent layers."""
+
+from logic_engine_ai import LogicEngine, RuleIndex, rule_from_definition
+
+THRESHOLDS = [
+    {"name": f"q {op} 10", "condition_code": f"ctx.get('quantity', 0) {op} 10", "action_message": op}
+    for op in (">", ">=", "<", "<=", "==", "!=")
+] + [
+    {"name": "reversed", "condition_code": "10 <= ctx.get('quantity', 0)", "action_message": "reversed"},
+    {"name": "tier", "condition_code": "ctx.get('membership_tier') in ['vip', 'premium']", "action_message": "tier"},
+    {"name": "new", "condition_code": "ctx.get('is_new_customer') and ctx.get('quantity', 0) > 1",
+     "action_message": "new"},
+    {"name": "opaque", "condition_code": "ctx.get('quantity', 0) * 2 > ctx.get('order_total', 0)",
+     "action_message": "opaque"},
+]
+
+
+def _full_scan(engine, ctx):
+    """evaluate() without the index: every rule, in insertion order."""
+    actions = []
+    for rule in engine.rules:
+        try:
+            if rule.condition(ctx):
+                actions.append(f"{rule.name}: {rule.action(ctx)}")
+        except Exception as e:
+            actions.append(f"{rule.name}: ERROR - {str(e)}")
+    return actions
+
+
+def test_thresholds_at_their_boundaries():
+    engine = LogicEngine.from_definitions(THRESHOLDS)
+    for quantity in (9, 10, 11, 10.0, True, None, "10"):
+        for tier in ("vip", "basic", None):
+            ctx = {"quantity": quantity, "membership_tier": tier, "is_new_customer": True, "order_total": 5}
+            assert engine.evaluate(ctx) == _full_scan(engine, ctx), ctx
+    assert engine.evaluate({}) == _full_scan(engine, {})
+
+
+def test_candidates_cover_every_match(definitions, contexts):
+    engine = LogicEngine.from_definitions(definitions)
+    stats = engine.snapshot().index.get_stats()
+    assert stats["indexed"] > stats["fallback"]
+    for ctx in contexts:
+        assert engine.evaluate(ctx) == _full_scan(engine, ctx), ctx
+
+
+def test_single_updates_across_layer_merges(definitions, contexts):
+    engine = LogicEngine()
+    for definition in definitions:
+        engine.add_rule(rule_from_definition(definition))
+    names = sorted({definition["name"] for definition in definitions})
+    for name in names[::3]:
+        engine.remove_rule(name)
+    kept = [definition for definition in definitions if definition["name"] not in set(names[::3])]
+    rebuilt = LogicEngine.from_definitions(kept)
+    assert [rule.name for rule in engine.rules] == [rule.name for rule in rebuilt.rules]
+    for ctx in contexts:
+        assert engine.evaluate(ctx) == rebuilt.evaluate(ctx) == _full_scan(engine, ctx), ctx
+
+
+def test_copy_leaves_original_unchanged():
+    index = RuleIndex()
+    index.add(rule_from_definition(THRESHOLDS[0]))
+    clone = index.copy()
+    clone.add(rule_from_definition(THRESHOLDS[1]))
+    clone.remove(THRESHOLDS[0]["name"])
+    assert [rule.name for rule in index.rules()] == [THRESHOLDS[0]["name"]]
+    assert [rule.name for rule in clone.rules()] == [THRESHOLDS[1]["name"]]
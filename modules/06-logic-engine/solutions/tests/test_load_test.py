@@ -0,0 +1,71 @@
+"""Stub server and load driver: quotas, injected errors and the LoadReport counters."""
+
+from load_test import run_load
+from logic_engine_ai import QuotaAwareGemini, RULE_SCHEMA
+
+KEYS = ["key-a", "key-b", "key-c"]
+
+
+def test_structured_responses_match_the_rule_schema(stub):
+    server = stub()
+    api = QuotaAwareGemini(KEYS[:1], base_url=server.base_url)
+    try:
+        rule = api.call_structured("Describe a rule", RULE_SCHEMA)
+    finally:
+        api.close()
+    assert set(RULE_SCHEMA["required"]) <= set(rule)
+
+
+def test_report_counts_every_call(stub):
+    server = stub(latency=0.01)
+    api = QuotaAwareGemini(KEYS, base_url=server.base_url)
+    try:
+        report = run_load(api, callers=4, calls_per_caller=6, server=server)
+    finally:
+        api.close()
+    assert report.calls == report.succeeded == 24
+    assert report.failures == {}
+    assert sum(report.key_requests) == 24 and report.wasted_attempts == 0
+    assert report.server["requests"] == 24
+    # Without a per-key cap the client stays on its current key
+    assert report.key_balance == 3.0
+    assert set(report.latency_ms) == {"p50", "p95", "p99", "max"}
+    assert report.as_dict()["rps"] > 0
+
+
+def test_capped_keys_are_balanced(stub):
+    server = stub(latency=0.02)
+    api = QuotaAwareGemini(KEYS, base_url=server.base_url, max_concurrency_per_key=1)
+    try:
+        report = run_load(api, callers=3, calls_per_caller=6, server=server)
+    finally:
+        api.close()
+    assert report.succeeded == 18
+    assert all(count > 0 for count in report.key_requests)
+    assert report.key_balance < 1.5
+    assert report.client_stats["total_requests"] == 18
+
+
+def test_injected_errors_are_wasted_attempts(stub):
+    server = stub(error_rate=0.3, seed=1)
+    api = QuotaAwareGemini(KEYS, base_url=server.base_url)
+    try:
+        report = run_load(api, callers=4, calls_per_caller=10, server=server)
+    finally:
+        api.close()
+    assert report.succeeded + sum(report.failures.values()) == report.calls == 40
+    assert report.wasted_attempts == report.attempts - report.succeeded > 0
+    assert sum(report.key_errors) == server.stats["errors"]
+
+
+def test_quota_throttles_per_key(stub):
+    server = stub(quota=2, window=60.0)
+    api = QuotaAwareGemini(KEYS[:2], base_url=server.base_url)
+    try:
+        report = run_load(api, callers=2, calls_per_caller=3, server=server)
+    finally:
+        api.close()
+    # Two keys with two requests each: four calls fit, the rest are throttled
+    assert report.succeeded == 4
+    assert server.stats["throttled"] > 0
+    assert all(counts["ok"] == 2 for counts in server.key_stats.values())
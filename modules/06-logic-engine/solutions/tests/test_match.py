@@ -0,0 +1,36 @@
+"""MatchResult from LogicEngine.match(): fired positions, lazy rendering and evaluate() equivalence."""
+
+from logic_engine_ai import LogicEngine
+
+DEFINITIONS = [
+    {"name": "bulk", "condition_code": "ctx.get('quantity', 0) > 10", "action_message": "bulk {quantity}"},
+    {"name": "fails", "condition_code": "ctx.get('order_total') > 100", "action_message": "big"},
+    {"name": "never", "condition_code": "False", "action_message": "never"},
+    {"name": "vip", "condition_code": "ctx.get('membership_tier') == 'vip'", "action_message": "vip"},
+]
+
+
+def test_match_reports_fired_positions():
+    engine = LogicEngine.from_definitions(DEFINITIONS)
+    result = engine.match({"quantity": 12, "membership_tier": "vip"})
+    assert list(result.indices) == [0, 1, 3]
+    assert result.names == ["bulk", "fails", "vip"]
+    assert result.mask == 0b1011
+    assert set(result.errors) == {1}
+    assert len(result) == 3 and result
+
+
+def test_actions_are_rendered_once_on_first_read():
+    engine = LogicEngine.from_definitions(DEFINITIONS)
+    result = engine.match({"quantity": 12, "order_total": 5})
+    assert result._actions is None
+    assert result.actions == ["bulk: bulk 12"]
+    assert result.actions is result.actions
+    assert engine.match({}).actions == ["fails: ERROR - '>' not supported between instances of 'NoneType' and 'int'"]
+    assert not engine.match({"order_total": 5})
+
+
+def test_match_agrees_with_evaluate(definitions, contexts):
+    engine = LogicEngine.from_definitions(definitions)
+    for ctx in contexts:
+        assert engine.match(ctx).actions == engine.evaluate(ctx), ctx
@@ -0,0 +1,67 @@
+"""RuleMetrics: counters from instrumented evaluation, match() and sessions, and the exports."""
+
+from codegen_engine import GeneratedLogicEngine
+from logic_engine_ai import FIRE_FIRST, STRATEGIES, LogicEngine, RuleMetrics
+
+DEFINITIONS = [
+    {"name": "bulk", "condition_code": "ctx.get('quantity', 0) > 10", "action_message": "bulk {quantity}"},
+    {"name": "fails", "condition_code": "ctx.get('order_total') > 100", "action_message": "big"},
+    {"name": "always \"on\"", "condition_code": "True", "action_message": "on"},
+]
+
+
+def test_evaluate_counts_evaluations_matches_and_errors():
+    engine = LogicEngine.from_definitions(DEFINITIONS)
+    engine.metrics = RuleMetrics()
+    plain = LogicEngine.from_definitions(DEFINITIONS)
+    for ctx in [{"quantity": 12}, {"quantity": 1, "order_total": 5}]:
+        assert engine.evaluate(ctx) == plain.evaluate(ctx)
+
+    stats = engine.metrics.snapshot()
+    # Only conditions the field index could not rule out are evaluated
+    assert {name: (s["evaluations"], s["matches"], s["errors"]) for name, s in stats.items()} == {
+        "bulk": (1, 1, 0),
+        "fails": (1, 1, 1),
+        "always \"on\"": (2, 2, 0),
+    }
+    assert stats["bulk"]["action_buckets"]["+Inf"] == 1
+    assert [name for name, _ in engine.metrics.slowest(3)] == sorted(stats, key=lambda name: -(
+        stats[name]["condition_seconds"] + stats[name]["action_seconds"]))
+
+
+def test_match_and_sessions_record_conditions_only():
+    engine = LogicEngine(instrument=True)
+    for rule in LogicEngine.from_definitions(DEFINITIONS[:2]).rules:
+        engine.add_rule(rule)
+    engine.match({"quantity": 12}, FIRE_FIRST)
+    session = engine.session({"quantity": 1})
+    session.update(quantity=12)
+    stats = engine.metrics.snapshot()
+    # match() stops at the first match; the session runs both, then only bulk
+    assert stats["bulk"]["evaluations"] == 3
+    assert stats["fails"]["evaluations"] == 1
+    assert stats["bulk"]["action_seconds"] == 0.0
+
+
+def test_prometheus_export_escapes_names():
+    engine = LogicEngine.from_definitions(DEFINITIONS)
+    engine.metrics = RuleMetrics(buckets=[0.001])
+    engine.evaluate({"quantity": 12})
+    text = engine.metrics.to_prometheus()
+    assert 'logic_engine_rule_evaluations_total{rule="bulk"} 1' in text
+    assert 'logic_engine_rule_errors_total{rule="fails"} 1' in text
+    assert 'logic_engine_rule_matches_total{rule="always \\"on\\""} 1' in text
+    assert 'logic_engine_rule_condition_seconds_bucket{rule="bulk",le="+Inf"} 1' in text
+    engine.metrics.reset()
+    assert engine.metrics.snapshot() == {}
+
+
+def test_instrumented_strategies_match_uninstrumented(definitions, contexts):
+    reference = LogicEngine.from_definitions(definitions)
+    for engine_class in (LogicEngine, GeneratedLogicEngine):
+        engine = engine_class.from_definitions(definitions)
+        engine.metrics = RuleMetrics()
+        for strategy in STRATEGIES:
+            for ctx in contexts[:50]:
+                assert engine.evaluate(ctx, strategy) == reference.evaluate(ctx, strategy), (strategy, ctx)
+        assert engine.metrics.snapshot()
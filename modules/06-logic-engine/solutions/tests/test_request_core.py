@@ -0,0 +1,110 @@
+"""Request loop shared by both clients: rotation, exhaustion, closing failed streams, and JSONArrayStream."""
+
+import json
+from unittest import mock
+
+import pytest
+import requests
+
+from logic_engine_ai import RULE_SCHEMA, JSONArrayStream, QuotaAwareGemini
+
+KEYS = ["key-a", "key-b"]
+
+ITEMS = [{"name": "a \"quoted\" [x]", "n": 1}, [1, [2, 3]], "s,}]", 4.5, None, True]
+
+
+def _client(server, **options):
+    return QuotaAwareGemini(KEYS, base_url=server.base_url, **options)
+
+
+def test_rotates_to_next_key_on_429(stub):
+    server = stub(quota=1, window=3600)
+    api = _client(server)
+    try:
+        api.call("first")
+        result = api.call("second")
+    finally:
+        api.close()
+    assert "candidates" in result
+    stats = api.get_stats()
+    assert stats["request_counts"] == [1, 1]
+    assert stats["error_counts"] == [1, 0]
+    assert server.stats["throttled"] == 1
+
+
+def test_server_errors_exhaust_every_key(stub):
+    server = stub(error_rate=1.0)
+    api = _client(server)
+    try:
+        with pytest.raises(Exception, match="exhausted"):
+            api.call_structured("always failing", RULE_SCHEMA)
+    finally:
+        api.close()
+    assert api.get_stats()["error_counts"] == [1, 1]
+    assert server.stats["errors"] == 2
+
+
+def test_failed_stream_attempts_close_their_responses(stub):
+    server = stub(error_rate=1.0)
+    api = _client(server)
+    closed = []
+    close = requests.Response.close
+
+    def record_close(response):
+        closed.append(response.status_code)
+        close(response)
+
+    try:
+        with mock.patch.object(requests.Response, "close", record_close):
+            with pytest.raises(Exception, match="exhausted"):
+                list(api.stream_structured("always failing", {"type": "array", "items": RULE_SCHEMA}))
+    finally:
+        api.close()
+    assert closed == [503, 503]
+
+
+def test_structured_call_returns_rule(stub):
+    server = stub()
+    api = _client(server)
+    try:
+        rule = api.call_structured("Give 10% off bulk orders", RULE_SCHEMA)
+        streamed = list(api.stream_structured("Three rules", {"type": "array", "items": RULE_SCHEMA}))
+    finally:
+        api.close()
+    assert set(rule) == {"name", "condition_code", "action_message"}
+    assert len(streamed) == 3
+
+
+def _parse(chunks):
+    parser = JSONArrayStream()
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return items + parser.close()
+
+
+def test_array_stream_yields_items_for_any_split():
+    text = json.dumps(ITEMS, indent=1)
+    for cut in range(len(text) + 1):
+        assert _parse([text[:cut], text[cut:]]) == ITEMS, cut
+    assert _parse(list(text)) == ITEMS
+
+
+def test_array_stream_yields_each_item_once_complete():
+    parser = JSONArrayStream()
+    assert parser.feed('[{"a": 1}, {"b": ') == [{"a": 1}]
+    assert parser.feed('"}"}, 3') == [{"b": "}"}]
+    assert parser.feed(']') == [3]
+    assert parser.close() == []
+
+
+@pytest.mark.parametrize("value", [{"a": [1, 2]}, "text", 12, None])
+def test_array_stream_returns_other_values_on_close(value):
+    text = json.dumps(value)
+    assert _parse([text[:2], text[2:]]) == [value]
+
+
+@pytest.mark.parametrize("text", ["", "[1, 2", "[1] 2"])
+def test_array_stream_rejects_incomplete_or_trailing_input(text):
+    with pytest.raises(ValueError):
+        _parse([text])
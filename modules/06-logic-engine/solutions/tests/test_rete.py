@@ -0,0 +1,55 @@
+"""ReteLogicEngine against LogicEngine, and sharing of network nodes."""
+
+from logic_engine_ai import STRATEGIES, LogicEngine, Rule, rule_from_definition
+from rete_matcher import ReteLogicEngine
+
+
+def test_matches_logic_engine(definitions, contexts):
+    reference = LogicEngine.from_definitions(definitions)
+    engine = ReteLogicEngine.from_definitions(definitions)
+    for ctx in contexts:
+        assert engine.evaluate(ctx) == reference.evaluate(ctx), ctx
+
+
+def test_strategies_fall_back_to_logic_engine(definitions, contexts):
+    reference = LogicEngine.from_definitions(definitions)
+    engine = ReteLogicEngine.from_definitions(definitions)
+    for strategy in STRATEGIES:
+        for ctx in contexts[:100]:
+            assert engine.evaluate(ctx, strategy) == reference.evaluate(ctx, strategy), (strategy, ctx)
+
+
+def test_matches_logic_engine_after_updates(definitions, contexts):
+    reference = LogicEngine.from_definitions(definitions[:200])
+    engine = ReteLogicEngine.from_definitions(definitions[:200])
+    names = sorted({definition["name"] for definition in definitions[:200]})
+    for name in names[::5]:
+        reference.remove_rule(name)
+        engine.remove_rule(name)
+    for rule in LogicEngine.from_definitions(definitions[200:]).rules:
+        reference.add_rule(rule)
+        engine.add_rule(rule)
+    for ctx in contexts:
+        assert engine.evaluate(ctx) == reference.evaluate(ctx), ctx
+
+
+def test_shared_tests_become_one_node():
+    engine = ReteLogicEngine()
+    for number in range(3):
+        engine.add_rule(rule_from_definition({
+            "name": f"Premium {number}",
+            "condition_code": f"ctx.get('membership_tier') == 'premium' and ctx.get('quantity', 0) > {number}",
+            "action_message": "premium",
+        }))
+    # One shared tier test, three thresholds, three joins
+    assert engine.get_stats() == {"rules": 3, "nodes": 7, "terminals": 3, "opaque_rules": 0}
+
+
+def test_opaque_rules_are_evaluated():
+    engine = ReteLogicEngine()
+    engine.add_rule(rule_from_definition({
+        "name": "Generated", "condition_code": "ctx.get('quantity', 0) > 1", "action_message": "many",
+    }))
+    engine.add_rule(Rule("Hand written", lambda ctx: ctx.get("vip"), lambda ctx: "vip"))
+    assert engine.evaluate({"quantity": 2, "vip": True}) == ["Generated: many", "Hand written: vip"]
+    assert engine.get_stats()["opaque_rules"] == 1
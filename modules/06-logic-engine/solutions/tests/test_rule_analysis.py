@@ -0,0 +1,76 @@
+"""rule_analysis: duplicate, equivalent, subsumed and unsatisfiable rules, and what pruning keeps."""
+
+from logic_engine_ai import LogicEngine
+from rule_analysis import analyze_rules, prune_definitions
+
+VIP = "ctx.get('membership_tier') == 'vip'"
+
+
+def _rule(name, condition, action="done"):
+    return {"name": name, "condition_code": condition, "action_message": action}
+
+
+def _findings(report):
+    return [(finding.kind, finding.rule, finding.other) for finding in report.findings]
+
+
+def test_duplicate_rule_is_dropped():
+    definitions = [_rule("vip", VIP), _rule("vip", "ctx.get('membership_tier') in ['vip']")]
+    pruned, report = prune_definitions(definitions)
+    assert _findings(report) == [("duplicate", "vip", "vip")]
+    assert pruned == definitions[:1]
+
+
+def test_equivalent_condition_shares_the_first_source():
+    definitions = [_rule("vip", VIP), _rule("vip again", "'vip' == ctx.get('membership_tier')", "other")]
+    pruned, report = prune_definitions(definitions)
+    assert _findings(report) == [("equivalent", "vip again", "vip")]
+    assert [definition["condition_code"] for definition in pruned] == [VIP, VIP]
+    assert (report.conditions_before, report.conditions_after) == (2, 1)
+
+
+def test_subsumed_rule_is_flagged_and_kept():
+    definitions = [_rule("vip", VIP), _rule("new vip", f"{VIP} and not ctx.get('is_new_customer')")]
+    pruned, report = prune_definitions(definitions)
+    assert _findings(report) == [("subsumed", "new vip", "vip")]
+    assert pruned == definitions
+
+
+def test_unsatisfiable_rule_that_cannot_raise_is_dropped():
+    definitions = [_rule("never", f"{VIP} and ctx.get('membership_tier') == 'gold'"), _rule("vip", VIP)]
+    pruned, report = prune_definitions(definitions)
+    assert [finding.may_raise for finding in report.by_kind("unsatisfiable")] == [False]
+    assert pruned == definitions[1:]
+
+
+def test_unsatisfiable_rule_that_may_raise_is_kept():
+    definitions = [_rule("never", "ctx.get('quantity', 0) > 50 and ctx.get('quantity', 0) < 10")]
+    pruned, report = prune_definitions(definitions)
+    [finding] = report.by_kind("unsatisfiable")
+    assert finding.may_raise and "can raise" in str(finding)
+    assert pruned == definitions
+    # A string quantity makes the comparison raise, and the ERROR line must stay
+    context = {"quantity": "12"}
+    assert LogicEngine.from_definitions(pruned).evaluate(context)[0].startswith("never: ERROR")
+
+    pruned, report = prune_definitions(definitions, assume_types=True)
+    assert pruned == [] and not report.by_kind("unsatisfiable")[0].may_raise
+
+
+def test_subsumption_can_be_skipped():
+    definitions = [_rule("vip", VIP), _rule("new vip", f"{VIP} and not ctx.get('is_new_customer')")]
+    assert analyze_rules(definitions, subsumption=False).findings == []
+
+
+def test_pruning_only_drops_duplicate_lines(definitions, contexts):
+    duplicated = definitions + [dict(definition) for definition in definitions[:40]]
+    pruned, report = prune_definitions(duplicated)
+    dropped = {finding.position for finding in report.findings if finding.kind in ("duplicate", "unsatisfiable")
+               and not finding.may_raise}
+    assert len(report.by_kind("duplicate")) >= 40
+    original = LogicEngine.from_definitions(duplicated)
+    engine = LogicEngine.from_definitions(pruned)
+    for ctx in contexts:
+        match = original.match(ctx)
+        expected = [line for position, line in zip(match.indices, match.actions) if position not in dropped]
+        assert engine.evaluate(ctx) == expected, ctx
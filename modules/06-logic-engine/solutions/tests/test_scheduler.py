@@ -0,0 +1,76 @@
+"""KeyScheduler on a fake clock: bucket refill, Retry-After blocking and the circuit breaker."""
+
+from logic_engine_ai import KeyScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_request_bucket_refills_over_time():
+    clock = Clock()
+    scheduler = KeyScheduler(1, requests_per_minute=60, clock=clock)
+    assert scheduler.reserve() == (0, 0.0)
+    assert scheduler.reserve() == (0, 1.0)
+    clock.now = 2.0
+    assert scheduler.reserve() == (0, 0.0)
+
+
+def test_token_bucket_limits_large_prompts():
+    clock = Clock()
+    scheduler = KeyScheduler(1, requests_per_minute=6000, tokens_per_minute=600, burst=10, clock=clock)
+    assert scheduler.reserve(tokens=600) == (0, 0.0)
+    assert scheduler.reserve(tokens=60) == (0, 6.0)
+    # The real count replaces the oldest estimate
+    scheduler.record_success(0, used_tokens=300)
+    clock.now = 6.0
+    assert scheduler.reserve(tokens=300) == (0, 0.0)
+
+
+def test_reservations_spread_over_keys():
+    scheduler = KeyScheduler(2, requests_per_minute=60, clock=Clock())
+    assert sorted(scheduler.reserve()[0] for _ in range(2)) == [0, 1]
+
+
+def test_retry_after_blocks_the_key():
+    clock = Clock()
+    scheduler = KeyScheduler(2, requests_per_minute=60, burst=5, clock=clock)
+    scheduler.record_failure(0, retry_after=5.0, throttled=True)
+    assert scheduler.reserve() == (1, 0.0)
+    assert scheduler.get_stats()[0]["blocked_for"] == 5.0
+    assert scheduler.throttled == [1, 0]
+
+
+def test_circuit_opens_and_reopens_after_failed_trial():
+    clock = Clock()
+    scheduler = KeyScheduler(1, requests_per_minute=6000, burst=10, failure_threshold=2, cooldown=10, clock=clock)
+    scheduler.record_failure(0)
+    assert scheduler.get_stats()[0]["circuit"] == "closed"
+    scheduler.record_failure(0)
+    assert scheduler.get_stats()[0]["circuit"] == "open"
+
+    # One trial request after the cooldown; a failure opens the circuit again
+    assert scheduler.reserve() == (0, 10.0)
+    assert scheduler.get_stats()[0]["circuit"] == "half-open"
+    clock.now = 10.0
+    scheduler.record_failure(0)
+    assert scheduler.get_stats()[0]["circuit"] == "open"
+    assert scheduler.get_stats()[0]["blocked_for"] == 10.0
+
+    # A successful trial closes it
+    clock.now = 20.0
+    assert scheduler.reserve() == (0, 0.0)
+    scheduler.record_success(0)
+    assert scheduler.get_stats()[0]["circuit"] == "closed"
+    assert scheduler.reserve() == (0, 0.0)
+
+
+def test_release_returns_the_reservation():
+    scheduler = KeyScheduler(1, requests_per_minute=60, clock=Clock())
+    index, _ = scheduler.reserve()
+    scheduler.release(index)
+    assert scheduler.reserve() == (0, 0.0)
@@ -0,0 +1,57 @@
+"""EvaluationSession: incremental re-evaluation, diffs, and evaluate() equivalence."""
+
+from benchmark import generate_contexts
+from logic_engine_ai import LogicEngine, RuleMetrics, rule_from_definition
+
+DEFINITIONS = [
+    {"name": "bulk", "condition_code": "ctx.get('quantity', 0) > 10", "action_message": "bulk {quantity}"},
+    {"name": "big", "condition_code": "ctx.get('order_total', 0) > 100", "action_message": "big"},
+    {"name": "both", "condition_code": "ctx.get('quantity', 0) > 10 and ctx.get('order_total', 0) > 100",
+     "action_message": "both"},
+]
+
+
+def test_update_reruns_only_dependent_rules():
+    engine = LogicEngine.from_definitions(DEFINITIONS)
+    session = engine.session({"quantity": 5, "order_total": 200})
+    assert session.fired == ["big"]
+
+    diff = session.update(quantity=12)
+    assert (diff.fired, diff.unfired, diff.evaluated) == (["bulk", "both"], [], 2)
+
+    diff = session.update(order_total=50)
+    assert (diff.fired, diff.unfired, diff.evaluated) == ([], ["big", "both"], 2)
+
+    diff = session.update(order_total=50)
+    assert diff.evaluated == 0
+    assert session.actions == engine.evaluate(session.context)
+
+
+def test_removed_field_and_type_change_count_as_changes():
+    engine = LogicEngine.from_definitions(DEFINITIONS)
+    session = engine.session({"quantity": 12})
+    assert session.update(remove=["quantity"]).unfired == ["bulk"]
+    # 1 == 1.0, but the action renders differently
+    session.update(quantity=11)
+    assert session.update(quantity=11.0).evaluated == 2
+    assert session.actions == ["bulk: bulk 11.0"]
+
+
+def test_rule_changes_rebind_the_session():
+    engine = LogicEngine.from_definitions(DEFINITIONS)
+    session = engine.session({"quantity": 12})
+    engine.remove_rule("bulk")
+    engine.add_rule(rule_from_definition(
+        {"name": "any", "condition_code": "ctx.get('quantity', 0) > 0", "action_message": "any"}
+    ))
+    diff = session.update()
+    assert (diff.fired, diff.unfired, diff.evaluated) == (["any"], ["bulk"], 3)
+
+
+def test_session_matches_evaluate(definitions):
+    engine = LogicEngine.from_definitions(definitions)
+    engine.metrics = RuleMetrics()
+    session = engine.session(generate_contexts(1)[0])
+    for ctx in generate_contexts(50, seed=9):
+        session.update(ctx)
+        assert session.actions == engine.evaluate(session.context)
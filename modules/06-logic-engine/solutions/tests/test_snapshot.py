@@ -0,0 +1,45 @@
+"""Binary snapshots: evaluation, round trips through to_definitions()/to_engine(), and bad files."""
+
+import pytest
+
+from engine_snapshot import SnapshotError, load_snapshot, save_snapshot
+from logic_engine_ai import STRATEGIES, LogicEngine
+
+
+@pytest.mark.parametrize("trusted", [False, True])
+def test_snapshot_matches_logic_engine(trusted, definitions, contexts, tmp_path):
+    reference = LogicEngine.from_definitions(definitions)
+    path = str(tmp_path / "rules.snapshot")
+    save_snapshot(reference, path)
+    with load_snapshot(path, trusted=trusted) as snapshot:
+        assert len(snapshot) == len(reference.rules)
+        for ctx in contexts:
+            assert snapshot.evaluate(ctx) == reference.evaluate(ctx), ctx
+        assert snapshot.to_definitions() == reference.to_definitions()
+
+
+def test_to_engine_keeps_every_column(definitions, contexts, tmp_path):
+    definitions = definitions + [{
+        "name": "declared", "condition_code": "ctx.get('quantity', 0) > 3", "action_message": "declared",
+        "priority": 2, "group": "discount", "fields": ["quantity", "order_total"],
+    }]
+    reference = LogicEngine.from_definitions(definitions)
+    path = str(tmp_path / "rules.snapshot")
+    save_snapshot(reference, path)
+    with load_snapshot(path) as snapshot:
+        engine = snapshot.to_engine()
+    assert engine.to_definitions() == reference.to_definitions()
+    assert engine.rules[-1].fields == frozenset({"quantity", "order_total"})
+    for strategy in STRATEGIES:
+        for ctx in contexts[::3]:
+            assert engine.evaluate(ctx, strategy) == reference.evaluate(ctx, strategy), (strategy, ctx)
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "rules.snapshot"
+    path.write_bytes(b"not a snapshot at all, just some bytes")
+    with pytest.raises(SnapshotError, match="not an engine snapshot"):
+        load_snapshot(str(path))
+    path.write_bytes(b"LGES")
+    with pytest.raises(SnapshotError, match="too short"):
+        load_snapshot(str(path))
@@ -0,0 +1,54 @@
+"""Firing strategies: salience order, short-circuiting, groups, and match()/evaluate() agreement."""
+
+import pytest
+
+from codegen_engine import GeneratedLogicEngine
+from logic_engine_ai import FIRE_ALL, FIRE_BEST_PER_GROUP, FIRE_FIRST, STRATEGIES, LogicEngine
+
+DEFINITIONS = [
+    {"name": "small", "condition_code": "ctx.get('quantity', 0) > 1", "action_message": "small",
+     "group": "discount"},
+    {"name": "large", "condition_code": "ctx.get('quantity', 0) > 10", "action_message": "large",
+     "priority": 5, "group": "discount"},
+    {"name": "fails", "condition_code": "ctx.get('order_total') > 100", "action_message": "big",
+     "priority": 9, "group": "shipping"},
+    {"name": "free shipping", "condition_code": "ctx.get('quantity', 0) > 5", "action_message": "free",
+     "priority": 1, "group": "shipping"},
+    {"name": "loyal", "condition_code": "ctx.get('quantity', 0) > 0", "action_message": "thanks"},
+]
+
+
+def test_fire_all_keeps_insertion_order():
+    engine = LogicEngine.from_definitions(DEFINITIONS)
+    assert engine.match({"quantity": 12}, FIRE_ALL).names == ["small", "large", "fails", "free shipping", "loyal"]
+
+
+def test_fire_first_stops_at_highest_priority_match():
+    engine = LogicEngine.from_definitions(DEFINITIONS)
+    # The raising rule is reported but does not win
+    assert engine.match({"quantity": 12}, FIRE_FIRST).names == ["fails", "large"]
+    assert engine.match({"quantity": 3, "order_total": 5}, FIRE_FIRST).names == ["small"]
+
+
+def test_best_per_group_picks_one_rule_per_group():
+    engine = LogicEngine.from_definitions(DEFINITIONS)
+    result = engine.match({"quantity": 12, "order_total": 5}, FIRE_BEST_PER_GROUP)
+    assert result.names == ["large", "free shipping", "loyal"]
+    assert engine.evaluate({"quantity": 12, "order_total": 5}, FIRE_BEST_PER_GROUP) == result.actions
+
+
+def test_unknown_strategy_is_rejected():
+    engine = LogicEngine.from_definitions(DEFINITIONS)
+    with pytest.raises(ValueError, match="Unknown strategy"):
+        engine.evaluate({}, "random")
+
+
+@pytest.mark.parametrize("engine_class", [LogicEngine, GeneratedLogicEngine])
+def test_strategies_match_logic_engine(engine_class, definitions, contexts):
+    reference = LogicEngine.from_definitions(definitions)
+    engine = engine_class.from_definitions(definitions)
+    for strategy in STRATEGIES:
+        for ctx in contexts[:100]:
+            expected = reference.evaluate(ctx, strategy)
+            assert engine.evaluate(ctx, strategy) == expected, (strategy, ctx)
+            assert engine.match(ctx, strategy).actions == expected, (strategy, ctx)
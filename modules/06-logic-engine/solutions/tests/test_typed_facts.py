@@ -0,0 +1,122 @@
+"""TypedLogicEngine against LogicEngine, including missing fields and explicit None."""
+
+import random
+
+import pytest
+
+from benchmark import SPARSE, generate_contexts, generate_rule_definitions
+from conftest import EDGE_DEFINITIONS as SHARED_EDGE_DEFINITIONS
+from logic_engine_ai import LogicEngine
+from typed_facts import MISSING, RULE_CONTEXT_SCHEMA, FactTypeError, TypedLogicEngine, compile_typed_condition
+
+SCHEMA = RULE_CONTEXT_SCHEMA
+
+EDGE_DEFINITIONS = [
+    {"name": "subscript", "condition_code": "ctx['month'] == 'January'", "action_message": "January"},
+    {"name": "subscript guard", "condition_code": "ctx['membership_tier'] and ctx.get('quantity', 0) > 3",
+     "action_message": "{membership_tier} x{quantity}"},
+    {"name": "default", "condition_code": "ctx.get('quantity', 0) > 5", "action_message": "{quantity:>4d} items"},
+    {"name": "none check", "condition_code": "ctx.get('month') is None", "action_message": "no month {month}"},
+    {"name": "default string", "condition_code": "ctx.get('category', 'none') == 'none'",
+     "action_message": "category {category!r}"},
+    {"name": "guarded", "condition_code": "ctx.get('order_total') is not None and ctx.get('order_total') > 100",
+     "action_message": "{order_total:.2f}"},
+    {"name": "no default", "condition_code": "ctx.get('quantity') >= 10", "action_message": "bulk"},
+    {"name": "no default method", "condition_code": "ctx.get('month').startswith('J')", "action_message": "J"},
+]
+
+
+def _contexts(count, seed=11):
+    """Contexts whose fields are present, missing or an explicit None."""
+    rng = random.Random(seed)
+    contexts = []
+    for ctx in generate_contexts(count, seed=seed):
+        for name in list(ctx):
+            roll = rng.random()
+            if roll < 0.25:
+                del ctx[name]
+            elif roll < 0.4:
+                ctx[name] = None
+        contexts.append(ctx)
+    return contexts
+
+
+def _engines(definitions):
+    return LogicEngine.from_definitions(definitions), TypedLogicEngine.from_definitions(SCHEMA, definitions)
+
+
+def test_matches_logic_engine_with_missing_and_none_fields():
+    plain, typed = _engines(EDGE_DEFINITIONS)
+    for ctx in _contexts(400):
+        assert typed.evaluate(SCHEMA.record(ctx)) == plain.evaluate(ctx), ctx
+
+
+def test_matches_logic_engine_on_generated_rules():
+    definitions = generate_rule_definitions(300) + EDGE_DEFINITIONS
+    plain, typed = _engines(definitions)
+    for ctx in generate_contexts(200, distribution=SPARSE) + _contexts(200, seed=5):
+        assert typed.evaluate(ctx) == plain.evaluate(ctx), ctx
+
+
+def test_missing_subscript_raises_key_error():
+    condition = compile_typed_condition("ctx['month'] == 'May'", SCHEMA)
+    with pytest.raises(KeyError, match="month"):
+        condition(SCHEMA.record({}))
+    assert condition(SCHEMA.record({"month": None})) is False
+
+
+def test_record_keeps_none_apart_from_missing():
+    fact = SCHEMA.record({"quantity": None})
+    assert fact[SCHEMA.slot("quantity")] is None
+    assert fact[SCHEMA.slot("month")] is MISSING
+    assert SCHEMA.to_dict(fact) == {"quantity": None}
+
+
+def test_required_field_rejects_none():
+    schema = type(SCHEMA).from_field_list("- quantity (int): Items", required=["quantity"])
+    with pytest.raises(FactTypeError):
+        schema.record({"quantity": None})
+    with pytest.raises(FactTypeError):
+        schema.record({})
+
+
+def test_matches_logic_engine_on_shared_edge_rules():
+    # The shared "missing field" rule uses a field outside the schema
+    definitions = generate_rule_definitions(300) + SHARED_EDGE_DEFINITIONS[:1] + SHARED_EDGE_DEFINITIONS[2:]
+    plain, typed = _engines(definitions)
+    for ctx in generate_contexts(150) + generate_contexts(150, distribution=SPARSE):
+        assert typed.evaluate(SCHEMA.record(ctx)) == plain.evaluate(ctx), ctx
+
+
+@pytest.mark.parametrize("condition_code", [
+    "ctx.get('quantity') > 'ten'",
+    "ctx.get('month') >= 3",
+    "ctx.get('quantity').startswith('1')",
+    "ctx.get('membership_tier') * 1.5 > 2",
+    "ctx.get('order_total') == 'big'",
+])
+def test_type_errors_are_rejected(condition_code):
+    with pytest.raises(FactTypeError):
+        compile_typed_condition(condition_code, SCHEMA)
+
+
+def test_remove_rule_matches_logic_engine():
+    definitions = generate_rule_definitions(200) + EDGE_DEFINITIONS
+    plain, typed = _engines(definitions)
+    names = sorted({definition["name"] for definition in definitions})
+    contexts = _contexts(100, seed=3)
+    # A few removals keep tombstones; removing most of the rules compacts
+    for removed in (names[:10], names[10:150]):
+        for name in removed:
+            plain.remove_rule(name)
+            typed.remove_rule(name)
+        assert len(typed) == len(plain.rules)
+        assert typed.to_definitions() == plain.to_definitions()
+        for ctx in contexts:
+            assert typed.evaluate(ctx) == plain.evaluate(ctx), ctx
+    assert len(typed._rules) < len(definitions)  # compacted along the way
+    typed.add_definition(definitions[0])
+    plain.add_rule(LogicEngine.from_definitions(definitions[:1]).rules[0])
+    assert typed.to_definitions() == plain.to_definitions()
+    for ctx in contexts:
+        assert typed.evaluate(ctx) == plain.evaluate(ctx), ctx
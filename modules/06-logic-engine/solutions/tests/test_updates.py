@@ -0,0 +1,89 @@
+"""LogicEngine rule updates: copy-on-write snapshots, atomic update() blocks and concurrent readers."""
+
+import threading
+
+import pytest
+
+from logic_engine_ai import LogicEngine, Rule, rule_from_definition
+
+
+def _rule(name, condition="ctx.get('quantity', 0) > 1", message="fired"):
+    return rule_from_definition({"name": name, "condition_code": condition, "action_message": message})
+
+
+def test_rules_is_a_copy():
+    engine = LogicEngine()
+    engine.add_rule(_rule("a"))
+    rules = engine.rules
+    assert isinstance(rules, list) and isinstance(rules[0], Rule)
+    rules.clear()
+    assert [rule.name for rule in engine.rules] == ["a"]
+
+
+def test_update_publishes_once_or_not_at_all():
+    engine = LogicEngine()
+    with engine.update():
+        engine.add_rule(_rule("a"))
+        with engine.update():
+            engine.add_rule(_rule("b"))
+        assert engine.rules == []
+    assert engine.version == 1
+    assert [rule.name for rule in engine.rules] == ["a", "b"]
+
+    with pytest.raises(RuntimeError):
+        with engine.update():
+            engine.remove_rule("a")
+            raise RuntimeError("abort")
+    assert engine.version == 1
+    assert [rule.name for rule in engine.rules] == ["a", "b"]
+
+
+def test_remove_rule_drops_every_rule_with_the_name():
+    engine = LogicEngine()
+    for name in ["a", "b", "a"]:
+        engine.add_rule(_rule(name))
+    engine.remove_rule("a")
+    engine.remove_rule("missing")
+    assert [rule.name for rule in engine.rules] == ["b"]
+
+
+def test_single_updates_match_a_fresh_engine(definitions, contexts):
+    engine = LogicEngine()
+    for definition in definitions:
+        engine.add_rule(rule_from_definition(definition))
+    names = sorted({definition["name"] for definition in definitions})[::3]
+    for name in names:
+        engine.remove_rule(name)
+    expected = LogicEngine.from_definitions(
+        definition for definition in definitions if definition["name"] not in names
+    )
+    assert engine.to_definitions() == expected.to_definitions()
+    for ctx in contexts[::3]:
+        assert engine.evaluate(ctx) == expected.evaluate(ctx), ctx
+
+
+def test_readers_never_see_half_an_update():
+    engine = LogicEngine.from_definitions(
+        {"name": f"base {i}", "condition_code": "True", "action_message": "base"} for i in range(50)
+    )
+    stop = threading.Event()
+    seen = set()
+
+    def writer():
+        while not stop.is_set():
+            with engine.update():
+                engine.add_rule(_rule("x", "True"))
+                engine.add_rule(_rule("y", "True"))
+            with engine.update():
+                engine.remove_rule("x")
+                engine.remove_rule("y")
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(2000):
+            seen.add(len(engine.evaluate({})))
+    finally:
+        stop.set()
+        thread.join()
+    assert seen <= {50, 52}
@@ -0,0 +1,675 @@
+"""
+Module 06 - Typed Fact Schemas
+==============================
+
+LogicEngine contexts are free-form dicts: every condition pays for
+ctx.get('field') string-hash lookups, every matched template reads the
+dict again, and a rule comparing the wrong types only shows up as an
+"ERROR - ..." entry on each evaluation that reaches it.
+
+With a declared FactSchema (field names and types, e.g. the
+RULE_CONTEXT_FIELDS list the generation prompts use), rules are compiled
+once against a fixed layout:
+
+- A fact is a plain tuple with one slot per schema field, built and
+  type-checked once by schema.record(context). A field missing from the
+  context holds MISSING, so an explicit None stays None
+- ctx.get('field'[, default]) becomes
+  `ctx[slot] if ctx[slot] is not MISSING else default` (plain ctx[slot] for
+  required fields), and ctx['field'] raises KeyError('field') when the
+  field is missing, as the dict lookup does
+- Templates read slots directly instead of looking fields up in a dict
+- Conditions are type-checked at compile time: unknown fields, comparing
+  str with numbers, arithmetic or string methods on values of the wrong
+  type and format specs that don't fit the field's type raise
+  FactTypeError when the rule is added
+
+Types are checked for the values a field holds when present. A missing
+optional field reads as None, exactly as in LogicEngine, so
+`ctx.get('quantity') >= 10` - the shape generated rules use - is accepted,
+and on a fact without quantity it gives the same "ERROR - ..." entry
+LogicEngine does. An explicit None in an optional field is allowed by
+record() and behaves the same way (ctx.get('quantity', 0) returns None,
+not 0). Declare a field required to rule both out.
+
+TypedLogicEngine.evaluate() returns what LogicEngine.evaluate() returns
+(the default all-matches strategy) for the same rules and context,
+including the errors of missing ctx['field'] lookups. Like
+CompactLogicEngine it evaluates each distinct condition and template at
+most once per fact, marks removed rules instead of rebuilding its plans,
+and is not thread-safe: build it, then evaluate.
+
+Usage:
+    from typed_facts import RULE_CONTEXT_SCHEMA, TypedLogicEngine
+    engine = TypedLogicEngine.from_definitions(RULE_CONTEXT_SCHEMA, definitions)
+    fact = RULE_CONTEXT_SCHEMA.record({"quantity": 12, "order_total": 99.5})
+    engine.evaluate(fact)
+"""
+
+import re
+import ast
+import string
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List, Dict, Any, Callable, Optional, FrozenSet, Iterable, Mapping, Tuple
+
+from logic_engine_ai import (
+    RULE_CONTEXT_FIELDS, Rule, RuleCompileError, compile_condition, context_lookup, evaluate_memoized
+)
+
+Fact = Tuple[Any, ...]
+
+_TYPE_NAMES = {"int": int, "float": float, "bool": bool, "str": str}
+_NONE = type(None)
+_NUMERIC = frozenset({bool, int, float})
+_CONTAINERS = frozenset({list, tuple, set})
+_CONVERSIONS = {None: None, "s": str, "r": repr, "a": ascii}
+# A value of each field type, for checking format specs at compile time
+_SAMPLES = {int: 0, float: 0.0, bool: False, str: ""}
+
+# "- quantity (int): Number of items"
+_FIELD_LINE = re.compile(r"^\s*-\s*(\w+)\s*\((\w+)\)", re.MULTILINE)
+
+
+class FactTypeError(RuleCompileError):
+    """Raised when a rule or a fact does not fit its FactSchema."""
+
+
+class _Absent:
+    """Type-checker type of ctx.get() on a missing optional field (None at run time)."""
+
+
+class _Missing:
+    """Slot value of a field the context did not have."""
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+    def __reduce__(self):
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+def _present(value: Any, name: str) -> Any:
+    """ctx['field'] on a fact: the slot value, or KeyError like the dict lookup."""
+    if value is MISSING:
+        raise KeyError(name)
+    return value
+
+
+# Names compiled conditions use to read optional fields
+_GLOBALS = {"__builtins__": {}, "_MISSING": MISSING, "_present": _present}
+
+
+@dataclass(frozen=True)
+class FactSchema:
+    """Field names, their types and slots (in declaration order)"""
+    fields: Tuple[Tuple[str, type], ...]
+    required: FrozenSet[str] = frozenset()
+    # Drop context keys outside the schema instead of rejecting the fact
+    ignore_unknown: bool = False
+    slots: Dict[str, int] = field(init=False, repr=False, compare=False, hash=False)
+
+    def __post_init__(self):
+        slots = {}
+        for name, kind in self.fields:
+            if kind not in _SAMPLES:
+                raise FactTypeError(f"Field '{name}' has unsupported type {kind!r}; use int, float, bool or str")
+            if name in slots:
+                raise FactTypeError(f"Field '{name}' is declared twice")
+            slots[name] = len(slots)
+        unknown = set(self.required) - slots.keys()
+        if unknown:
+            raise FactTypeError(f"Required fields not in the schema: {', '.join(sorted(unknown))}")
+        object.__setattr__(self, "required", frozenset(self.required))
+        object.__setattr__(self, "slots", slots)
+
+    @classmethod
+    def from_field_list(cls, text: str, required: Iterable[str] = (), ignore_unknown: bool = False) -> "FactSchema":
+        """Parse a "- name (type): description" list such as RULE_CONTEXT_FIELDS."""
+        fields = []
+        for name, type_name in _FIELD_LINE.findall(text):
+            if type_name not in _TYPE_NAMES:
+                raise FactTypeError(f"Field '{name}' has unsupported type '{type_name}'")
+            fields.append((name, _TYPE_NAMES[type_name]))
+        if not fields:
+            raise FactTypeError("No '- name (type)' field lines found")
+        return cls(tuple(fields), frozenset(required), ignore_unknown)
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        return tuple(name for name, _ in self.fields)
+
+    def slot(self, name: str) -> int:
+        """Slot of a field."""
+        try:
+            return self.slots[name]
+        except KeyError:
+            raise FactTypeError(f"Unknown field '{name}'; the schema has {', '.join(self.names)}") from None
+
+    def type_of(self, name: str) -> type:
+        return self.fields[self.slot(name)][1]
+
+    def record(self, context: Mapping[str, Any]) -> Fact:
+        """
+        Build the fact tuple for a context dict, checking every value once.
+
+        Raises:
+            FactTypeError: On a value of the wrong type, a missing (or None)
+                required field, or (unless ignore_unknown) a field outside
+                the schema
+        """
+        values: List[Any] = [MISSING] * len(self.fields)
+        for name, value in context.items():
+            slot = self.slots.get(name)
+            if slot is None:
+                if self.ignore_unknown:
+                    continue
+                self.slot(name)
+            if value is not None and not _conforms(value, self.fields[slot][1]):
+                raise FactTypeError(
+                    f"Field '{name}' expects {self.fields[slot][1].__name__}, got {type(value).__name__}: {value!r}"
+                )
+            values[slot] = value
+        for name in self.required:
+            if values[self.slots[name]] is None or values[self.slots[name]] is MISSING:
+                raise FactTypeError(f"Required field '{name}' is missing")
+        return tuple(values)
+
+    def to_dict(self, fact: Fact) -> Dict[str, Any]:
+        """The context dict a fact was built from (missing fields left out)."""
+        return {name: value for (name, _), value in zip(self.fields, fact) if value is not MISSING}
+
+
+def _conforms(value: Any, kind: type) -> bool:
+    """Whether value fits a field type (bool is not an int; an int is a float)."""
+    if kind is float:
+        return value.__class__ in (int, float)
+    return value.__class__ is kind
+
+
+# The fields the rule generation prompts describe, all optional
+RULE_CONTEXT_SCHEMA = FactSchema.from_field_list(RULE_CONTEXT_FIELDS)
+
+
+# ============================================
+# TYPE CHECKING
+# Infer the possible types of each sub-expression over the schema
+# ============================================
+
+def _describe(types: FrozenSet[type]) -> str:
+    names = sorted({"None" if t in (_NONE, _Absent) else t.__name__ for t in types})
+    return " or ".join(names)
+
+
+def _when_present(types: FrozenSet[type]) -> FrozenSet[type]:
+    """Types a value can have once missing fields are set aside (they fail at run time, as in LogicEngine)."""
+    return types - {_Absent}
+
+
+def _family(kind: type) -> str:
+    """Values of the same family can be equal."""
+    if kind is _Absent:
+        return "NoneType"
+    if kind in _NUMERIC:
+        return "number"
+    if kind in _CONTAINERS:
+        return "container"
+    return kind.__name__
+
+
+def _arithmetic(op: ast.operator, left: type, right: type) -> Optional[type]:
+    """Result type of left <op> right, or None if Python would raise."""
+    if left in _NUMERIC and right in _NUMERIC:
+        if isinstance(op, ast.Div) or float in (left, right):
+            return float
+        return int
+    if left is str and right is str and isinstance(op, ast.Add):
+        return str
+    if isinstance(op, ast.Mult) and {left, right} in ({str, int}, {str, bool}):
+        return str
+    if left is str and isinstance(op, ast.Mod):
+        return str
+    return None
+
+
+class _TypeChecker:
+    """Checks a validated condition against a schema; raises FactTypeError"""
+
+    def __init__(self, schema: FactSchema, source: str):
+        self.schema = schema
+        self.source = source
+
+    def fail(self, message: str):
+        raise FactTypeError(f"{message} in condition: {self.source}")
+
+    def known_field(self, name: str):
+        if name not in self.schema.slots:
+            self.fail(f"Unknown field '{name}' (the schema has {', '.join(self.schema.names)})")
+
+    def lookup(self, node: ast.expr) -> Optional[Tuple[str, Optional[ast.expr]]]:
+        """(field, default expression or None) for ctx.get(...) / ctx[...]; None for anything else."""
+        lookup = context_lookup(node, subscripts=True)
+        if lookup is not None:
+            self.known_field(lookup.field)
+            return lookup.field, lookup.default
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == "ctx":
+            self.fail("Field names must be string constants")
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and isinstance(node.func.value, ast.Name)
+            and node.func.value.id == "ctx"
+        ):
+            if node.func.attr != "get" or node.keywords or not 1 <= len(node.args) <= 2:
+                self.fail("ctx only supports ctx.get('field'[, default])")
+            self.fail("Field names must be string constants")
+        return None
+
+    def guards(self, node: ast.expr) -> FrozenSet[str]:
+        """Fields known to be present (and not None) wherever node is truthy."""
+        lookup = self.lookup(node)
+        if lookup is not None:
+            return frozenset() if lookup[1] is not None else frozenset({lookup[0]})
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and isinstance(node.ops[0], (ast.IsNot, ast.NotEq)):
+            right = node.comparators[0]
+            lookup = self.lookup(node.left)
+            if lookup is not None and isinstance(right, ast.Constant) and right.value is None:
+                return frozenset({lookup[0]})
+        if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+            return frozenset().union(*(self.guards(value) for value in node.values))
+        return frozenset()
+
+    def check(self, node: ast.expr, known: FrozenSet[str] = frozenset()) -> FrozenSet[type]:
+        """Possible types of node's value (_Absent: a missing field); known fields are present here."""
+        lookup = self.lookup(node)
+        if lookup is not None:
+            name, default = lookup
+            declared = frozenset({self.schema.type_of(name)})
+            if name in self.schema.required or name in known or isinstance(node, ast.Subscript):
+                # ctx['field'] raises KeyError rather than yield a missing field
+                return declared
+            if default is None or (isinstance(default, ast.Constant) and default.value is None):
+                return declared | {_Absent}
+            return declared | self.check(default, known)
+
+        if isinstance(node, ast.Name):
+            self.fail("ctx can only be used as ctx.get('field') or ctx['field']")
+        if isinstance(node, ast.Constant):
+            return frozenset({type(node.value)})
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            for element in node.elts:
+                self.check(element, known)
+            return frozenset({{ast.List: list, ast.Tuple: tuple, ast.Set: set}[type(node)]})
+
+        if isinstance(node, ast.BoolOp):
+            types: FrozenSet[type] = frozenset()
+            for value in node.values:
+                types |= self.check(value, known)
+                if isinstance(node.op, ast.And):
+                    known |= self.guards(value)
+            return types
+
+        if isinstance(node, ast.IfExp):
+            self.check(node.test, known)
+            return self.check(node.body, known | self.guards(node.test)) | self.check(node.orelse, known)
+
+        if isinstance(node, ast.UnaryOp):
+            operand = self.check(node.operand, known)
+            if isinstance(node.op, ast.Not):
+                return frozenset({bool})
+            operand = _when_present(operand)
+            if not operand <= _NUMERIC:
+                self.fail(f"Unary {'-' if isinstance(node.op, ast.USub) else '+'} on {_describe(operand)}")
+            return frozenset({float if float in operand else int})
+
+        if isinstance(node, ast.BinOp):
+            left = _when_present(self.check(node.left, known))
+            right = _when_present(self.check(node.right, known))
+            results = set()
+            for l in left:
+                for r in right:
+                    result = _arithmetic(node.op, l, r)
+                    if result is None:
+                        self.fail(f"{type(node.op).__name__} of {_describe(left)} and {_describe(right)}")
+                    results.add(result)
+            if isinstance(node.op, ast.Pow) and int in results and ast.literal_eval(node.right) < 0:
+                # Validation only allows constant exponents; a negative one gives a float
+                results = (results - {int}) | {float}
+            return frozenset(results)
+
+        if isinstance(node, ast.Compare):
+            left = self.check(node.left, known)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self.check(comparator, known)
+                self.compare(op, left, right, comparator)
+                left = right
+            return frozenset({bool})
+
+        if isinstance(node, ast.Call):
+            # Validation allows only ctx.get and the string helpers here
+            receiver = _when_present(self.check(node.func.value, known))
+            method = node.func.attr
+            if receiver != {str}:
+                self.fail(f".{method}() on {_describe(receiver)}")
+            for arg in node.args:
+                arg_types = _when_present(self.check(arg, known))
+                if method in ("startswith", "endswith") and isinstance(arg, ast.Tuple):
+                    continue
+                if arg_types != {str}:
+                    self.fail(f".{method}() argument of type {_describe(arg_types)}")
+            return frozenset({bool if method in ("startswith", "endswith") else str})
+
+        if isinstance(node, ast.Subscript):
+            value = _when_present(self.check(node.value, known))
+            if isinstance(node.slice, ast.Slice):
+                bounds = [bound for bound in (node.slice.lower, node.slice.upper, node.slice.step) if bound is not None]
+                index = frozenset().union(*(_when_present(self.check(bound, known)) for bound in bounds))
+                if value != {str} or not index <= {int, bool, _NONE}:
+                    self.fail(f"Slicing {_describe(value)} with {_describe(index)}")
+                return frozenset({str})
+            index = _when_present(self.check(node.slice, known))
+            if value != {str} or not index <= {int, bool}:
+                self.fail(f"Indexing {_describe(value)} with {_describe(index)}")
+            return frozenset({str})
+
+        self.fail(f"Unsupported expression {type(node).__name__}")
+
+    def compare(self, op: ast.cmpop, left: FrozenSet[type], right: FrozenSet[type], comparator: ast.expr):
+        """Check one comparison of left with right."""
+        if isinstance(op, (ast.Is, ast.IsNot)):
+            return
+        if isinstance(op, (ast.Eq, ast.NotEq)):
+            if not {_family(t) for t in left} & {_family(t) for t in right}:
+                self.fail(f"{_describe(left)} is never equal to {_describe(right)}")
+            return
+        if isinstance(op, (ast.In, ast.NotIn)):
+            if isinstance(comparator, (ast.List, ast.Tuple, ast.Set)):
+                elements = frozenset().union(*(self.check(e) for e in comparator.elts)) if comparator.elts else frozenset()
+                if elements and not {_family(t) for t in left} & {_family(t) for t in elements}:
+                    self.fail(f"{_describe(left)} is never in a collection of {_describe(elements)}")
+                return
+            left, right = _when_present(left), _when_present(right)
+            if right == {str} and left == {str}:
+                return
+            self.fail(f"'in' on {_describe(left)} and {_describe(right)}")
+        # Ordering
+        left, right = _when_present(left), _when_present(right)
+        for l in left:
+            for r in right:
+                if not ((l in _NUMERIC and r in _NUMERIC) or (l is str and r is str)):
+                    self.fail(f"Ordering {_describe(left)} against {_describe(right)}")
+
+
+# ============================================
+# SLOT COMPILATION
+# ============================================
+
+class _SlotRewriter(ast.NodeTransformer):
+    """Replace ctx.get('field'[, default]) and ctx['field'] with slot reads (dict semantics)."""
+
+    def __init__(self, checker: _TypeChecker):
+        self.checker = checker
+
+    def _slot(self, slot: int) -> ast.Subscript:
+        return ast.Subscript(value=ast.Name(id="ctx", ctx=ast.Load()), slice=ast.Constant(slot), ctx=ast.Load())
+
+    def _replace(self, node: ast.expr) -> ast.expr:
+        lookup = self.checker.lookup(node)
+        if lookup is None:
+            return self.generic_visit(node)
+        name, default = lookup
+        slot = self.checker.schema.slot(name)
+        if name in self.checker.schema.required:
+            replacement = self._slot(slot)
+        elif isinstance(node, ast.Subscript):
+            replacement = ast.Call(
+                func=ast.Name(id="_present", ctx=ast.Load()),
+                args=[self._slot(slot), ast.Constant(name)],
+                keywords=[]
+            )
+        else:
+            replacement = ast.IfExp(
+                test=ast.Compare(
+                    left=self._slot(slot), ops=[ast.IsNot()], comparators=[ast.Name(id="_MISSING", ctx=ast.Load())]
+                ),
+                body=self._slot(slot),
+                orelse=ast.Constant(None) if default is None else self.visit(default)
+            )
+        return ast.copy_location(replacement, node)
+
+    visit_Call = _replace
+    visit_Subscript = _replace
+
+
+@lru_cache(maxsize=10_000)
+def compile_typed_condition(source: str, schema: FactSchema) -> Callable[[Fact], Any]:
+    """
+    Type-check a condition against schema and compile it to read fact slots.
+
+    Args:
+        source: Python expression using the ctx.get('field') pattern
+        schema: Layout and types of the facts it will be evaluated on
+
+    Returns:
+        Function taking a fact tuple
+
+    Raises:
+        RuleCompileError: If the expression is not an allowed condition
+        FactTypeError: If it does not type-check against schema
+    """
+    tree = compile_condition(source).tree
+    checker = _TypeChecker(schema, source)
+    checker.check(tree.body)
+
+    body = _SlotRewriter(checker).visit(ast.parse(source.strip(), mode="eval").body)
+    wrapper = ast.Expression(body=ast.Lambda(
+        args=ast.arguments(
+            posonlyargs=[], args=[ast.arg(arg="ctx")],
+            kwonlyargs=[], kw_defaults=[], defaults=[]
+        ),
+        body=body
+    ))
+    ast.fix_missing_locations(wrapper)
+    return eval(compile(wrapper, "<typed condition>", "eval"), _GLOBALS)
+
+
+@lru_cache(maxsize=10_000)
+def compile_typed_template(template: str, schema: FactSchema) -> Callable[[Fact], str]:
+    """
+    Compile an action_message template to render from fact slots.
+
+    Renders like compile_template (the template itself when a field is
+    missing). Every placeholder must name a schema field, and its format
+    spec must suit the field's type.
+
+    Raises:
+        FactTypeError: If the template does not fit schema
+    """
+    try:
+        parsed = list(string.Formatter().parse(template))
+    except ValueError as e:
+        raise FactTypeError(f"Invalid template ({e}): {template}") from e
+
+    parts = []
+    for literal, name, spec, conversion in parsed:
+        if name is None:
+            parts.append((literal, None, spec, None))
+            continue
+        if not name.isidentifier() or "{" in spec or conversion not in _CONVERSIONS:
+            raise FactTypeError(f"Template placeholders must be plain field names: {template}")
+        if name not in schema.slots:
+            raise FactTypeError(f"Unknown field '{name}' in template: {template}")
+        slot = schema.slots[name]
+        convert = _CONVERSIONS[conversion]
+        sample = _SAMPLES[schema.fields[slot][1]]
+        try:
+            format(convert(sample) if convert else sample, spec)
+        except ValueError as e:
+            raise FactTypeError(f"Format spec '{spec}' does not fit field '{name}' ({e}): {template}") from e
+        parts.append((literal, slot, spec, convert))
+
+    if all(slot is None for _, slot, _, _ in parts):
+        text = "".join(literal for literal, _, _, _ in parts)
+        return lambda fact: text
+
+    def action(fact: Fact) -> str:
+        out = []
+        for literal, slot, spec, convert in parts:
+            out.append(literal)
+            if slot is None:
+                continue
+            value = fact[slot]
+            if value is MISSING:
+                return template
+            if convert is not None:
+                value = convert(value)
+            out.append(format(value, spec))
+        return "".join(out)
+    return action
+
+
+# ============================================
+# TYPED ENGINE
+# ============================================
+
+@dataclass(frozen=True)
+class TypedRule:
+    """A rule compiled against a FactSchema"""
+    name: str
+    condition: Callable[[Fact], Any]
+    action: Callable[[Fact], str]
+    condition_code: str
+    action_message: str
+    priority: int = 0
+    group: Optional[str] = None
+
+    def to_definition(self) -> Dict[str, Any]:
+        """Return the RULE_SCHEMA form of this rule."""
+        definition = {
+            "name": self.name,
+            "condition_code": self.condition_code,
+            "action_message": self.action_message
+        }
+        if self.priority:
+            definition["priority"] = self.priority
+        if self.group is not None:
+            definition["group"] = self.group
+        return definition
+
+
+class TypedLogicEngine:
+    """LogicEngine-compatible evaluation of schema-checked rules over fact tuples"""
+
+    def __init__(self, schema: FactSchema = RULE_CONTEXT_SCHEMA):
+        self.schema = schema
+        # Distinct conditions and templates, each evaluated at most once per fact
+        self._condition_ids: Dict[str, int] = {}
+        self._conditions: List[Callable[[Fact], Any]] = []
+        self._template_ids: Dict[str, int] = {}
+        self._templates: List[Callable[[Fact], str]] = []
+        # Per position: the rule, its condition and template ids, and whether it is live
+        self._rules: List[TypedRule] = []
+        self._condition_plan: List[int] = []
+        self._template_plan: List[int] = []
+        self._alive = bytearray()
+        self._removed = 0
+        self._by_name: Dict[str, List[int]] = {}  # name -> live positions
+
+    @property
+    def rules(self) -> List[TypedRule]:
+        """Live rules, in insertion order"""
+        if not self._removed:
+            return list(self._rules)
+        return [rule for rule, alive in zip(self._rules, self._alive) if alive]
+
+    def __len__(self) -> int:
+        return len(self._rules) - self._removed
+
+    def add_definition(self, definition: Dict[str, Any]) -> TypedRule:
+        """
+        Type-check and add a rule from its RULE_SCHEMA form.
+
+        Raises:
+            FactTypeError: If the rule does not fit the schema (nothing is added)
+        """
+        rule = TypedRule(
+            name=definition["name"],
+            condition=compile_typed_condition(definition["condition_code"], self.schema),
+            action=compile_typed_template(definition["action_message"], self.schema),
+            condition_code=definition["condition_code"],
+            action_message=definition["action_message"],
+            priority=definition.get("priority", 0),
+            group=definition.get("group")
+        )
+        self._by_name.setdefault(rule.name, []).append(len(self._rules))
+        self._rules.append(rule)
+        self._alive.append(1)
+        self._plan_rule(rule)
+        return rule
+
+    def _plan_rule(self, rule: TypedRule):
+        condition_id = self._condition_ids.get(rule.condition_code)
+        if condition_id is None:
+            condition_id = self._condition_ids[rule.condition_code] = len(self._conditions)
+            self._conditions.append(rule.condition)
+        template_id = self._template_ids.get(rule.action_message)
+        if template_id is None:
+            template_id = self._template_ids[rule.action_message] = len(self._templates)
+            self._templates.append(rule.action)
+        self._condition_plan.append(condition_id)
+        self._template_plan.append(template_id)
+
+    def add_rule(self, rule: Rule) -> TypedRule:
+        """Add a Rule built from a RULE_SCHEMA definition."""
+        return self.add_definition(rule.to_definition())
+
+    def remove_rule(self, name: str):
+        """Remove a rule by name"""
+        for position in self._by_name.pop(name, ()):
+            self._alive[position] = 0
+            self._removed += 1
+
+        # Reclaim space once most of the plan is removed rules
+        if self._removed > len(self._rules) // 2:
+            self._compact()
+
+    def _compact(self):
+        """Drop removed rules from the plan (condition and template tables are kept)."""
+        keep = [position for position, alive in enumerate(self._alive) if alive]
+        self._rules = [self._rules[p] for p in keep]
+        self._condition_plan = [self._condition_plan[p] for p in keep]
+        self._template_plan = [self._template_plan[p] for p in keep]
+        self._alive = bytearray(b"\x01" * len(keep))
+        self._removed = 0
+        self._by_name = {}
+        for position, rule in enumerate(self._rules):
+            self._by_name.setdefault(rule.name, []).append(position)
+
+    def to_definitions(self) -> List[Dict[str, Any]]:
+        """Return all rules in RULE_SCHEMA form."""
+        return [rule.to_definition() for rule in self.rules]
+
+    @classmethod
+    def from_definitions(cls, schema: FactSchema, definitions: Iterable[Dict[str, Any]]) -> "TypedLogicEngine":
+        """Build an engine from RULE_SCHEMA rule definitions (FactTypeError on the first misfit)."""
+        engine = cls(schema)
+        for definition in definitions:
+            engine.add_definition(definition)
+        return engine
+
+    def __reduce__(self):
+        return (self.__class__.from_definitions, (self.schema, self.to_definitions()))
+
+    def evaluate(self, fact: Fact) -> List[str]:
+        """Evaluate all rules against a fact (or a context dict), return actions taken"""
+        if fact.__class__ is not tuple:
+            fact = self.schema.record(fact)
+        rules = self._rules
+        return evaluate_memoized(
+            fact, self._condition_plan, self._template_plan, lambda position: rules[position].name,
+            self._conditions, self._templates, alive=self._alive if self._removed else None
+        )